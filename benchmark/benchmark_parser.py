@@ -0,0 +1,132 @@
+"""
+Microbenchmark of command parsers on typical payloads (room list, game
+update, chat message): CommandParser against FastCommandParser and
+BinaryCommandParser, full parsing against LazyCommandParams for dropped
+command (only code and count of params are got), and decoding and parsing
+of received frame against BytesCommandParser, and making room list
+command from exported models against ExportedModels (cached).
+(Time of make_command includes making params.)
+
+Usage:
+    python benchmark_parser.py [-number 10000] [-repeat 5]
+"""
+try:
+    import napalm
+except ImportError:
+    import os
+    import sys
+    # Link libraries (to launch from command line console)
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+    import napalm
+
+import timeit
+
+from napalm.play.lobby import RoomModel
+from napalm.socket.parser import BinaryCommandParser, BytesCommandParser, CommandParser, ExportedModels, \
+    FastCommandParser, LazyCommandParams
+from napalm.utils.parsing_util import get_command_line_param
+
+PARSER_CLASS_LIST = [CommandParser, FastCommandParser, BinaryCommandParser]
+
+MESSAGE_TEXT = "Hello! How are you? 50% of pot;; not || a problem"
+
+
+# (CommandParser.make_command() changes given list, so new params are made for each call)
+
+def make_room_list_params():
+    return ["11", [[1000 + i, "Room %d" % i, "1_H_10_0", 2, 9, 50, 100, 5, 9, 1000] for i in range(50)]]
+
+
+def make_game_update_params():
+    return ["31", [[i, "1000", 500 * i, "9", "Player %d" % i] for i in range(9)],
+            {"0": [1, "player1", 1000], "5": [2, "player2", 2500]}, [2, 9, 13, 22, 40]]
+
+
+def make_message_params():
+    return ["20", 0, MESSAGE_TEXT, 123, 456]
+
+
+def make_action_params():
+    return ["50", 1, 250]
+
+
+def make_room_models():
+    room_models = []
+    for i in range(50):
+        room_model = RoomModel([1000 + i, "Room %d" % i, "1_H_10_0", [50, 100, 5, 9, 1000], 0, 0, 9])
+        room_model.playing_count = 2
+        room_models.append(room_model)
+    return room_models
+
+
+def measure(statement, number, repeat_count):
+    return min(timeit.repeat(statement, number=number, repeat=repeat_count)) / number
+
+
+def main():
+    number = int(get_command_line_param("-number", 10000))
+    repeat_count = int(get_command_line_param("-repeat", 5))
+
+    for name, make_params in [("room list", make_room_list_params), ("game update", make_game_update_params),
+                              ("message", make_message_params), ("action", make_action_params)]:
+        print("Payload: %s (%d bytes)" % (name, len(CommandParser().make_command(make_params()))))
+        base_time_by_action = {}
+        for parser_class in PARSER_CLASS_LIST:
+            parser = parser_class()
+            command = parser.make_command(make_params())
+            if parser.is_binary:
+                print(" %-18s size: %d bytes" % (parser_class.__name__, len(command)))
+                command = parser.split_commands(command)[0]
+            else:
+                # (Output must be byte-for-byte identical)
+                assert command == CommandParser().make_command(make_params())
+            encoded_text = parser.encode_string(MESSAGE_TEXT)
+            # (Room list is large, so less iterations for it)
+            count = number // 10 if make_params is make_room_list_params else number
+            for action, statement in [("make_command", lambda: parser.make_command(make_params())),
+                                      ("parse_command", lambda: parser.parse_command(command)),
+                                      ("encode_string", lambda: parser.encode_string(MESSAGE_TEXT)),
+                                      ("decode_string", lambda: parser.decode_string(encoded_text))]:
+                t = measure(statement, count, repeat_count)
+                base_time = base_time_by_action.setdefault(action, t)
+                print(" %-18s %-14s %.2f us (x%.1f)" % (parser_class.__name__, action, t * 1000000, base_time / t))
+
+        # Dropped command
+        parser = CommandParser()
+        command = parser.make_command(make_params())[:-len(parser.COMMAND_DELIM)]
+        count = number // 10 if make_params is make_room_list_params else number
+        full_time = measure(lambda: len(parser.parse_command(command)), count, repeat_count)
+        lazy_time = measure(lambda: len(LazyCommandParams(parser, command).command_code), count, repeat_count)
+        print(" %-35s %.2f us" % ("Dropped command, full parsing", full_time * 1000000))
+        print(" %-35s %.2f us (x%.1f)" % ("Dropped command, LazyCommandParams", lazy_time * 1000000,
+                                          full_time / lazy_time))
+
+        # Received frame
+        bytes_parser = BytesCommandParser()
+        frame = parser.make_command(make_params()).encode("utf-8") * 2
+        decode_time = measure(lambda: [parser.parse_command(command) for command in
+                                       parser.split_commands(frame.decode("utf-8")) if command], count, repeat_count)
+        bytes_time = measure(lambda: [bytes_parser.parse_command(command) for command in
+                                      bytes_parser.split_commands(frame) if command], count, repeat_count)
+        print(" %-35s %.2f us" % ("Frame, decode and parse", decode_time * 1000000))
+        print(" %-35s %.2f us (x%.1f)" % ("Frame, BytesCommandParser", bytes_time * 1000000,
+                                          decode_time / bytes_time))
+
+    # Room list from models
+    room_models = make_room_models()
+    print("Payload: room list from %d room models" % len(room_models))
+    for parser_class in PARSER_CLASS_LIST:
+        parser = parser_class()
+        assert parser.make_command(["11", ExportedModels(room_models)]) == \
+            parser.make_command(["11", [room_model.export_public_data() for room_model in room_models]])
+        export_time = measure(lambda: parser.make_command(
+            ["11", [room_model.export_public_data() for room_model in room_models]]), number // 10, repeat_count)
+        cached_time = measure(lambda: parser.make_command(["11", ExportedModels(room_models)]),
+                              number // 10, repeat_count)
+        print(" %-18s %-30s %.2f us" % (parser_class.__name__, "export_public_data()", export_time * 1000000))
+        print(" %-18s %-30s %.2f us (x%.1f)" % (parser_class.__name__, "ExportedModels (cached)",
+                                                cached_time * 1000000, export_time / cached_time))
+
+
+if __name__ == "__main__":
+    main()
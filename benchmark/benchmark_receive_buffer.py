@@ -0,0 +1,153 @@
+"""
+Microbenchmark of receiving large messages in RECV_SIZE chunks: previous
+approach (buffer += data_bytes; DELIMITER in buffer; buffer.split()) against
+ReceiveBuffer (recv_into() to preallocated bytearray). And for large frame of
+many commands: processing of commands after frame received (ReceiveBuffer)
+against processing as soon as each command received (CommandReceiveBuffer):
+time to the first command and total time.
+
+Usage:
+    python benchmark_receive_buffer.py [-repeat 5]
+"""
+try:
+    import napalm
+except ImportError:
+    import os
+    import sys
+    # Link libraries (to launch from command line console)
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+    import napalm
+
+import time
+
+from napalm.socket.parser import CommandParser
+from napalm.socket.server import CommandReceiveBuffer, Config, ReceiveBuffer
+from napalm.utils.parsing_util import get_command_line_param
+
+MESSAGE_SIZE_LIST = [64 * 1024, 1024 * 1024]
+COMMAND_COUNT_LIST = [100, 10000]
+
+
+class ChunkSocket:
+    """
+    Imitation of socket which receives given data by chunks of RECV_SIZE.
+    """
+
+    def __init__(self, data_bytes, recv_size=Config.RECV_SIZE):
+        self.data_view = memoryview(data_bytes)
+        self.recv_size = recv_size
+        self.index = 0
+
+    def recv(self, size):
+        size = min(size, self.recv_size)
+        data_bytes = self.data_view[self.index:self.index + size].tobytes()
+        self.index += len(data_bytes)
+        return data_bytes
+
+    def recv_into(self, buffer, size=0):
+        size = min(size or len(buffer), self.recv_size, len(self.data_view) - self.index)
+        buffer[:size] = self.data_view[self.index:self.index + size]
+        self.index += size
+        return size
+
+
+def receive_by_concat(sock, delimiter):
+    buffer = b""
+    data_bytes_list = []
+    while True:
+        while delimiter not in buffer:
+            data_bytes = sock.recv(Config.RECV_SIZE)
+            if not data_bytes:
+                return data_bytes_list
+            buffer += data_bytes
+        frames = buffer.split(delimiter)
+        buffer = frames.pop()
+        data_bytes_list.extend(frames)
+
+
+def receive_by_buffer(sock, delimiter):
+    receive_buffer = ReceiveBuffer(delimiter, Config.RECV_SIZE)
+    data_bytes_list = []
+    while receive_buffer.recv_from(sock):
+        data_bytes_list.extend(receive_buffer.pop_frames())
+    return data_bytes_list
+
+
+def measure(receive, data_bytes, repeat_count):
+    best_time = None
+    for _ in range(repeat_count):
+        sock = ChunkSocket(data_bytes)
+        t = time.perf_counter()
+        data_bytes_list = receive(sock, Config.DELIMITER)
+        t = time.perf_counter() - t
+        assert len(data_bytes_list) == 1 and len(data_bytes_list[0]) == len(data_bytes) - 1
+        best_time = t if best_time is None else min(best_time, t)
+    return best_time
+
+
+def process_frames(sock, delimiter):
+    # (As Protocol.process_bytes() does)
+    parser = CommandParser()
+    receive_buffer = ReceiveBuffer(delimiter, Config.RECV_SIZE)
+    first_time = None
+    count = 0
+    while receive_buffer.recv_from(sock):
+        for data_bytes in receive_buffer.pop_frames():
+            for command in parser.split_commands(data_bytes.decode("utf-8")):
+                if command:
+                    parser.parse_command(command)
+                    first_time = first_time or time.perf_counter()
+                    count += 1
+    return first_time, count
+
+
+def process_commands(sock, delimiter):
+    parser = CommandParser()
+    receive_buffer = CommandReceiveBuffer(delimiter, Config.RECV_SIZE, parser.COMMAND_DELIM.encode())
+    first_time = None
+    count = 0
+    while receive_buffer.recv_from(sock):
+        for command in receive_buffer.pop_frames():
+            if command:
+                parser.parse_command(command.decode("utf-8"))
+                first_time = first_time or time.perf_counter()
+                count += 1
+    return first_time, count
+
+
+def measure_commands(process, data_bytes, command_count, repeat_count):
+    best_first_time = best_time = None
+    for _ in range(repeat_count):
+        sock = ChunkSocket(data_bytes)
+        t = time.perf_counter()
+        first_time, count = process(sock, Config.DELIMITER)
+        first_time, total_time = first_time - t, time.perf_counter() - t
+        assert count == command_count
+        best_first_time = first_time if best_first_time is None else min(best_first_time, first_time)
+        best_time = total_time if best_time is None else min(best_time, total_time)
+    return best_first_time, best_time
+
+
+def main():
+    repeat_count = int(get_command_line_param("-repeat", 5))
+
+    for message_size in MESSAGE_SIZE_LIST:
+        data_bytes = b"a" * message_size + Config.DELIMITER
+        concat_time = measure(receive_by_concat, data_bytes, repeat_count)
+        buffer_time = measure(receive_by_buffer, data_bytes, repeat_count)
+        print("Message: %d KB (%d chunks of %d bytes)" % (
+            message_size // 1024, len(data_bytes) // Config.RECV_SIZE + 1, Config.RECV_SIZE))
+        print(" buffer += data: %.3f ms" % (concat_time * 1000))
+        print(" ReceiveBuffer:  %.3f ms (x%.1f)" % (buffer_time * 1000, concat_time / buffer_time))
+
+    for command_count in COMMAND_COUNT_LIST:
+        data_bytes = b"".join([b"10||%d||param1,,param2||text##" % i for i in range(command_count)]) + \
+            Config.DELIMITER
+        print("Frame: %d commands (%d KB)" % (command_count, len(data_bytes) // 1024))
+        for name, process in [("ReceiveBuffer", process_frames), ("CommandReceiveBuffer", process_commands)]:
+            first_time, total_time = measure_commands(process, data_bytes, command_count, repeat_count)
+            print(" %-21s first command: %.3f ms total: %.3f ms" % (name + ":", first_time * 1000, total_time * 1000))
+
+
+if __name__ == "__main__":
+    main()
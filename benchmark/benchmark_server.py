@@ -0,0 +1,120 @@
+"""
+Benchmark of server engines: CPU usage while all connections are idle
+and round-trip latency of messages while most of connections are idle.
+
+Usage:
+    python benchmark_server.py [-server non-blocking|threaded|asyncio] [-connections 5000]
+        [-active 10] [-messages 1000] [-idle-sec 5] [-port 41000]
+"""
+try:
+    import napalm
+except ImportError:
+    import os
+    import sys
+    # Link libraries (to launch from command line console)
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+    import napalm
+
+import socket
+import threading
+import time
+
+from napalm.socket.protocol import SimpleProtocol
+from napalm.socket.server import AsyncioTCPServer, NonBlockingTCPServer, ServerConfig, ThreadedTCPServer
+from napalm.utils.parsing_util import get_command_line_param
+
+SERVER_CLASS_BY_NAME = {
+    "non-blocking": NonBlockingTCPServer,
+    "threaded": ThreadedTCPServer,
+    "asyncio": AsyncioTCPServer,
+}
+
+
+class EchoProtocol(SimpleProtocol):
+    def process_bytes_list(self, data_bytes_list):
+        for data_bytes in data_bytes_list:
+            self.send_raw(data_bytes)
+
+
+def raise_open_files_limit(count):
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < count:
+        limit = count if hard == resource.RLIM_INFINITY else min(count, hard)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (limit, hard))
+
+
+def connect_clients(address, count):
+    clients = []
+    for i in range(count):
+        clients.append(socket.create_connection(address))
+        # (Let server accept connections not to overflow listen backlog)
+        if i % 100 == 99:
+            time.sleep(.01)
+    return clients
+
+
+def measure_idle_cpu(idle_sec):
+    t0, cpu0 = time.time(), time.process_time()
+    time.sleep(idle_sec)
+    return (time.process_time() - cpu0) / (time.time() - t0)
+
+
+def measure_latency(clients, message_count, delimiter):
+    data_bytes = b"1||param1||param2##" + delimiter
+    latency_list = []
+    for i in range(message_count):
+        client = clients[i % len(clients)]
+        t = time.perf_counter()
+        client.sendall(data_bytes)
+        received_bytes = b""
+        while not received_bytes.endswith(delimiter):
+            received_bytes += client.recv(1024)
+        latency_list.append(time.perf_counter() - t)
+    latency_list.sort()
+    return latency_list
+
+
+def main():
+    server_name = get_command_line_param("-server", "non-blocking")
+    connection_count = int(get_command_line_param("-connections", 5000))
+    active_count = int(get_command_line_param("-active", 10))
+    message_count = int(get_command_line_param("-messages", 1000))
+    idle_sec = float(get_command_line_param("-idle-sec", 5))
+    port = int(get_command_line_param("-port", 41000))
+
+    # (Client and server sockets)
+    raise_open_files_limit(connection_count * 2 + 100)
+
+    config = ServerConfig("localhost", port, EchoProtocol)
+    server = SERVER_CLASS_BY_NAME[server_name](config)
+    thread = threading.Thread(target=server.start, daemon=True)
+    thread.start()
+    time.sleep(.5)
+
+    print("Server: %s connections: %d (active: %d)" % (server_name, connection_count, active_count))
+    t = time.time()
+    clients = connect_clients((config.host, config.port), connection_count)
+    print(" Connected in %.2f sec" % (time.time() - t))
+    time.sleep(1)
+
+    idle_cpu = measure_idle_cpu(idle_sec)
+    print(" Idle CPU: %.1f%% (of one core, measured for %.1f sec)" % (idle_cpu * 100, idle_sec))
+
+    latency_list = measure_latency(clients[:active_count], message_count, config.DELIMITER)
+    print(" Latency: mean %.3f ms, p50 %.3f ms, p99 %.3f ms, max %.3f ms" % (
+        sum(latency_list) / len(latency_list) * 1000,
+        latency_list[len(latency_list) // 2] * 1000,
+        latency_list[int(len(latency_list) * .99)] * 1000,
+        latency_list[-1] * 1000))
+
+    for client in clients:
+        client.close()
+    server.stop()
+
+
+if __name__ == "__main__":
+    main()
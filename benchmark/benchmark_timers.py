@@ -0,0 +1,117 @@
+"""
+Benchmark of scheduling of many running timers (turn timers, countdowns in
+many rooms): previous approach (list of timers, each tick checks elapsed time
+of every timer, add/remove by list membership) against TimingWheel (only
+expired timers are processed on tick, O(1) add/remove).
+
+Usage:
+    python benchmark_timers.py [-ticks 200] [-repeat 5]
+"""
+try:
+    import napalm
+except ImportError:
+    import os
+    import sys
+    # Link libraries (to launch from command line console)
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+    import napalm
+
+import random
+import time
+
+from napalm.async import AbstractTimer, TimingWheel
+from napalm.utils.parsing_util import get_command_line_param
+
+TIMER_COUNT_LIST = [1000, 10000, 50000]
+RESOLUTION_SEC = .5
+# (Delays of timers, from turn timeout to long countdowns)
+MIN_DELAY_SEC = 5
+MAX_DELAY_SEC = 120
+
+
+def make_timers(timer_count):
+    timers = []
+    for _ in range(timer_count):
+        timer = AbstractTimer(delay_sec=random.uniform(MIN_DELAY_SEC, MAX_DELAY_SEC))
+        timer._running = True
+        timer._start_time = time.time()
+        timers.append(timer)
+    return timers
+
+
+def add_remove_by_list(timers):
+    timer_list = []
+    for timer in timers:
+        if timer not in timer_list:
+            timer_list.append(timer)
+    for timer in timers:
+        if timer in timer_list:
+            timer_list.remove(timer)
+
+
+def add_remove_by_wheel(timers):
+    wheel = TimingWheel(RESOLUTION_SEC)
+    for timer in timers:
+        wheel.add(timer, timer._get_deadline())
+    for timer in timers:
+        wheel.remove(timer)
+
+
+def tick_by_list(timers, tick_count):
+    # (As AbstractTimer._tick() was)
+    for _ in range(tick_count):
+        for timer in timers:
+            if timer.get_elapsed_time() >= timer.delay_sec:
+                pass
+
+
+def tick_by_wheel(timers, tick_count):
+    # (Time is simulated, so that timers expire and are rescheduled as repeating ones)
+    now = time.time()
+    wheel = TimingWheel(RESOLUTION_SEC, now)
+    for timer in timers:
+        wheel.add(timer, now + timer.delay_sec, now)
+    t = time.perf_counter()
+    for _ in range(tick_count):
+        now += RESOLUTION_SEC
+        for timer in wheel.advance(now):
+            wheel.add(timer, now + timer.delay_sec, now)
+    return time.perf_counter() - t
+
+
+def measure(function, repeat_count):
+    best_time = None
+    for _ in range(repeat_count):
+        t = time.perf_counter()
+        result = function()
+        t = result if result is not None else time.perf_counter() - t
+        best_time = t if best_time is None else min(best_time, t)
+    return best_time
+
+
+def main():
+    tick_count = int(get_command_line_param("-ticks", 200))
+    repeat_count = int(get_command_line_param("-repeat", 5))
+
+    random.seed(1)
+    for timer_count in TIMER_COUNT_LIST:
+        timers = make_timers(timer_count)
+        print("Timers: %d (delays %d-%d sec, resolution %s sec)" % (
+            timer_count, MIN_DELAY_SEC, MAX_DELAY_SEC, RESOLUTION_SEC))
+
+        # (List is O(n^2) for all timers, so it's measured for less count of them)
+        list_count = min(timer_count, 10000)
+        list_time = measure(lambda: add_remove_by_list(timers[:list_count]), 1) / list_count
+        wheel_time = measure(lambda: add_remove_by_wheel(timers), repeat_count) / timer_count
+        print(" %-28s %.2f us" % ("add+remove, list (%d):" % list_count, list_time * 1000000))
+        print(" %-28s %.2f us (x%.1f)" % ("add+remove, TimingWheel:", wheel_time * 1000000,
+                                          list_time / wheel_time))
+
+        list_time = measure(lambda: tick_by_list(timers, tick_count), 1) / tick_count
+        wheel_time = measure(lambda: tick_by_wheel(timers, tick_count), repeat_count) / tick_count
+        print(" %-28s %.3f ms" % ("tick, list:", list_time * 1000))
+        print(" %-28s %.3f ms (x%.1f)" % ("tick, TimingWheel:", wheel_time * 1000, list_time / wheel_time))
+
+
+if __name__ == "__main__":
+    main()
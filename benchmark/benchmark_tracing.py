@@ -0,0 +1,81 @@
+"""
+Benchmark of processing received commands by Protocol with DEBUG off:
+previous unconditional print() of each parsed command (to os.devnull, so
+it's the lower bound: real stdout is slower) against tracing (disabled, and
+enabled with sampling 1 of 100 to os.devnull in writer thread).
+
+Usage:
+    python benchmark_tracing.py [-number 100000] [-repeat 5]
+"""
+try:
+    import napalm
+except ImportError:
+    import os
+    import sys
+    # Link libraries (to launch from command line console)
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+    import napalm
+
+import logging
+import os
+import sys
+import time
+
+from napalm.socket.protocol import Protocol
+from napalm.utils.parsing_util import get_command_line_param
+from napalm.utils.trace_util import setup_tracing, stop_tracing
+
+
+class PrintProtocol(Protocol):
+    # (As Protocol._parse_command() was before tracing)
+    def _parse_command(self, command):
+        result = super()._parse_command(command)
+        if result:
+            command_code, command_params, params_count = result
+            command_description = self.get_command_description(command_code, not self.is_server_protocol)
+            print(self.protocol_id, "  parsed command code: %s (%s) params: %s" %
+                  (command_code, command_description, str(command_params)))
+        return result
+
+
+def make_frame(command_count):
+    return b"".join([b"10||%d||param1,,param2||text##" % i for i in range(command_count)])
+
+
+def measure(protocol, frame, command_count, repeat_count):
+    best_time = None
+    for _ in range(repeat_count):
+        t = time.perf_counter()
+        protocol.process_bytes(frame)
+        t = time.perf_counter() - t
+        best_time = t if best_time is None else min(best_time, t)
+    return command_count / best_time
+
+
+def main():
+    command_count = int(get_command_line_param("-number", 100000))
+    repeat_count = int(get_command_line_param("-repeat", 5))
+
+    logging.disable(logging.DEBUG)
+    frame = make_frame(command_count)
+    stdout = sys.stdout
+    with open(os.devnull, "w") as devnull:
+        sys.stdout = devnull
+        try:
+            print_rate = measure(PrintProtocol(lambda data_bytes: None), frame, command_count, repeat_count)
+            disabled_rate = measure(Protocol(lambda data_bytes: None), frame, command_count, repeat_count)
+            setup_tracing(sample_every=100, stream=devnull)
+            sampled_rate = measure(Protocol(lambda data_bytes: None), frame, command_count, repeat_count)
+            stop_tracing()
+        finally:
+            sys.stdout = stdout
+
+    print("Commands: %d (best of %d)" % (command_count, repeat_count))
+    print(" %-30s %d commands/sec" % ("print() each command:", print_rate))
+    print(" %-30s %d commands/sec (x%.1f)" % ("Tracing disabled:", disabled_rate, disabled_rate / print_rate))
+    print(" %-30s %d commands/sec (x%.1f)" % ("Tracing, 1 of 100 sampled:", sampled_rate,
+                                               sampled_rate / print_rate))
+
+
+if __name__ == "__main__":
+    main()
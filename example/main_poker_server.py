@@ -7,9 +7,9 @@ except ImportError:
     import napalm
 
 from napalm.utils.parsing_util import get_command_line_param
-from napalm.core import SocketGameApplication
+from napalm.core import SocketGameApplication, WorkerSupervisor
 from napalm.play.poker.lobby import PokerLobbyModel
-from napalm.socket.server import NonBlockingTCPServer, ThreadedTCPServer, TwistedTCPServer
+from napalm.socket.server import AsyncioTCPServer, NonBlockingTCPServer, ThreadedTCPServer, TwistedTCPServer
 
 if __name__ == "__main__":
     # Get params from command line (sys.argv)
@@ -17,16 +17,27 @@ if __name__ == "__main__":
     data_dir_path = get_command_line_param("-data-path")  # or "../server_data"
     is_twisted = get_command_line_param("-twisted")
     is_non_blocking = get_command_line_param("-non-blocking")
+    is_asyncio = get_command_line_param("-asyncio")
     is_no_restore = get_command_line_param("-no-restore")
+    # (Number of processes listening the same port, each with its own part of lobbies)
+    worker_count = int(get_command_line_param("-workers", 0))
 
     # Config play and server
-    server_config = PokerLobbyModel(lobby_id=lobby_id, data_dir_path=data_dir_path)
-    server_config.napalm_secret = "myrandomforsocketserverSnJdG6dDZq6Os3i6iilo"
-    if is_no_restore:
-        server_config.save_lobby_state_enabled = False
+    def create_config():
+        server_config = PokerLobbyModel(lobby_id=lobby_id, data_dir_path=data_dir_path)
+        server_config.napalm_secret = "myrandomforsocketserverSnJdG6dDZq6Os3i6iilo"
+        if is_no_restore:
+            server_config.save_lobby_state_enabled = False
+        return server_config
 
     server_class = TwistedTCPServer if is_twisted else (NonBlockingTCPServer if is_non_blocking else ThreadedTCPServer)
+    if is_asyncio:
+        server_class = AsyncioTCPServer
 
     # Create and start
-    app = SocketGameApplication(server_config, server_class)
-    app.start()
+    if worker_count:
+        supervisor = WorkerSupervisor(create_config, worker_count, server_class)
+        supervisor.start()
+    else:
+        app = SocketGameApplication(create_config(), server_class)
+        app.start()
@@ -1,9 +1,10 @@
+import asyncio
 import threading
 import time
 from threading import Thread
 
 from twisted.internet import reactor
-from twisted.internet.task import deferLater, LoopingCall
+from twisted.internet.task import deferLater
 
 
 # Signal
@@ -356,31 +357,230 @@ class TwistedDeferredTimeout(Timeout):
 
 # Timer
 
+class TimingWheel:
+    """
+    Hierarchical timing wheel: scheduled items by deadline, so that adding and
+    removing take O(1) and advancing takes time proportional to expired items
+    (plus O(1) per elapsed tick), not to all items scheduled.
+
+    Level 0 has slot_count slots of 1 tick (resolution_sec), each next level has
+    slots of slot_count times longer. Items of the slot of upper level are moved
+    to lower levels when level 0 comes to that slot's time. Items in the same
+    slot keep the order they were added in.
+    """
+
+    slot_count = 64
+    level_count = 4
+
+    def __init__(self, resolution_sec=.5, now=None):
+        self.resolution_sec = resolution_sec
+        self._current_tick = int((time.time() if now is None else now) / resolution_sec)
+        self._levels = [[{} for _ in range(self.slot_count)] for _ in range(self.level_count)]
+        # (To skip empty levels on advancing)
+        self._count_by_level = [0] * self.level_count
+        # (Items added after their deadlines, got by next advance())
+        self._overdue_slot = {}
+        # (Slot and level by item, for O(1) removing)
+        self._slot_by_item = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._slot_by_item)
+
+    def __contains__(self, item):
+        return item in self._slot_by_item
+
+    def __iter__(self):
+        return iter(list(self._slot_by_item))
+
+    def __repr__(self):
+        return "<TimingWheel %s>" % list(self._slot_by_item)
+
+    def add(self, item, deadline, now=None):
+        """
+        Add item or move it to new deadline.
+        :param deadline: time (as time.time()) when item should be got by advance()
+        """
+        with self._lock:
+            self.remove(item)
+            now = time.time() if now is None else now
+            if not self._slot_by_item:
+                # (Not advanced while empty)
+                self._current_tick = max(self._current_tick, int(now / self.resolution_sec))
+            if deadline <= now or deadline <= self._current_tick * self.resolution_sec:
+                # (Current tick is already processed)
+                self._overdue_slot[item] = deadline
+                self._slot_by_item[item] = self._overdue_slot, None
+            else:
+                self._put(item, deadline)
+
+    def remove(self, item):
+        with self._lock:
+            slot, level_index = self._slot_by_item.pop(item, (None, None))
+            if slot is not None:
+                del slot[item]
+                if level_index is not None:
+                    self._count_by_level[level_index] -= 1
+
+    def clear(self):
+        with self._lock:
+            for level in self._levels:
+                for slot in level:
+                    slot.clear()
+            self._count_by_level = [0] * self.level_count
+            self._overdue_slot.clear()
+            self._slot_by_item.clear()
+
+    def set_resolution(self, resolution_sec, now=None):
+        """
+        Change resolution rescheduling all items by their ticks.
+        """
+        with self._lock:
+            now = time.time() if now is None else now
+            deadline_by_item = {item: slot[item] for item, (slot, level_index) in self._slot_by_item.items()}
+            self.clear()
+            self.resolution_sec = resolution_sec
+            self._current_tick = int(now / resolution_sec)
+            for item, deadline in deadline_by_item.items():
+                self.add(item, deadline, now)
+
+    def advance(self, now=None):
+        """
+        :return: list of items which deadlines have come (they are removed from wheel)
+        """
+        with self._lock:
+            now = time.time() if now is None else now
+            target_tick = int(now / self.resolution_sec)
+            if not self._slot_by_item:
+                self._current_tick = max(self._current_tick, target_tick)
+                return []
+
+            expired_items = list(self._overdue_slot)
+            if expired_items:
+                self._overdue_slot = {}
+                for item in expired_items:
+                    del self._slot_by_item[item]
+            slot_count = self.slot_count
+            while self._current_tick < target_tick and self._slot_by_item:
+                # (Skip ticks while lower levels are empty, up to next cascading)
+                empty_level_count = 0
+                while not self._count_by_level[empty_level_count]:
+                    empty_level_count += 1
+                if empty_level_count:
+                    period = slot_count ** empty_level_count
+                    self._current_tick = min(target_tick, (self._current_tick // period + 1) * period) - 1
+                self._current_tick += 1
+                tick = self._current_tick
+                # Move items of upper levels down (when lower level comes to the beginning)
+                top_level_index = 0
+                while top_level_index < self.level_count - 1 and tick % slot_count ** (top_level_index + 1) == 0:
+                    top_level_index += 1
+                for level_index in range(top_level_index, 0, -1):
+                    self._cascade(level_index, (tick // slot_count ** level_index) % slot_count)
+
+                slot = self._levels[0][tick % slot_count]
+                if slot:
+                    self._levels[0][tick % slot_count] = {}
+                    self._count_by_level[0] -= len(slot)
+                    for item in slot:
+                        del self._slot_by_item[item]
+                    expired_items.extend(slot)
+            if self._current_tick < target_tick:
+                self._current_tick = target_tick
+
+            # (Items of next tick which deadlines have come already, so that they are not
+            # got up to 2 ticks later)
+            slot = self._levels[0][(self._current_tick + 1) % slot_count]
+            if slot:
+                for item, deadline in list(slot.items()):
+                    if deadline <= now:
+                        del slot[item]
+                        del self._slot_by_item[item]
+                        self._count_by_level[0] -= 1
+                        expired_items.append(item)
+            return expired_items
+
+    def get_next_deadline(self):
+        """
+        :return: the earliest deadline of items, or None if empty
+        """
+        with self._lock:
+            deadlines = list(self._overdue_slot.values())
+            slot_count = self.slot_count
+            for level_index, level in enumerate(self._levels):
+                if not self._count_by_level[level_index]:
+                    continue
+                # (Slots after current one are in deadlines order)
+                slot_index = self._current_tick // slot_count ** level_index
+                for i in range(1, slot_count + 1):
+                    slot = level[(slot_index + i) % slot_count]
+                    if slot:
+                        deadlines.append(min(slot.values()))
+                        break
+            return min(deadlines) if deadlines else None
+
+    def _put(self, item, deadline):
+        slot_count = self.slot_count
+        # (Deadline tick is rounded up, so that item is not got before deadline)
+        tick = -int(-deadline // self.resolution_sec)
+        delta = tick - self._current_tick
+        level_index = 0
+        while level_index < self.level_count - 1 and delta >= slot_count ** (level_index + 1):
+            level_index += 1
+        # (If too far, item is put to the last slot of the last level to be rescheduled then)
+        slot_tick = min(tick, self._current_tick + slot_count ** self.level_count - 1)
+        slot = self._levels[level_index][(slot_tick // slot_count ** level_index) % slot_count]
+        slot[item] = deadline
+        self._count_by_level[level_index] += 1
+        self._slot_by_item[item] = slot, level_index
+
+    def _cascade(self, level_index, slot_index):
+        slot = self._levels[level_index][slot_index]
+        if slot:
+            self._levels[level_index][slot_index] = {}
+            self._count_by_level[level_index] -= len(slot)
+            # (Items of current tick go to level 0 to be got right after cascading)
+            for item, deadline in slot.items():
+                self._put(item, deadline)
+
+
 class AbstractTimer:
 
     # Class
 
-    # Less resolution - more precise
+    # Less resolution - more precise (minimal interval between ticks, which are
+    # planned by the nearest deadline of timers)
     resolution_sec = .5
 
-    _timers = []
+    # (Running timers by deadline)
+    _timers = TimingWheel(resolution_sec)
     _is_ticking = False
+    # (Time of next tick planned by the nearest deadline)
+    _next_tick_time = float("inf")
+    _last_tick_time = 0
 
     @classmethod
     def _add_timer(cls, timer):
-        if timer not in cls._timers:
-            cls._timers.append(timer)
-            # print("TIMER *add timer |", timer, cls._is_ticking, "|", cls._timers)
+        if cls._timers.resolution_sec != cls.resolution_sec:
+            cls._timers.set_resolution(cls.resolution_sec)
+        cls._schedule_timer(timer)
         if not cls._is_ticking and cls._timers:
             cls._start_ticking()
 
+    @classmethod
+    def _schedule_timer(cls, timer):
+        deadline = timer._get_deadline()
+        cls._timers.add(timer, deadline)
+        if cls._is_ticking and deadline < cls._next_tick_time:
+            # (Wake ticking up before planned tick)
+            cls._reschedule_ticking()
+
     @classmethod
     def _remove_timer(cls, timer):
-        if timer in cls._timers:
-            cls._timers.remove(timer)
-            # print("TIMER *remove timer |", timer, cls._is_ticking, "|", cls._timers)
-            if cls._is_ticking and not cls._timers:
-                cls._stop_ticking()
+        # (Timer could be already removed by _tick())
+        cls._timers.remove(timer)
+        if cls._is_ticking and not cls._timers:
+            cls._stop_ticking()
 
     # Override
     @classmethod
@@ -396,14 +596,44 @@ class AbstractTimer:
             cls._is_ticking = False
             # Implement stopping ticking in subclass
 
+    # Override
+    @classmethod
+    def _reschedule_ticking(cls):
+        # Implement planning next tick again by _get_next_tick_delay() in subclass
+        pass
+
+    @classmethod
+    def _get_next_tick_delay(cls):
+        """
+        Plan next tick for the nearest deadline of timers, but not earlier than
+        resolution_sec after previous tick.
+        :return: delay in seconds, or None if there are no timers
+        """
+        next_deadline = cls._timers.get_next_deadline()
+        while True:
+            if next_deadline is None:
+                cls._next_tick_time = float("inf")
+            else:
+                cls._next_tick_time = max(next_deadline, cls._last_tick_time + cls.resolution_sec)
+            # (Timer could be added in other thread before _next_tick_time was set)
+            deadline = cls._timers.get_next_deadline()
+            if deadline == next_deadline:
+                break
+            next_deadline = deadline
+        return max(0, cls._next_tick_time - time.time()) if next_deadline is not None else None
+
     @classmethod
     def _tick(cls):
-        # current_time = time.time()
-        for timer in cls._timers:
-            # print("#tick#", timer.get_elapsed_time(), ">=", timer.delay_sec, "resolution:", timer.resolution_sec, timer)
+        cls._last_tick_time = time.time()
+        # (Only timers which deadlines have come)
+        for timer in cls._timers.advance():
+            if not timer._running:
+                continue
             if timer.get_elapsed_time() >= timer.delay_sec:
-                # print(" #tick#TIMER", timer.get_elapsed_time(), timer.delay_sec)
                 timer._timer()
+            # (Next repeat, or deadline was changed)
+            if timer._running and timer not in cls._timers:
+                cls._timers.add(timer, timer._get_deadline())
 
     # Object
 
@@ -433,6 +663,9 @@ class AbstractTimer:
     def elapsed_time(self, value):
         self._elapsed_time = max(0, value)
         self._start_time = time.time() if self._running else 0
+        if self in self.__class__._timers:
+            # (Deadline changed)
+            self.__class__._schedule_timer(self)
 
     _start_time = 0
     # (Can be set on restoring saved game precisely from the place it was paused)
@@ -466,6 +699,11 @@ class AbstractTimer:
     def __str__(self) -> str:
         return super().__str__() + ("{" + self.name + "}" if self.name else "")
 
+    def _get_deadline(self):
+        # (Exactly when elapsed time becomes delay_sec)
+        start_time = self._start_time if self._start_time > 0 else time.time()
+        return start_time + self.delay_sec - self._elapsed_time
+
     # deprecated
     def get_elapsed_time(self):
         # print("get_elapsed_time", self.elapsed_time, "+", time.time(), "-", self._start_time)
@@ -571,55 +809,54 @@ class ThreadedTimer(AbstractTimer):
 
     _thread = None
     lock = threading.RLock()
+    # (Ticking thread waits on it until the nearest deadline or until woken up)
+    _condition = threading.Condition(lock)
 
     max_idle_sec = 3
     _idle_start_time = None
 
     @classmethod
     def _start_ticking(cls):
-        # with cls.lock:
-            # print("TH-TIMER _start_ticking", cls._is_ticking, cls._thread)
+        with cls.lock:
             if not cls._is_ticking:
                 cls._is_ticking = True
                 cls._idle_start_time = None
-                if not cls._thread or cls._thread.is_alive():
-                    # t = time.time()
+                if not cls._thread:
                     cls._thread = Thread(target=cls.__ticking_thread, name="ThreadedTimer-ticker", daemon=True)
                     cls._thread.start()
-                    # print("TH-TIMER Created new timer Thread for %f sec" % (time.time() - t))
-                    # print("TH-TIMER -StarT-new-ticking-thread", threading.current_thread(), "=>", cls._thread, cls._timers)
                 else:
-                    pass
-                    # print("TH-TIMER -StarT-continue", threading.current_thread(), "=>", cls._thread, cls._timers)
+                    # (Wake idle thread up)
+                    cls._condition.notify()
 
     @classmethod
     def _stop_ticking(cls):
-        # with cls.lock:
+        with cls.lock:
             if cls._is_ticking:
                 cls._is_ticking = False
                 cls._idle_start_time = time.time()
-                # print("TH-TIMER -StoP-ticking", threading.current_thread(), cls._timers)
-                # cls._thread.join()
+                cls._next_tick_time = float("inf")
+                cls._condition.notify()
+
+    @classmethod
+    def _reschedule_ticking(cls):
+        with cls.lock:
+            cls._condition.notify()
 
     @classmethod
     def __ticking_thread(cls):
-        # with cls.lock:
-            # (Idle is to not create new thread on resume timing )
+        with cls.lock:
+            # (Idle is to not create new thread on resume timing)
             while cls._idle_start_time is None or time.time() - cls._idle_start_time < cls.max_idle_sec:
-                while cls._is_ticking:
-                    # (Call tick() before sleep() to avoid processing timer after it was stopped)
-                    t0 = time.time()
-                    # print("TH-TIMER  #TICK", threading.current_thread(), cls._timers, "resolution:", cls.resolution_sec)
-                    with cls.lock:
+                if cls._is_ticking:
+                    # (Could be woken up to plan next tick again)
+                    if time.time() >= cls._next_tick_time:
                         cls._tick()
-                    t = time.time()
-                    time.sleep(max((0, cls.resolution_sec - (t - t0))))
-                    # # print("TH-TIMER    #TICK", threading.current_thread(), cls._timers, "tick-time:", time.time() - t)
-                    # print("TH-TIMER    #TICK", "tick-time:", time.time() - t, "+", t - t0, "=", time.time() - t0)
-                time.sleep(cls.resolution_sec)
+                    if cls._is_ticking:
+                        # (Sleep until next tick, or until woken up if no timers)
+                        cls._condition.wait(cls._get_next_tick_delay())
+                else:
+                    cls._condition.wait(max(0, cls.max_idle_sec - (time.time() - cls._idle_start_time)))
             cls._thread = None
-            # print("TH-TIMER  ##TICK-FINISH", threading.current_thread(), cls._timers)
-            # print("TH-TIMER  ##TICK-FINISH")
 
     # def start(self, callback=None, delay_sec=-1, repeat_count=-1, args=None):
     #     with self.lock:
@@ -636,19 +873,90 @@ class ThreadedTimer(AbstractTimer):
 
 class TwistedTimer(AbstractTimer):
 
-    _task = None
+    _delayed_call = None
+
+    @classmethod
+    def _start_ticking(cls):
+        if not cls._is_ticking:
+            cls._is_ticking = True
+            cls._reschedule_ticking()
+
+    @classmethod
+    def _stop_ticking(cls):
+        if cls._is_ticking:
+            cls._is_ticking = False
+            cls._next_tick_time = float("inf")
+            cls.__schedule_tick(None)
+
+    @classmethod
+    def _reschedule_ticking(cls):
+        cls.__schedule_tick(cls._get_next_tick_delay())
+
+    @classmethod
+    def __ticking_call(cls):
+        cls._delayed_call = None
+        cls._tick()
+        if cls._is_ticking:
+            cls._reschedule_ticking()
+
+    @classmethod
+    def __schedule_tick(cls, delay_sec):
+        if cls._delayed_call and cls._delayed_call.active():
+            cls._delayed_call.cancel()
+        cls._delayed_call = reactor.callLater(delay_sec, cls.__ticking_call) if delay_sec is not None else None
+
+
+class AsyncioTimer(AbstractTimer):
+
+    # (Set to server's loop by SocketApplication. If not set, the loop of current thread is used)
+    loop = None
+    # (Changed on each start/stop, so that previous ticking calls could find out they are outdated)
+    _ticking_id = 0
+    # (Used only in loop's thread)
+    _handle = None
 
     @classmethod
     def _start_ticking(cls):
         if not cls._is_ticking:
             cls._is_ticking = True
-            t = time.time()
-            cls._task = LoopingCall(cls._tick)
-            cls._task.start(cls.resolution_sec)
-            # print("Created new timer LoopingCall for %f sec" % (time.time() - t))
+            if not cls.loop:
+                cls.loop = asyncio.get_event_loop()
+            cls._ticking_id += 1
+            # (Timer could be started from any thread)
+            cls.loop.call_soon_threadsafe(cls.__ticking_call, cls._ticking_id)
 
     @classmethod
     def _stop_ticking(cls):
         if cls._is_ticking:
             cls._is_ticking = False
-            cls._task.stop()
+            cls._ticking_id += 1
+            cls._next_tick_time = float("inf")
+            cls.loop.call_soon_threadsafe(cls.__cancel_ticking)
+
+    @classmethod
+    def _reschedule_ticking(cls):
+        # (Timer could be added from any thread)
+        cls.loop.call_soon_threadsafe(cls.__schedule_tick, cls._ticking_id)
+
+    @classmethod
+    def __ticking_call(cls, ticking_id):
+        if ticking_id != cls._ticking_id:
+            return
+        cls._tick()
+        # (If ticking wasn't stopped by timers)
+        cls.__schedule_tick(ticking_id)
+
+    @classmethod
+    def __schedule_tick(cls, ticking_id):
+        if ticking_id != cls._ticking_id:
+            return
+        cls.__cancel_ticking()
+        delay_sec = cls._get_next_tick_delay()
+        if delay_sec is not None:
+            cls._handle = cls.loop.call_later(delay_sec, cls.__ticking_call, ticking_id)
+
+    @classmethod
+    def __cancel_ticking(cls):
+        if cls._handle:
+            cls._handle.cancel()
+            cls._handle = None
@@ -2,10 +2,13 @@ import atexit
 import collections
 import json
 import logging
+import multiprocessing
+import signal
+import threading
 import time
 
-from napalm.async import TwistedTimer
-from napalm.socket.server import ThreadedTCPServer, TwistedTCPServer
+from napalm.async import AsyncioTimer, TwistedTimer
+from napalm.socket.server import AsyncioTCPServer, ThreadedTCPServer, TwistedTCPServer
 from napalm.utils import object_util
 
 
@@ -19,9 +22,14 @@ class SocketApplication:
         # Choose timer implementation for chosen server type
         if issubclass(server_class, TwistedTCPServer):
             self.config.timer_class = TwistedTimer
+        elif issubclass(server_class, AsyncioTCPServer):
+            self.config.timer_class = AsyncioTimer
 
         # Create server
         self.server = server_class(self.config, self)
+        if isinstance(self.server, AsyncioTCPServer):
+            # (Timers should tick in the same loop where server processes connections)
+            AsyncioTimer.loop = self.server.loop
 
     # todo add tests
     def dispose(self):
@@ -86,6 +94,105 @@ class SocketGameApplication(SocketApplication):
         super().stop()
 
 
+def run_worker(create_config, app_class, server_class, worker_index, worker_count):
+    """
+    Entry point of worker process started by WorkerSupervisor.
+    """
+    config = create_config()
+    config.is_reuse_port = True
+    config.worker_index = worker_index
+    config.worker_count = worker_count
+    app = app_class(config, server_class)
+
+    def on_terminate(signum, frame):
+        # (Stop from other thread, because current one is blocked in serving)
+        threading.Thread(target=app.stop, name="worker-stop").start()
+    signal.signal(signal.SIGTERM, on_terminate)
+
+    logging.info("Worker %s/%s started (pid: %s)", worker_index, worker_count, multiprocessing.current_process().pid)
+    app.start()
+
+
+class WorkerSupervisor:
+    """
+    Pre-fork mode to use all CPU cores: worker_count processes of the application
+    listen to the same port (SO_REUSEPORT) and the kernel spreads connections between them.
+    Each worker owns its own shard of lobbies (see LobbyManager._get_lobby_model_shard()).
+    Crashed workers are restarted.
+
+    Configs are created by create_config() in each worker process, because all models
+    are stored in class properties.
+    """
+
+    check_interval_sec = 1
+    # (Not to restart crashing worker too often)
+    restart_delay_sec = 1
+    stop_timeout_sec = 10
+
+    def __init__(self, create_config, worker_count=None, server_class=ThreadedTCPServer,
+                 app_class=None):
+        self.create_config = create_config
+        self.worker_count = worker_count or multiprocessing.cpu_count()
+        self.server_class = server_class
+        self.app_class = app_class or SocketGameApplication
+
+        self.process_list = [None] * self.worker_count
+        self.restart_count = 0
+        self._start_time_list = [0] * self.worker_count
+
+        self.started = False
+        self.__started_lock = threading.RLock()
+        self.__stop_event = threading.Event()
+        self.__shutdown_event = threading.Event()
+        self.__shutdown_event.set()
+
+    def start(self):
+        with self.__started_lock:
+            if self.started:
+                logging.warning("WorkerSupervisor is already running")
+                return
+            self.started = True
+            self.__stop_event.clear()
+            self.__shutdown_event.clear()
+
+        for index in range(self.worker_count):
+            self._start_worker(index)
+
+        while not self.__stop_event.wait(self.check_interval_sec):
+            for index, process in enumerate(self.process_list):
+                if not process.is_alive() and time.time() - self._start_time_list[index] >= self.restart_delay_sec:
+                    logging.warning("Worker %s exited with code: %s. Restarting...", index, process.exitcode)
+                    self.restart_count += 1
+                    self._start_worker(index)
+
+        # Stop workers
+        for process in self.process_list:
+            if process.is_alive():
+                process.terminate()
+        for process in self.process_list:
+            process.join(self.stop_timeout_sec)
+            if process.is_alive():
+                logging.error("Worker %s was not stopped in %s sec", process.name, self.stop_timeout_sec)
+        self.__shutdown_event.set()
+
+    def stop(self):
+        with self.__started_lock:
+            if not self.started:
+                logging.warning("WorkerSupervisor is not running")
+                return
+            self.started = False
+        self.__stop_event.set()
+        self.__shutdown_event.wait()
+
+    def _start_worker(self, index):
+        process = multiprocessing.Process(
+            target=run_worker, name="worker-" + str(index),
+            args=(self.create_config, self.app_class, self.server_class, index, self.worker_count))
+        process.start()
+        self.process_list[index] = process
+        self._start_time_list[index] = time.time()
+
+
 class ConfigurableMixIn:
     """
     Functionality to configure instance by config params list which is set on creation.
@@ -149,11 +256,21 @@ class ExportableMixIn:
     # GameConfig instance. The global one could be reloaded and all others could 
     # take the changes when it is convenient.)
     change_time = None
+    # (Incremented on setting any property not starting with "_", see version)
+    _version = 0
 
     @property
     def is_changed(self):
         return bool(self._changes_queue)  # and len(self._changes_queue) > 0
 
+    @property
+    def version(self):
+        """
+        Changed on each change of model's properties. Used to cache serialized
+        export data (see ExportedModel). Value can be of any type: only equality is checked.
+        """
+        return self._version
+
     # Override
     @property
     def _property_names(self):
@@ -185,6 +302,15 @@ class ExportableMixIn:
         super().__init__()
         self._changes_queue = []
 
+    def __setattr__(self, name, value):
+        if name[0] != "_":
+            super().__setattr__("_version", self._version + 1)
+        super().__setattr__(name, value)
+
+    def mark_changed(self):
+        # Call if lists or dicts of properties were changed in place
+        self._version += 1
+
     def export_data(self):
         """
         Serialize current model state to plain list in order of self._property_names.
@@ -6,7 +6,7 @@ from napalm.play import server_commands, client_commands
 from napalm.play.game import GameConfigModel, Game
 from napalm.play.house import HouseModel, Player
 from napalm.play.lobby import RoomModel, LobbyModel
-from napalm.play.protocol import MessageType, FindAndJoin
+from napalm.play.protocol import MessageType, FindAndJoin, RoomsListDelta
 from napalm.socket.client import ClientConfig
 from napalm.socket.parser import CommandParser
 from napalm.socket.protocol import ClientProtocol
@@ -270,6 +270,23 @@ class ClientLobbyModel(ReloadableModel):
 
         self.import_public_data(info)
 
+    def apply_rooms_list_delta(self, delta_type, delta_data):
+        # (See GameProtocol.rooms_list_delta())
+        rooms = self._rooms if self._rooms is not None else []
+        if delta_type == RoomsListDelta.ROOM_ADDED:
+            rooms.append(ClientRoomModel(delta_data))
+        elif delta_type == RoomsListDelta.ROOM_REMOVED:
+            rooms = [room for room in rooms if room.room_id != delta_data]
+        elif delta_type == RoomsListDelta.ROOM_CHANGED:
+            room_id = delta_data[0]
+            for room in rooms:
+                if room.room_id == room_id:
+                    property_names = room._public_property_names
+                    room.import_public_data({property_names[int(index)]: value
+                                             for index, value in zip(delta_data[1::2], delta_data[2::2])})
+                    break
+        self._rooms = rooms
+
     # def import_public_data(self, data_list):
     #     super().import_public_data(data_list)
     #
@@ -318,10 +335,15 @@ class GameClientProtocol(ClientProtocol):
     CLIENT_COMMAND_DESCRIPTION_BY_CODE = client_commands.DESCRIPTION_BY_CODE
     SERVER_COMMAND_DESCRIPTION_BY_CODE = server_commands.DESCRIPTION_BY_CODE
 
+    SERVER_COMMAND_SCHEMA_BY_CODE = server_commands.SCHEMA_BY_CODE
+
     def __init__(self, send_bytes_method=None, close_connection_method=None, address=None, config=None, app=None):
         super().__init__(send_bytes_method, close_connection_method, address, config, app)
 
         self.credentials = app
+        # (Set while subscribed to rooms list, see subscribe_rooms_list())
+        self.rooms_list_sequence = None
+        self._is_rooms_list_resyncing = False
 
     # Called on any disconnect. For reconnected player another new protocol will be given
     def dispose(self):
@@ -356,174 +378,179 @@ class GameClientProtocol(ClientProtocol):
 
     def _process_command(self, command_code, command_params, params_count):
         if not self.player:
-            self.logging.error(self.protocol_id +
-                               "ERROR! (process_command) Cannot process command while main objects are not created!"
-                               "player: %s", self.player)
+            self.logging.error("%s ERROR! (process_command) Cannot process command while main objects "
+                               "are not created! player: %s", self.protocol_id, self.player)
+            return
+
+        self.logging.debug("%s info (_process_command) command_code: %s command_params: %s params_count: %s",
+                           self.protocol_id, command_code, command_params, params_count)
+
+        # (O(1) dispatch with params decoded by server_commands.SCHEMA_BY_CODE)
+        if not self._dispatch_command(command_code, command_params, params_count):
+            self.logging.warning("%s WARNING! (process_command) Unknown command! command_params: %s",
+                                 self.protocol_id, command_params)
+
+        super()._process_command(command_code, command_params, params_count)
+
+    # Lobby
+
+    def _process_goto_lobby(self, lobby_info):
+        self.player.lobby = ClientLobbyModel(lobby_info)
+
+        self.on_goto_lobby(self.player.lobby)
+
+    def _process_lobby_info_list(self, house_id, lobby_info_list):
+        # Supposed, that lobby_info_list received only for current house
+        if not self.player.house or self.player.house.house_id != house_id:
+            self.player.house = ClientHouseModel([house_id])
+        self.player.house.lobbies = lobby_info_list
+
+        self.on_lobby_info_list(house_id, self.player.house.lobbies)
+
+    def _process_rooms_list(self, room_info_list, sequence=None):
+        if sequence is not None:
+            # Subscribed
+            self.rooms_list_sequence = sequence
+            self._is_rooms_list_resyncing = False
+        if self.player.lobby:
+            self.player.lobby.rooms = room_info_list
+
+        self.on_rooms_list(self.player.lobby.rooms)
+
+    def _process_rooms_list_delta(self, sequence, delta_type, delta_data):
+        # (Skip if not subscribed or waiting for whole list)
+        if self.rooms_list_sequence is None or self._is_rooms_list_resyncing:
+            return
+        if sequence != self.rooms_list_sequence + 1:
+            self.logging.warning("%s WARNING! (process_command) Rooms list sequence gap! Resync. "
+                                 "expected: %s received: %s", self.protocol_id, self.rooms_list_sequence + 1, sequence)
+            self._is_rooms_list_resyncing = True
+            self.send([client_commands.SUBSCRIBE_ROOMS_LIST, 1])
             return
 
-        self.logging.debug(self.protocol_id + "info (_process_command) command_code: %s"
-                                              "command_params: %s params_count: %s", command_code, command_params,
-                           params_count)
-
-        # Lobby
-        if command_code == server_commands.GOTO_LOBBY:
-            lobby_info = command_params[1]
-            self.player.lobby = ClientLobbyModel(lobby_info)
-
-            self.on_goto_lobby(self.player.lobby)
-        elif command_code == server_commands.LOBBY_INFO_LIST:
-            house_id = command_params[1]
-            lobby_info_list = command_params[2]
-            # Supposed, that lobby_info_list received only for current house
-            if not self.player.house or self.player.house.house_id != house_id:
-                self.player.house = ClientHouseModel([house_id])
-            self.player.house.lobbies = lobby_info_list
-
-            self.on_lobby_info_list(house_id, self.player.house.lobbies)
-        elif command_code == server_commands.ROOMS_LIST:
-            room_info_list = command_params[1]
-            if self.player.lobby:
-                self.player.lobby.rooms = room_info_list
+        self.rooms_list_sequence = sequence
+        if self.player.lobby:
+            self.player.lobby.apply_rooms_list_delta(delta_type, delta_data)
 
             self.on_rooms_list(self.player.lobby.rooms)
-        elif command_code == server_commands.ROOM_INFO:
-            room_info = command_params[1]
-            player_info_list = command_params[2] if params_count > 2 else None
-            # Only update, creating only on joining the room
-            if self.player.room:
-                self.player.room.import_public_data(room_info)
-                self.player.room.player_list = player_info_list
-
-            self.on_room_info(self.player.room or ClientRoomModel(room_info))
-        elif command_code == server_commands.GAME_INFO:
-            game_info = command_params[1]
-            player_info_list = command_params[2] if params_count > 2 else None
-            self.player.room.update_or_create_game(game_info)
-            self.player.room.game.player_by_place_index_list = player_info_list
-
-            self.on_game_info(self.player.room.game, self.player.room.game.player_by_place_index_list)
-        elif command_code == server_commands.PLAYER_INFO:
-            place_index = int(command_params[1])
-            player_info = command_params[2]
-            player = self.player.room.game.update_place(place_index, player_info)
-
-            self.on_player_info(place_index, player)
-
-        # Room
-        elif command_code == server_commands.UPDATE_SELF_USER_INFO:
-            self_user_info = command_params[1]
-            # todo check that it's player_info, not user_info, or fix
-            self.player.import_public_data(self_user_info)
-
-            self.on_update_self_user_info()
-        elif command_code == server_commands.CONFIRM_JOINED_THE_ROOM:
-            room_info = command_params[1]
-            self.player.room = ClientRoomModel(room_info)
-
-            self.on_confirm_joined_the_room(self.player.room)
-        elif command_code == server_commands.PLAYER_JOINED_THE_ROOM:
-            player_info = command_params[1]
-            player = ClientPlayer(player_info)
-            self.player.room.players.append(player)
-
-            self.on_player_joined_the_room(player)
-        elif command_code == server_commands.PLAYER_JOINED_THE_GAME:
-            place_index = int(command_params[1])
-            player_info = command_params[2]
-            player = self.player.room.game.update_place(place_index, player_info)
-            if player.user_id == self.player.user_id:
-                self.player.place_index = place_index
-                self.player.game = self.player.room.game
-
-            self.on_player_joined_the_game(place_index, player)
-        elif command_code == server_commands.PLAYER_LEFT_THE_GAME:
-            place_index = int(command_params[1])
-            player = self.player.game.update_place(place_index, None)
-            if self.player.place_index == place_index:
-                self.player.place_index = -1
-                self.player.game = None
-
-            self.on_player_left_the_game(place_index, player)
-        elif command_code == server_commands.CONFIRM_LEFT_THE_ROOM:
-            # Dispose room and game
-            self.player.room = None
+
+    def _process_room_info(self, room_info, player_info_list=None):
+        # Only update, creating only on joining the room
+        if self.player.room:
+            self.player.room.import_public_data(room_info)
+            self.player.room.player_list = player_info_list
+
+        self.on_room_info(self.player.room or ClientRoomModel(room_info))
+
+    def _process_game_info(self, game_info, player_info_list=None):
+        self.player.room.update_or_create_game(game_info)
+        self.player.room.game.player_by_place_index_list = player_info_list
+
+        self.on_game_info(self.player.room.game, self.player.room.game.player_by_place_index_list)
+
+    def _process_player_info(self, place_index, player_info):
+        player = self.player.room.game.update_place(place_index, player_info)
+
+        self.on_player_info(place_index, player)
+
+    # Room
+
+    def _process_update_self_user_info(self, self_user_info):
+        # todo check that it's player_info, not user_info, or fix
+        self.player.import_public_data(self_user_info)
+
+        self.on_update_self_user_info()
+
+    def _process_confirm_joined_the_room(self, room_info):
+        self.player.room = ClientRoomModel(room_info)
+
+        self.on_confirm_joined_the_room(self.player.room)
+
+    def _process_player_joined_the_room(self, player_info):
+        player = ClientPlayer(player_info)
+        self.player.room.players.append(player)
+
+        self.on_player_joined_the_room(player)
+
+    def _process_player_joined_the_game(self, place_index, player_info):
+        player = self.player.room.game.update_place(place_index, player_info)
+        if player.user_id == self.player.user_id:
+            self.player.place_index = place_index
+            self.player.game = self.player.room.game
+
+        self.on_player_joined_the_game(place_index, player)
+
+    def _process_player_left_the_game(self, place_index):
+        player = self.player.game.update_place(place_index, None)
+        if self.player.place_index == place_index:
+            self.player.place_index = -1
             self.player.game = None
 
-            self.on_confirm_left_the_room()
-        elif command_code == server_commands.PLAYER_LEFT_THE_ROOM:
-            user_id = command_params[1]
-            player = next([player for player in self.player.room.players if player.user_id == user_id])
+        self.on_player_left_the_game(place_index, player)
+
+    def _process_confirm_left_the_room(self):
+        # Dispose room and game
+        self.player.room = None
+        self.player.game = None
+
+        self.on_confirm_left_the_room()
+
+    def _process_player_left_the_room(self, user_id):
+        player = next((player for player in self.player.room.players if player.user_id == user_id), None)
+        if player:
             self.player.room.players.remove(player)
 
-            self.on_player_left_the_room(user_id, player)
-        elif command_code == server_commands.MESSAGE:
-            message_type = int(command_params[1])
-            text = command_params[2]
-            sender_id = command_params[3]
-            color_index = int(command_params[4])
-            receiver_id = command_params[5] if params_count > 5 else None
-            # todo?
-
-            self.on_message(message_type, text, sender_id, color_index, receiver_id)
-        elif command_code == server_commands.SHOW_MESSAGE_DIALOG:
-            dialog_type = int(command_params[1])
-            title = command_params[2]
-            text = command_params[3]
-            # todo?
-
-            self.on_show_message_dialog(dialog_type, title, text)
-            if dialog_type == MessageType.MSG_DLG_TYPE_OK:
-                self.on_show_ok_message_dialog(title, text)
-            elif dialog_type == MessageType.MSG_DLG_TYPE_OK:
-                self.on_show_ok_cancel_message_dialog(title, text)
-        elif command_code == server_commands.LOG:
-            log_text = command_params[1]
-            self.on_log(log_text)
-
-        # Game
-        elif command_code == server_commands.READY_TO_START:
-            place_index = int(command_params[1])
-            is_ready = int(command_params[2])
-            start_game_countdown_sec = int(command_params[3])
-            self.on_ready_to_start(place_index, is_ready, start_game_countdown_sec)
-        elif command_code == server_commands.RESET_GAME:
-            self.on_reset_game()
-        elif command_code == server_commands.CHANGE_PLAYER_TURN:
-            place_index = int(command_params[1])
-            turn_timeout_sec = int(command_params[2])
-            player = self.player.room.game.player_by_place_index_list[place_index]
-
-            self.on_change_player_turn(place_index, player, turn_timeout_sec)
-        elif command_code == server_commands.SHOW_CASHBOX_DIALOG:
-            # place_index = int(command_params[1])
-            self.on_show_cashbox_dialog()
-        elif command_code == server_commands.PLAYER_WINS:
-            place_index = int(command_params[1])
-            money_win = float(command_params[2])
-            player_money_in_play = float(command_params[3])
-            if self.player.place_index == place_index:
-                self.player.money_in_play = player_money_in_play
-            player = self.player.room.game.player_by_place_index_list[place_index]
-            player.money_in_play = player_money_in_play
-
-            self.on_player_wins(place_index, player, money_win, player_money_in_play)
-        elif command_code == server_commands.PLAYER_WINS_THE_TOURNAMENT:
-            place_index = int(command_params[1])
-            money_win = float(command_params[2])
-            player = self.player.room.game.player_by_place_index_list[place_index]
-
-            self.on_player_wins_the_tournament(place_index, player, money_win)
-        elif command_code == server_commands.UPDATE1:
-            args = command_params[1:]
-            self.on_update1(*args)
-        elif command_code == server_commands.UPDATE2:
-            args = command_params[1:]
-            self.on_update2(*args)
-        elif command_code == server_commands.RAW_BINARY_UPDATE:
-            raw_binary = command_params[1]
-            self.on_raw_binary_update(raw_binary)
-
-        super()._parse_command(command_code, command_params, params_count)
+        self.on_player_left_the_room(user_id, player)
+
+    def _process_message(self, message_type, text, sender_id, color_index, receiver_id=None):
+        # todo?
+        self.on_message(message_type, text, sender_id, color_index, receiver_id)
+
+    def _process_show_message_dialog(self, dialog_type, title, text):
+        # todo?
+        self.on_show_message_dialog(dialog_type, title, text)
+        if dialog_type == MessageType.MSG_DLG_TYPE_OK:
+            self.on_show_ok_message_dialog(title, text)
+        elif dialog_type == MessageType.MSG_DLG_TYPE_OK_CANCEL:
+            self.on_show_ok_cancel_message_dialog(title, text)
+
+    def _process_log(self, log_text):
+        self.on_log(log_text)
+
+    # Game
+
+    def _process_ready_to_start(self, place_index, is_ready, start_game_countdown_sec):
+        self.on_ready_to_start(place_index, is_ready, start_game_countdown_sec)
+
+    def _process_reset_game(self):
+        self.on_reset_game()
+
+    def _process_change_player_turn(self, place_index, turn_timeout_sec):
+        player = self.player.room.game.player_by_place_index_list[place_index]
+
+        self.on_change_player_turn(place_index, player, turn_timeout_sec)
+
+    def _process_show_cashbox_dialog(self):
+        self.on_show_cashbox_dialog()
+
+    def _process_player_wins(self, place_index, money_win, player_money_in_play):
+        if self.player.place_index == place_index:
+            self.player.money_in_play = player_money_in_play
+        player = self.player.room.game.player_by_place_index_list[place_index]
+        player.money_in_play = player_money_in_play
+
+        self.on_player_wins(place_index, player, money_win, player_money_in_play)
+
+    def _process_player_wins_the_tournament(self, place_index, money_win):
+        player = self.player.room.game.player_by_place_index_list[place_index]
+
+        self.on_player_wins_the_tournament(place_index, player, money_win)
+
+    def _process_update1(self, args):
+        self.on_update1(*args)
+
+    def _process_update2(self, args):
+        self.on_update2(*args)
 
     # Override to call AI
 
@@ -633,6 +660,14 @@ class GameClientProtocol(ClientProtocol):
     def get_rooms_list(self):
         self.send([client_commands.GET_ROOMS_LIST])
 
+    def subscribe_rooms_list(self, is_subscribe=True):
+        """
+        Get rooms list and then its changes (on_rooms_list() called on each of them)
+        """
+        if not is_subscribe:
+            self.rooms_list_sequence = None
+        self.send([client_commands.SUBSCRIBE_ROOMS_LIST, int(is_subscribe)])
+
     def find_free_room(self, find_and_join=FindAndJoin.JOIN_ROOM, room_code="", max_stake=0):
         self.send([client_commands.FIND_FREE_ROOM, find_and_join, room_code, max_stake])
 
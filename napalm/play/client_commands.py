@@ -1,3 +1,5 @@
+from napalm.socket.protocol import CommandSchema, make_dispatch_table
+
 # Commands to manage a client
 
 # Lobby
@@ -12,6 +14,7 @@ GET_ROOM_INFO = 11
 CREATE_ROOM = 13
 EDIT_ROOM = 14
 DELETE_ROOM = 15
+SUBSCRIBE_ROOMS_LIST = 16
 # Room
 GET_GAME_INFO = 20
 GET_PLAYER_INFO = 22
@@ -39,6 +42,7 @@ DESCRIPTION_BY_CODE[GET_ROOM_INFO] = "GET_ROOM_INFO"
 DESCRIPTION_BY_CODE[CREATE_ROOM] = "CREATE_ROOM"
 DESCRIPTION_BY_CODE[EDIT_ROOM] = "EDIT_ROOM"
 DESCRIPTION_BY_CODE[DELETE_ROOM] = "DELETE_ROOM"
+DESCRIPTION_BY_CODE[SUBSCRIBE_ROOMS_LIST] = "SUBSCRIBE_ROOMS_LIST"
 
 DESCRIPTION_BY_CODE[GET_GAME_INFO] = "GET_GAME_INFO"
 DESCRIPTION_BY_CODE[GET_PLAYER_INFO] = "GET_PLAYER_INFO"
@@ -54,3 +58,46 @@ DESCRIPTION_BY_CODE[READY_TO_START] = "READY_TO_START"
 DESCRIPTION_BY_CODE[ACTION1] = "ACTION1"
 DESCRIPTION_BY_CODE[ACTION2] = "ACTION2"
 DESCRIPTION_BY_CODE[RAW_BINARY_ACTION] = "RAW_BINARY_ACTION"
+
+# Dispatch table (see GameProtocol._process_command()): CommandSchema(params as (name, type, default),
+# required params count). Handlers are GameProtocol._process_<lowered description>()
+SCHEMA_BY_CODE = dict()
+SCHEMA_BY_CODE[UPDATE_SELF_USER_INFO] = CommandSchema()
+SCHEMA_BY_CODE[GET_LOBBY_INFO_LIST] = CommandSchema()
+SCHEMA_BY_CODE[CHANGE_LOBBY] = CommandSchema([("lobby_id", int, None)])
+SCHEMA_BY_CODE[GET_ROOMS_LIST] = CommandSchema()
+# (find_and_join: FindAndJoin.JOIN_ROOM by default)
+SCHEMA_BY_CODE[FIND_FREE_ROOM] = CommandSchema([("find_and_join", int, 1), ("room_code", str, ""),
+                                                ("max_stake", float, 0)])
+SCHEMA_BY_CODE[GET_ROOM_INFO] = CommandSchema([("room_id", str, None)], 1)
+SCHEMA_BY_CODE[CREATE_ROOM] = CommandSchema([("room_info", None, None)], 1)
+SCHEMA_BY_CODE[EDIT_ROOM] = CommandSchema([("room_id", str, None), ("room_info", None, None)], 2)
+SCHEMA_BY_CODE[DELETE_ROOM] = CommandSchema([("room_id", str, None)], 1)
+# (is_subscribe: 0 to unsubscribe. Sent again to resync on sequence gap)
+SCHEMA_BY_CODE[SUBSCRIBE_ROOMS_LIST] = CommandSchema([("is_subscribe", int, 1)])
+
+SCHEMA_BY_CODE[GET_GAME_INFO] = CommandSchema([("room_id", str, None), ("is_get_room_content", int, 0)], 1)
+SCHEMA_BY_CODE[GET_PLAYER_INFO] = CommandSchema([("place_index", int, None), ("room_id", str, "")], 1)
+SCHEMA_BY_CODE[JOIN_THE_ROOM] = CommandSchema([("room_id", str, None), ("password", str, None)], 1)
+SCHEMA_BY_CODE[JOIN_THE_GAME] = CommandSchema([("room_id", str, ""), ("password", str, None),
+                                               ("place_index", int, -1), ("money_in_play", float, 0)])
+SCHEMA_BY_CODE[LEAVE_THE_GAME] = CommandSchema()
+SCHEMA_BY_CODE[LEAVE_THE_ROOM] = CommandSchema()
+SCHEMA_BY_CODE[INVITE_FRIENDS_TO_ROOM] = CommandSchema()
+SCHEMA_BY_CODE[SEND_MESSAGE] = CommandSchema([("message_type", int, None), ("text", str, None),
+                                              ("receiver_id", str, -1)], 2)
+
+SCHEMA_BY_CODE[READY_TO_START] = CommandSchema([("is_ready", int, True)])
+SCHEMA_BY_CODE[ACTION1] = CommandSchema(required_count=1, rest_param="params")
+SCHEMA_BY_CODE[ACTION2] = CommandSchema(required_count=1, rest_param="params")
+SCHEMA_BY_CODE[RAW_BINARY_ACTION] = CommandSchema([("raw_binary", str, None)], 1)
+
+make_dispatch_table(SCHEMA_BY_CODE, DESCRIPTION_BY_CODE)
+
+# Schemas for lazy parsing (see Protocol.is_lazy_parsing): indexes of params which
+# could be lists or dicts (all other params are plain str). Commands not listed
+# (with rest params, like game actions) are fully parsed
+COMPLEX_PARAM_INDEXES_BY_CODE = {code: schema.complex_param_indexes for code, schema in SCHEMA_BY_CODE.items()
+                                 if schema.complex_param_indexes is not None}
+# (Processed separately from dispatch table)
+COMPLEX_PARAM_INDEXES_BY_CODE[AUTHORIZE] = ()
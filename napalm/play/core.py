@@ -3,12 +3,14 @@ import logging as _logging
 import os
 
 from napalm.async import ThreadedTimer
+from napalm.play import client_commands
 from napalm.play.game import Game, GameConfigModel
 from napalm.play.house import HouseModel, House, Player, User
 from napalm.play.lobby import Lobby, Room, LobbyModel, RoomModel
 from napalm.play.protocol import GameProtocol
 from napalm.play.service import GameService
 from napalm.socket.parser import CommandParser
+from napalm.socket.rate_limit import RateLimit
 from napalm.socket.server import ServerConfig
 from napalm.utils import object_util
 
@@ -29,6 +31,8 @@ class HouseConfig(ServerConfig):
     # Define subclasses
     protocol_class = GameProtocol
     command_parser_class = CommandParser
+    # (BinaryCommandParser to let clients switch to binary codec)
+    binary_command_parser_class = None
     house_class = House
     lobby_class = Lobby
     room_class = Room
@@ -43,6 +47,16 @@ class HouseConfig(ServerConfig):
     room_model_class = RoomModel
     game_config_model_class = GameConfigModel
 
+    # Flood protection (see ServerConfig)
+    rate_limit_by_code = {
+        client_commands.GET_LOBBY_INFO_LIST: RateLimit(2, 5),
+        client_commands.GET_ROOMS_LIST: RateLimit(2, 5),
+        client_commands.GET_ROOM_INFO: RateLimit(5, 10),
+        client_commands.GET_GAME_INFO: RateLimit(5, 10),
+        client_commands.SEND_MESSAGE: RateLimit(1, 5),
+    }
+    total_rate_limit = RateLimit(50, 100)
+
     @staticmethod
     def dispose_models():
         GameConfigModel.dispose_models()
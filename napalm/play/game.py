@@ -186,6 +186,7 @@ class GamePlayerManagerMixIn:
         self.player_list.sort(key=lambda p: p.place_index)
         # self.logging.debug("G     AFTER sort player_list: %s", self.player_list)
         self.room_model.playing_count = len(self.player_list)
+        self.room.on_room_model_changed()
 
         self.room.send_player_joined_the_game(player)
         log_text = " ".join((player.first_name, player.last_name, "joined the game"))
@@ -216,6 +217,7 @@ class GamePlayerManagerMixIn:
         self._player_by_place_index_list = None
 
         self.room_model.playing_count = len(self.player_list)
+        self.room.on_room_model_changed()
 
         self.room.send_player_left_the_game(player)
 
@@ -8,6 +8,7 @@ import time
 from napalm.async import AbstractTimer
 from napalm.core import ExportableMixIn, ReloadableModel
 from napalm.play.protocol import MessageType
+from napalm.socket.parser import ExportedModels
 from napalm.socket.protocol import Protocol
 from napalm.utils import default_logging_setup
 
@@ -38,6 +39,11 @@ class Player(ExportableMixIn):
 
     # Proxy to user (for export_public_data())
 
+    @property
+    def version(self):
+        # (Public data depends on user's properties)
+        return self._version, self.user, self.user.version if self.user else None
+
     @property
     def user_id(self):
         return self.user.user_id if self.user else ""
@@ -731,7 +737,7 @@ class LobbyManager:
         self._lobby_list = []
         self._lobby_by_id = {}
         lobby_class = self.house_config.lobby_class
-        for lobby_model in self.house_model.lobby_model_list:
+        for lobby_model in self._get_lobby_model_shard():
             # Create
             lobby = lobby_class(self, lobby_model)
             self._lobby_list.append(lobby)
@@ -748,6 +754,20 @@ class LobbyManager:
         self.house_config = None
         self.house_model = None
 
+    def _get_lobby_model_shard(self):
+        """
+        In multi-process mode (see WorkerSupervisor) each worker owns its own part of lobbies.
+        """
+        lobby_model_list = self.house_model.lobby_model_list
+        worker_index = self.house_config.worker_index
+        worker_count = self.house_config.worker_count
+        if worker_count <= 1 or not lobby_model_list:
+            return lobby_model_list
+        if len(lobby_model_list) < worker_count:
+            # (Not enough lobbies for all workers - some lobbies are duplicated in different workers)
+            return [lobby_model_list[worker_index % len(lobby_model_list)]]
+        return lobby_model_list[worker_index::worker_count]
+
     # Protocol process methods (Lobby)
 
     def goto_lobby(self, player, lobby_id=None):
@@ -782,7 +802,7 @@ class LobbyManager:
         # self.logging.debug("L (get_lobby_info_list) house_id: %s lobby_info_list: %s",
         #                    self.house_model.house_id, self.house_model.lobby_info_list)
 
-        lobby_info_list = [lobby.lobby_model.export_public_data() for lobby in self._lobby_list]
+        lobby_info_list = ExportedModels([lobby.lobby_model for lobby in self._lobby_list])
         # lobby_info_list = [lobby.lobby_model.export_public_data()
         # for lobby in self._lobby_list if not lobby.is_paused]
         player.protocol.lobby_info_list(self.house_model.house_id, lobby_info_list)
@@ -822,10 +842,19 @@ class LobbyManager:
 
 class SaveLoadHouseStateMixIn(ExportableMixIn):
     logging = None
+    house_config = None
     house_model = None
 
     _user_by_id = None
 
+    @property
+    def state_name(self):
+        # (Each worker process saves its own state)
+        worker_count = self.house_config.worker_count if self.house_config else 1
+        if worker_count > 1:
+            return "{0}_worker{1}".format(self.house_model.house_name, self.house_config.worker_index)
+        return self.house_model.house_name
+
     # todo adopt for real circumstances (on x changes or on each y minute)
     def try_save_house_state_on_change(self):
         if self.house_model.is_save_house_state_on_any_change and not self._is_restoring_now:
@@ -839,7 +868,7 @@ class SaveLoadHouseStateMixIn(ExportableMixIn):
             return
 
         self.logging.debug("L =(SAVE_lobby_state) Start %s", self)
-        self._save_state(self.house_model.house_name, self.export_data())
+        self._save_state(self.state_name, self.export_data())
         self.logging.debug("=(save_house_state) End %s", self)
 
     def restore_house_state(self):
@@ -852,7 +881,7 @@ class SaveLoadHouseStateMixIn(ExportableMixIn):
             return
 
         self._is_restoring_now = True
-        house_data = self._load_state(self.house_model.house_name)
+        house_data = self._load_state(self.state_name)
         if house_data:
             self.import_data(house_data)
             self.logging.debug("L =(restore_house_state) End %s", self)
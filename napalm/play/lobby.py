@@ -3,9 +3,15 @@ import logging
 from napalm.core import ReloadableModel, ExportableMixIn
 from napalm.play.game import GameConfigModel
 from napalm.play.house import Player
-from napalm.play.protocol import MessageCode, MessageType, RoomType, FindAndJoin, TournamentType
-from napalm.socket.parser import CommandParser
+from napalm.play import server_commands
+from napalm.play.protocol import MessageCode, MessageType, RoomType, FindAndJoin, TournamentType, RoomsListDelta
+from napalm.socket.parser import CommandParser, ExportedModel, ExportedModels
+from napalm.socket.protocol import SendPriority, broadcast
 from napalm.utils import object_util
+from napalm.utils.trace_util import get_tracer
+
+# (For sends and room lists)
+tracer = get_tracer("LOBBY")
 
 
 # todo check goto_lobby also adds to room and game if room_id and place_index are set
@@ -209,62 +215,39 @@ class RoomSendMixIn:
     # Room
 
     def send_player_joined_the_room(self, joined_player, exclude_players=None):
-        for player in self.player_set:
-            if exclude_players and player not in exclude_players:
-                protocol = player.protocol
-                self.logging.debug("R (send_player_joined_the_room) %s %s", player, player.protocol)
-                """:type : GameProtocol"""
-                protocol.player_joined_the_room(joined_player.export_public_data())
+        if tracer.is_enabled:
+            tracer.trace("R (send_player_joined_the_room) %s", joined_player)
+        self.broadcast([server_commands.PLAYER_JOINED_THE_ROOM, ExportedModel(joined_player)],
+                       exclude_players)
 
     def send_player_joined_the_game(self, joined_player):  # , is_reconnect=False
         # if not is_reconnect:
         #     log_text = " ".join((joined_player.first_name, joined_player.last_name,
         #                         joined_player.user_id, "joined the play"))
 
-        for player in self.player_set:
-            protocol = player.protocol
-            """:type : GameProtocol"""
-            protocol.player_joined_the_game(joined_player.place_index, joined_player.export_public_data())  # , log_text
+        self.broadcast([server_commands.PLAYER_JOINED_THE_GAME, joined_player.place_index,
+                        ExportedModel(joined_player)])  # , log_text
 
     def send_player_left_the_game(self, left_player):
-        for player in self.player_set:
-            protocol = player.protocol
-            """:type : GameProtocol"""
-            protocol.player_left_the_game(left_player.place_index)
+        self.broadcast([server_commands.PLAYER_LEFT_THE_GAME, left_player.place_index])
 
     def send_player_left_the_room(self, left_player, exclude_players=None):
-        for player in self.player_set:
-            if exclude_players and player not in exclude_players:
-                protocol = player.protocol
-                """:type : GameProtocol"""
-                protocol.player_left_the_room(left_player.export_public_data())
+        self.broadcast([server_commands.PLAYER_LEFT_THE_ROOM, ExportedModel(left_player)], exclude_players)
 
     def send_message(self, message_type, text, sender_player, receiver_id=-1):
-        is_message_private = MessageType.is_message_private(message_type)
-        for player in self.player_set:
-            # if not is_message_private or receiver_id < 0 or player.user_id == receiver_id:
-            if not is_message_private or player.user_id == receiver_id:
-                player.protocol.send_message(message_type, text, sender_player, receiver_id)
+        send_message_to_players(self.player_set, message_type, text, sender_player, receiver_id)
 
     def send_log(self, log_text):
-        for player in self.player_set:
-            protocol = player.protocol
-            """:type : GameProtocol"""
-            protocol.send_log(log_text)
+        self.broadcast([server_commands.LOG, log_text], priority=SendPriority.LOW)
 
     # Game
 
     def send_ready_to_start(self, place_index, is_ready, start_game_countdown_sec):
-        for player in self.player_set:
-            protocol = player.protocol
-            """:type : GameProtocol"""
-            protocol.ready_to_start(place_index, is_ready, start_game_countdown_sec)
+        self.broadcast([server_commands.READY_TO_START, place_index, int(is_ready), start_game_countdown_sec],
+                       priority=SendPriority.HIGH)
 
     def send_reset_game(self):
-        for player in self.player_set:
-            protocol = player.protocol
-            """:type : GameProtocol"""
-            protocol.reset_game()
+        self.broadcast([server_commands.RESET_GAME], priority=SendPriority.HIGH)
 
     # todo add unittests
     def send_pause_game(self, is_paused, delay_sec=0):
@@ -276,34 +259,25 @@ class RoomSendMixIn:
         #     protocol.pause_game(is_paused, delay_sec)
 
     def send_change_player_turn(self, player_in_turn_index, turn_timeout_sec):
-        self.logging.debug("R (send_change_player_turn)  room: %s", self)
+        if tracer.is_enabled:
+            tracer.trace("R (send_change_player_turn)  room: %s", self)
         # todo move
         # if self.on_game_state_changed:
         #     self.logging.debug("R (send_change_player_turn) [try_save] room: %s", self)
         #     self.on_game_state_changed()
 
-        for player in self.player_set:
-            protocol = player.protocol
-            """:type : GameProtocol"""
-            protocol.change_player_turn(player_in_turn_index, turn_timeout_sec)
+        self.broadcast([server_commands.CHANGE_PLAYER_TURN, player_in_turn_index, turn_timeout_sec],
+                       priority=SendPriority.HIGH)
 
     def send_player_wins(self, place_index, money_win, player_money_in_play):
-        for player in self.player_set:
-            protocol = player.protocol
-            """:type : GameProtocol"""
-            protocol.player_wins(place_index, money_win, player_money_in_play)
+        self.broadcast([server_commands.PLAYER_WINS, place_index, money_win, player_money_in_play],
+                       priority=SendPriority.HIGH)
 
     def send_player_wins_the_tournament(self, place_index, money_win):
-        for player in self.player_set:
-            protocol = player.protocol
-            """:type : GameProtocol"""
-            protocol.player_wins_the_tournament(place_index, money_win)
+        self.broadcast([server_commands.PLAYER_WINS_THE_TOURNAMENT, place_index, money_win], priority=SendPriority.HIGH)
 
     def send_update1(self, *args):
-        for player in self.player_set:
-            protocol = player.protocol
-            """:type : GameProtocol"""
-            protocol.update1(*args)
+        self.broadcast([server_commands.UPDATE1] + list(args), priority=SendPriority.HIGH)
 
     # ?? if private - remove
     def send_update2(self, *args):
@@ -313,10 +287,7 @@ class RoomSendMixIn:
             protocol.update2(*args)
 
     def send_raw_binary_update(self, raw_binary):
-        for player in self.player_set:
-            protocol = player.protocol
-            """:type : GameProtocol"""
-            protocol.raw_binary_update(raw_binary)
+        self.broadcast([server_commands.RAW_BINARY_UPDATE, raw_binary], priority=SendPriority.HIGH)
 
     # todo unittests
     def send_player_sit_out(self, place_index, value):
@@ -325,6 +296,28 @@ class RoomSendMixIn:
             """:type: PokerProtocol"""
             protocol.player_sit_out(place_index, value)
 
+    def broadcast(self, command, exclude_players=None, get_player_command=None, priority=SendPriority.NORMAL):
+        """
+        Send command to all players in room making it only once.
+        :param get_player_command: function(player) which returns command with private
+        data for given player or None to send common command
+        :param priority: SendPriority
+        """
+        protocols = [player.protocol for player in self.player_set
+                     if not exclude_players or player not in exclude_players]
+        get_private_command = (lambda protocol: get_player_command(protocol.player)) if get_player_command else None
+        broadcast(protocols, command, get_private_command=get_private_command, priority=priority)
+
+
+def send_message_to_players(players, message_type, text, sender_player, receiver_id=-1):
+    command = [server_commands.MESSAGE, message_type, text, sender_player.user_id, 0]
+    if receiver_id >= 0:
+        command.append(receiver_id)
+    if MessageType.is_message_private(message_type):
+        # (Only to receiver)
+        players = [player for player in players if player.user_id == receiver_id]
+    broadcast([player.protocol for player in players], command, priority=SendPriority.LOW)
+
 
 class Room(RoomSendMixIn, ExportableMixIn):
     logging = None
@@ -512,6 +505,7 @@ class Room(RoomSendMixIn, ExportableMixIn):
         self.player_set.add(player)
         self.player_by_user_id[player.user_id] = player
         self.room_model.total_player_count += 1
+        self.on_room_model_changed()
 
         self.logging.debug("R temp self.player_set.add player: %s", player)
         if not self.game:
@@ -542,6 +536,7 @@ class Room(RoomSendMixIn, ExportableMixIn):
             self.player_by_user_id.pop(player.user_id)
             player.room = None
             self.room_model.total_player_count -= 1
+            self.on_room_model_changed()
 
             # Send
             player.protocol.confirm_left_the_room()
@@ -572,6 +567,11 @@ class Room(RoomSendMixIn, ExportableMixIn):
         for player in list(self.player_set):
             self.remove_player(player)
 
+    def on_room_model_changed(self):
+        # (Update room lists of subscribed players)
+        if self.lobby:
+            self.lobby.on_room_changed(self)
+
     # Game
 
     def check_and_apply_changes(self):
@@ -579,6 +579,7 @@ class Room(RoomSendMixIn, ExportableMixIn):
         if (not self.game or not self.game.is_in_progress) and self.room_model.is_changed:
             # Apply
             self.room_model.apply_changes()
+            self.on_room_model_changed()
             # Inform about
             for player in self.player_set:
                 self.lobby.get_room_info(player, self.room_id)
@@ -715,6 +716,11 @@ class RoomManager:
         self.room_by_id = {}
         self.room_list = []
 
+        # Room list subscriptions: players get updates (deltas) instead of requesting whole list
+        self._room_list_sequence_by_player = {}
+        # (Last sent state of rooms to find changes: {room_id: (version, public_data)})
+        self._room_state_by_id = {}
+
         # Create rooms
         for room_model in self.lobby_model.available_room_models:
             self._create_room(room_model)
@@ -725,6 +731,8 @@ class RoomManager:
             room.dispose()
         self.room_by_id = {}
         self.room_list = []
+        self._room_list_sequence_by_player.clear()
+        self._room_state_by_id.clear()
 
         # Model
         self.house_config = None
@@ -736,13 +744,20 @@ class RoomManager:
 
     # List to be serialized
     def rooms_export_public_data(self, for_player=None):
+        return [room_model.export_public_data() for room_model in self.get_visible_room_models(for_player)]
+
+    def get_visible_room_models(self, for_player=None):
         # todo consider private rooms for friends
         #  if is_show_for_friends then all user_ids of friends should be mentioned in room_model (?)
-        self.logging.debug("L rooms_export_data room_by_id: %s room_list: %s", self.room_by_id, self.room_list)
-        return [room.room_model.export_public_data() for room in self.room_list
-                # Show private rooms only for owner
-                if not room.room_model.is_private or
-                (for_player and room.room_model.owner_user_id == for_player.user_id)]
+        if tracer.is_enabled and tracer.is_sampled():
+            # (Copied, as args are formatted later in another thread)
+            tracer.trace("L rooms_export_data room_by_id: %s room_list: %s", dict(self.room_by_id),
+                         list(self.room_list))
+        return [room.room_model for room in self.room_list if self._is_room_visible(room.room_model, for_player)]
+
+    def _is_room_visible(self, room_model, for_player=None):
+        # Show private rooms only for owner
+        return not room_model.is_private or bool(for_player and room_model.owner_user_id == for_player.user_id)
 
     # Create/remove
 
@@ -782,6 +797,7 @@ class RoomManager:
         # -self.room_list.sort(key=lambda room:
         #     int(room.room_id) if str(room.room_id).isdigit() else room.room_id)
 
+        self.on_room_changed(room)
         return room
 
     def _create_room_model(self, room_info_or_model):
@@ -835,6 +851,9 @@ class RoomManager:
             self.room_list.remove(room)
             room.lobby = None
 
+            if self._room_state_by_id.pop(room.room_id, None):
+                self._send_room_list_delta(room.room_model, RoomsListDelta.ROOM_REMOVED, room.room_id)
+
     # Commands for protocol
     # (Create/Remove rooms)
 
@@ -895,7 +914,60 @@ class RoomManager:
         return room
 
     def get_room_list(self, player):
-        player.protocol.rooms_list(self.rooms_export_public_data(player))
+        # (Serialized data of unchanged rooms is cached by parser)
+        player.protocol.rooms_list(ExportedModels(self.get_visible_room_models(player)))
+
+    # (Room list subscriptions)
+
+    def subscribe_to_room_list(self, player):
+        """
+        Send whole room list and then only changes of it (see RoomsListDelta).
+        Called again by client to resync if sequence gap detected.
+        """
+        if not self._room_list_sequence_by_player:
+            # (Changes are not tracked without subscribers)
+            self._room_state_by_id = {room.room_id: (room.room_model.version, room.room_model.export_public_data())
+                                      for room in self.room_list}
+
+        sequence = self._room_list_sequence_by_player.get(player, 0) + 1
+        self._room_list_sequence_by_player[player] = sequence
+        player.protocol.rooms_list(ExportedModels(self.get_visible_room_models(player)), sequence)
+
+    def unsubscribe_from_room_list(self, player):
+        self._room_list_sequence_by_player.pop(player, None)
+        if not self._room_list_sequence_by_player:
+            self._room_state_by_id.clear()
+
+    def on_room_changed(self, room):
+        if not self._room_list_sequence_by_player:
+            return
+
+        room_model = room.room_model
+        version = room_model.version
+        version_and_data = self._room_state_by_id.get(room.room_id)
+        if version_and_data and version_and_data[0] == version:
+            return
+
+        data = room_model.export_public_data()
+        self._room_state_by_id[room.room_id] = (version, data)
+        if not version_and_data:
+            self._send_room_list_delta(room_model, RoomsListDelta.ROOM_ADDED, data)
+            return
+
+        # Changed properties only
+        changes = [room.room_id]
+        for index, (prev_value, value) in enumerate(zip(version_and_data[1], data)):
+            if value != prev_value:
+                changes.append(index)
+                changes.append(value)
+        if len(changes) > 1:
+            self._send_room_list_delta(room_model, RoomsListDelta.ROOM_CHANGED, changes)
+
+    def _send_room_list_delta(self, room_model, delta_type, delta_data):
+        for player, sequence in self._room_list_sequence_by_player.items():
+            if self._is_room_visible(room_model, player):
+                self._room_list_sequence_by_player[player] = sequence + 1
+                player.protocol.rooms_list_delta(sequence + 1, delta_type, delta_data)
 
     def find_free_room(self, player, find_and_join=FindAndJoin.JOIN_ROOM, game_id=-1,
                        game_variation=None, game_type=-1, room_type=-1, max_stake=0):
@@ -1183,7 +1255,7 @@ class Lobby(RoomManager, ExportableMixIn):
         self.present_player_set.add(player)
 
         # (On restore player is not connected, so it won't be a problem to send goto_lobby while in game)
-        player.protocol.goto_lobby(self.lobby_model.export_public_data())
+        player.protocol.goto_lobby(ExportedModel(self.lobby_model))
 
         # Restore in room and game (if player is restoring: after reconnect or server recovered)
         if player.room_id:
@@ -1197,6 +1269,7 @@ class Lobby(RoomManager, ExportableMixIn):
             return
 
         self.leave_the_room(player)
+        self.unsubscribe_from_room_list(player)
 
         if player in self.present_player_set:
             self.present_player_set.remove(player)
@@ -1204,8 +1277,4 @@ class Lobby(RoomManager, ExportableMixIn):
         player.lobby = None
 
     def send_message(self, message_type, text, sender_player, receiver_id=-1):
-        is_message_private = MessageType.is_message_private(message_type)
-        for player in self.present_player_set:
-            # if not is_message_private or receiver_id < 0 or player.user_id == receiver_id:
-            if not is_message_private or player.user_id == receiver_id:
-                player.protocol.send_message(message_type, text, sender_player, receiver_id)
+        send_message_to_players(self.present_player_set, message_type, text, sender_player, receiver_id)
@@ -3,7 +3,11 @@ import hashlib
 import time
 
 from napalm.play import server_commands, client_commands
-from napalm.socket.protocol import Protocol, ServerProtocol
+from napalm.socket.protocol import Protocol, SendPriority, ServerProtocol
+from napalm.utils.trace_util import get_tracer
+
+# (For each command)
+tracer = get_tracer("GAME-PROTOCOL")
 
 
 """
@@ -60,6 +64,15 @@ class FindAndJoin:
     JOIN_GAME = 2
 
 
+class RoomsListDelta:
+    # (Data: room_info)
+    ROOM_ADDED = 0
+    # (Data: room_id)
+    ROOM_REMOVED = 1
+    # (Data: [room_id, property_index1, value1, property_index2, value2, ...])
+    ROOM_CHANGED = 2
+
+
 class MessageCode:
     # todo move to language.json
     JOIN_ROOM_FAIL_TITLE = "{join_room_fail_title}"
@@ -81,6 +94,10 @@ class GameProtocol(ServerProtocol):
     CLIENT_COMMAND_DESCRIPTION_BY_CODE = client_commands.DESCRIPTION_BY_CODE
     SERVER_COMMAND_DESCRIPTION_BY_CODE = server_commands.DESCRIPTION_BY_CODE
 
+    is_lazy_parsing = True
+    CLIENT_COMMAND_COMPLEX_PARAM_INDEXES_BY_CODE = client_commands.COMPLEX_PARAM_INDEXES_BY_CODE
+    CLIENT_COMMAND_SCHEMA_BY_CODE = client_commands.SCHEMA_BY_CODE
+
     def __init__(self, send_bytes_method=None, close_connection_method=None, address=None, config=None, app=None):
         super().__init__(send_bytes_method, close_connection_method, address, config, app)
 
@@ -167,168 +184,128 @@ class GameProtocol(ServerProtocol):
                                "house: %s player: %s", self.house, self.player)
             return
 
-        self.logging.debug(self.protocol_id + "info (_process_command) command_code: %s"
-                                              "command_params: %s params_count: %s", command_code, command_params,
-                           params_count)
+        if tracer.is_enabled and tracer.is_sampled():
+            tracer.trace("%s info (_process_command) command_code: %s command_params: %s params_count: %s",
+                         self.protocol_id, command_code, command_params, params_count)
         if self.house.is_paused:
             self.logging.warning("House is paused! Skip.")
             return None
 
-        # Lobby
-        if command_code == client_commands.UPDATE_SELF_USER_INFO:
-            self.player.update_self_user_info()
-        elif command_code == client_commands.GET_LOBBY_INFO_LIST:
-            self.player.house.get_lobby_info_list(self.player)
-        elif command_code == client_commands.CHANGE_LOBBY:
-            # Client should reconnect to another server by himself
-            lobby_id = None if params_count <= 1 else int(command_params[1])
-            self.player.house.goto_lobby(self.player, lobby_id)
-        elif command_code == client_commands.GET_ROOMS_LIST:
-            # todo?-
-            # room_code = "" if params_count <= 1 else command_params[1]
-            # game_id, game_variation, game_type, room_type = self.parser.parse_room_code(room_code)
-
-            self.player.lobby.get_room_list(self.player)  # , game_id, game_type, room_type)
-        elif command_code == client_commands.FIND_FREE_ROOM:
-            find_and_join = FindAndJoin.JOIN_ROOM if params_count <= 1 else int(command_params[1])
-            room_code = "" if params_count <= 2 else command_params[2]
-            # todo add in client
-            max_stake = 0 if params_count <= 3 else float(command_params[3])
-
-            # room_code="1_H_10_0" | "1___0" | "1_H_10_0" | "1_H_" |  "1" | ...
-            game_id, game_variation, game_type, room_type = self.parser.parse_room_code(room_code)
-
-            self.player.lobby.find_free_room(self.player, find_and_join, game_id, game_variation, game_type, room_type, max_stake)
-        elif command_code == client_commands.GET_ROOM_INFO:
-            if params_count > 1:
-                room_id = command_params[1]
-                self.player.lobby.get_room_info(self.player, room_id)
-            else:
-                self.logging.warning(self.protocol_id + "WARNING! (process_command) Wrong params. command_params: %s",
-                                     command_params)
-        elif command_code == client_commands.CREATE_ROOM:
-            if params_count > 1:
-                room_info = command_params[1]
-                self.player.lobby.create_room(self.player, room_info)
-            else:
-                self.logging.warning(self.protocol_id + "WARNING! (process_command) Wrong params. command_params: %s",
-                                     command_params)
-        elif command_code == client_commands.EDIT_ROOM:
-            if params_count > 2:
-                room_id = command_params[1]
-                room_info = command_params[2]
-                self.player.lobby.edit_room(self.player, room_id, room_info)
-            else:
-                self.logging.warning(self.protocol_id + "WARNING! (process_command) Wrong params. command_params: %s",
-                                     command_params)
-        elif command_code == client_commands.DELETE_ROOM:
-            if params_count > 2:
-                room_id = command_params[1]
-                self.player.lobby.delete_room(self.player, room_id)
-
-        # Room
-        elif command_code == client_commands.GET_GAME_INFO:
-            if params_count > 1:
-                room_id = command_params[1]
-                is_get_room_content = 0 if params_count <= 2 else int(command_params[2])
-                self.player.lobby.get_game_info(self.player, room_id, is_get_room_content)
-            else:
-                self.logging.warning(self.protocol_id + "WARNING! (process_command) Wrong params. "
-                                                        "command_params: %s player: %s",
-                                     command_params, self.player)
-        elif command_code == client_commands.GET_PLAYER_INFO:
-            if params_count > 1:
-                place_index = int(command_params[1])
-                room_id = "" if params_count <= 2 else command_params[2]
-                if self.player.game:
-                    self.player.game.get_player_info(self.player, place_index)
-                elif room_id:
-                    self.player.lobby.get_player_info_in_game(self.player, room_id, place_index)
-                else:
-                    self.logging.warning(self.protocol_id + "WARNING! (process_command) Cannot get player info."
-                                                            "player.play: %s room_id: %s command_params: %s player: %s",
-                                         self.player.game, room_id, command_params, self.player)
-            else:
-                self.logging.warning(self.protocol_id + "WARNING! (process_command) Wrong params. "
-                                                        "command_params: %s player: %s", command_params, self.player)
-        elif command_code == client_commands.JOIN_THE_ROOM:
-            if params_count > 1:
-                room_id = command_params[1]
-                password = None if params_count <= 2 else command_params[2]
-                self.player.lobby.join_the_room(self.player, room_id, password)
-            else:
-                self.logging.warning(self.protocol_id + "WARNING! (process_command) Wrong params. "
-                                                        "command_params: %s player: %s", command_params, self.player)
-        elif command_code == client_commands.JOIN_THE_GAME:
-            room_id = "" if params_count <= 1 else command_params[1]
-            password = None if params_count <= 2 else command_params[2]
-            place_index = -1 if params_count <= 3 else int(command_params[3])
-            money_in_play = 0 if params_count <= 4 else float(command_params[4])
-            self.player.lobby.join_the_game(self.player, room_id, password, place_index, money_in_play)
-        elif command_code == client_commands.LEAVE_THE_GAME:
-            self.player.lobby.leave_the_game(self.player)
-        elif command_code == client_commands.LEAVE_THE_ROOM:
-            self.player.lobby.leave_the_room(self.player)
-        elif command_code == client_commands.INVITE_FRIENDS_TO_ROOM:
-            pass  # todo
-        elif command_code == client_commands.SEND_MESSAGE:
-            if params_count > 2:
-                message_type = int(command_params[1])
-                text = command_params[2]
-                receiver_id = command_params[3] if params_count > 3 else -1
-
-                # (Protocol -> House -> Room|Lobby -> player.protocol)
-                self.player.house.send_message(message_type, text, self.player, receiver_id, True)
-            else:
-                self.logging.warning(self.protocol_id + "WARNING! (process_command) Wrong params. "
-                                                        "command_params: %s player: %s", command_params, self.player)
-
-        # Game
-        elif command_code == client_commands.READY_TO_START:
-            is_ready = int(command_params[1]) if params_count > 1 else True
-            if self.player.game:
-                self.player.game.ready_to_start(self.player, is_ready)
-            else:
-                self.logging.warning(self.protocol_id +
-                                     "WARNING! (process_command) Player is not in play. "
-                                     "command_params: %s game: %s player: %s",
-                                     command_params, self.player.game, self.player)
-        elif command_code == client_commands.ACTION1:
-            if params_count > 1 and self.player.game:
-                self.player.game.action1(command_params[1:])
-            else:
-                self.logging.warning(self.protocol_id +
-                                     "WARNING! (process_command) Player is not in play or wrong params. "
-                                     "command_params: %s play: %s player: %s", command_params, self.player.game,
-                                     self.player)
-        elif command_code == client_commands.ACTION2:
-            if params_count > 1 and self.player.game:
-                self.player.game.action2(command_params[1:])
-            else:
-                self.logging.warning(self.protocol_id +
-                                     "WARNING! (process_command) Player is not in play or wrong params.",
-                                     "command_params: %s play: %s player: %s", command_params, self.player.game,
-                                     self.player)
-        elif command_code == client_commands.RAW_BINARY_ACTION:
-            if params_count > 1 and self.player.game:
-                raw_binary = command_params[1]
-                self.player.game.process_raw_binary_action(raw_binary)
-            else:
-                self.logging.warning(self.protocol_id +
-                                     "WARNING! (process_command) Player is not in play or wrong params.",
-                                     "command_params: %s play: %s player: %s", command_params, self.player.game,
-                                     self.player)
-
-        # Default
-        # else:
-        #     self.logging.warning(self.protocol_id, "WARNING! (process_command) Unknown command!", "command_params:", command_params,
-        #           "player:", self.player)
-        #     # demo
-        #     result = "[Unknown command: " + str(command_params) + "]"
-        #     # parser.PARAMS_DELIM.join(command_params).upper()
-        #     self.send([result])
-
-        super()._parse_command(command_code, command_params, params_count)
+        # (O(1) dispatch with params decoded by client_commands.SCHEMA_BY_CODE)
+        if not self._dispatch_command(command_code, command_params, params_count):
+            self.logging.warning("%s WARNING! (process_command) Unknown command! command_params: %s player: %s",
+                                 self.protocol_id, command_params, self.player)
+
+        super()._process_command(command_code, command_params, params_count)
+
+    # Lobby
+
+    def _process_update_self_user_info(self):
+        self.player.update_self_user_info()
+
+    def _process_get_lobby_info_list(self):
+        self.player.house.get_lobby_info_list(self.player)
+
+    def _process_change_lobby(self, lobby_id):
+        # Client should reconnect to another server by himself
+        self.player.house.goto_lobby(self.player, lobby_id)
+
+    def _process_get_rooms_list(self):
+        # todo?-
+        # game_id, game_variation, game_type, room_type = self.parser.parse_room_code(room_code)
+        self.player.lobby.get_room_list(self.player)  # , game_id, game_type, room_type)
+
+    def _process_subscribe_rooms_list(self, is_subscribe):
+        if is_subscribe:
+            self.player.lobby.subscribe_to_room_list(self.player)
+        else:
+            self.player.lobby.unsubscribe_from_room_list(self.player)
+
+    def _process_find_free_room(self, find_and_join, room_code, max_stake):
+        # todo add max_stake in client
+        # room_code="1_H_10_0" | "1___0" | "1_H_10_0" | "1_H_" |  "1" | ...
+        game_id, game_variation, game_type, room_type = self.parser.parse_room_code(room_code)
+
+        self.player.lobby.find_free_room(self.player, find_and_join, game_id, game_variation, game_type, room_type,
+                                         max_stake)
+
+    def _process_get_room_info(self, room_id):
+        self.player.lobby.get_room_info(self.player, room_id)
+
+    def _process_create_room(self, room_info):
+        self.player.lobby.create_room(self.player, room_info)
+
+    def _process_edit_room(self, room_id, room_info):
+        self.player.lobby.edit_room(self.player, room_id, room_info)
+
+    def _process_delete_room(self, room_id):
+        self.player.lobby.delete_room(self.player, room_id)
+
+    # Room
+
+    def _process_get_game_info(self, room_id, is_get_room_content):
+        self.player.lobby.get_game_info(self.player, room_id, is_get_room_content)
+
+    def _process_get_player_info(self, place_index, room_id):
+        if self.player.game:
+            self.player.game.get_player_info(self.player, place_index)
+        elif room_id:
+            self.player.lobby.get_player_info_in_game(self.player, room_id, place_index)
+        else:
+            self.logging.warning("%s WARNING! (process_command) Cannot get player info. "
+                                 "player.play: %s room_id: %s player: %s",
+                                 self.protocol_id, self.player.game, room_id, self.player)
+
+    def _process_join_the_room(self, room_id, password):
+        self.player.lobby.join_the_room(self.player, room_id, password)
+
+    def _process_join_the_game(self, room_id, password, place_index, money_in_play):
+        self.player.lobby.join_the_game(self.player, room_id, password, place_index, money_in_play)
+
+    def _process_leave_the_game(self):
+        self.player.lobby.leave_the_game(self.player)
+
+    def _process_leave_the_room(self):
+        self.player.lobby.leave_the_room(self.player)
+
+    def _process_invite_friends_to_room(self):
+        pass  # todo
+
+    def _process_send_message(self, message_type, text, receiver_id):
+        # (Protocol -> House -> Room|Lobby -> player.protocol)
+        self.player.house.send_message(message_type, text, self.player, receiver_id, True)
+
+    # Game
+
+    def _process_ready_to_start(self, is_ready):
+        if self.player.game:
+            self.player.game.ready_to_start(self.player, is_ready)
+        else:
+            self.logging.warning("%s WARNING! (process_command) Player is not in play. game: %s player: %s",
+                                 self.protocol_id, self.player.game, self.player)
+
+    def _process_action1(self, params):
+        if self.player.game:
+            self.player.game.action1(params)
+        else:
+            self.logging.warning("%s WARNING! (process_command) Player is not in play. params: %s player: %s",
+                                 self.protocol_id, params, self.player)
+
+    def _process_action2(self, params):
+        if self.player.game:
+            self.player.game.action2(params)
+        else:
+            self.logging.warning("%s WARNING! (process_command) Player is not in play. params: %s player: %s",
+                                 self.protocol_id, params, self.player)
+
+    def _process_raw_binary_action(self, raw_binary):
+        if self.player.game:
+            self.player.game.process_raw_binary_action(raw_binary)
+        else:
+            self.logging.warning("%s WARNING! (process_command) Player is not in play. player: %s",
+                                 self.protocol_id, self.player)
+
+    # Send
 
     def _send_authorize_result(self, code, body):
         self.send([server_commands.AUTHORIZE_RESULT, code, body])
@@ -340,10 +317,26 @@ class GameProtocol(ServerProtocol):
         self.send([server_commands.GOTO_LOBBY, lobby_info])
 
     def lobby_info_list(self, house_id, lobby_info_list):
-        self.send([server_commands.LOBBY_INFO_LIST, house_id, lobby_info_list])
-
-    def rooms_list(self, room_info_list):
-        self.send([server_commands.ROOMS_LIST, room_info_list])
+        # (Only latest list is sent to slow client)
+        self.send([server_commands.LOBBY_INFO_LIST, house_id, lobby_info_list], priority=SendPriority.LOW,
+                  merge_key=server_commands.LOBBY_INFO_LIST)
+
+    def rooms_list(self, room_info_list, sequence=None):
+        # (sequence is sent only to subscribed clients, see rooms_list_delta())
+        if sequence is None:
+            self.send([server_commands.ROOMS_LIST, room_info_list], priority=SendPriority.LOW,
+                      merge_key=server_commands.ROOMS_LIST)
+        else:
+            # (Not merged to keep order of sequence)
+            self.send([server_commands.ROOMS_LIST, room_info_list, sequence], priority=SendPriority.LOW)
+
+    def rooms_list_delta(self, sequence, delta_type, delta_data):
+        """
+        Update of rooms list for subscribed client (see RoomsListDelta).
+        :param sequence: incremented by 1 for each rooms_list() and rooms_list_delta(),
+        so client should resubscribe (and get full rooms list) on gaps
+        """
+        self.send([server_commands.ROOMS_LIST_DELTA, sequence, delta_type, delta_data], priority=SendPriority.LOW)
 
     def room_info(self, room_info, player_info_list=None):
         """
@@ -407,7 +400,7 @@ class GameProtocol(ServerProtocol):
                 return
             command_params.append(receiver_id)
 
-        self.send(command_params)
+        self.send(command_params, priority=SendPriority.LOW)
 
     def show_ok_message_dialog(self, title, text):
         self._show_message_dialog(MessageType.MSG_DLG_TYPE_OK, title, text)
@@ -419,32 +412,34 @@ class GameProtocol(ServerProtocol):
         self.send([server_commands.SHOW_MESSAGE_DIALOG, dialog_type, title, text])
 
     def send_log(self, log_text):
-        self.send([server_commands.LOG, log_text])
+        self.send([server_commands.LOG, log_text], priority=SendPriority.LOW)
 
     def ready_to_start(self, place_index, is_ready, start_game_countdown_sec):
-        self.send([server_commands.READY_TO_START, place_index, int(is_ready), start_game_countdown_sec])
+        self.send([server_commands.READY_TO_START, place_index, int(is_ready), start_game_countdown_sec],
+                  priority=SendPriority.HIGH)
 
     def reset_game(self):
-        self.send([server_commands.RESET_GAME])
+        self.send([server_commands.RESET_GAME], priority=SendPriority.HIGH)
 
     def change_player_turn(self, place_index, turn_timeout_sec):
-        self.send([server_commands.CHANGE_PLAYER_TURN, place_index, turn_timeout_sec])
+        self.send([server_commands.CHANGE_PLAYER_TURN, place_index, turn_timeout_sec], priority=SendPriority.HIGH)
 
     # ???- place_index
     def show_cashbox_dialog(self):  # , place_index
         self.send([server_commands.SHOW_CASHBOX_DIALOG])  # , place_index])
 
     def player_wins(self, place_index, money_win, player_money_in_play):
-        self.send([server_commands.PLAYER_WINS, place_index, money_win, player_money_in_play])
+        self.send([server_commands.PLAYER_WINS, place_index, money_win, player_money_in_play],
+                  priority=SendPriority.HIGH)
 
     def player_wins_the_tournament(self, place_index, money_win):
-        self.send([server_commands.PLAYER_WINS_THE_TOURNAMENT, place_index, money_win])
+        self.send([server_commands.PLAYER_WINS_THE_TOURNAMENT, place_index, money_win], priority=SendPriority.HIGH)
 
     def update1(self, *args):
-        self.send([server_commands.UPDATE1] + args)
+        self.send([server_commands.UPDATE1] + args, priority=SendPriority.HIGH)
 
     def update2(self, *args):
-        self.send([server_commands.UPDATE2] + args)
+        self.send([server_commands.UPDATE2] + args, priority=SendPriority.HIGH)
 
     def raw_binary_update(self, raw_binary):
-        self.send([server_commands.RAW_BINARY_UPDATE, raw_binary])
+        self.send([server_commands.RAW_BINARY_UPDATE, raw_binary], priority=SendPriority.HIGH)
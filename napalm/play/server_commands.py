@@ -1,3 +1,5 @@
+from napalm.socket.protocol import CommandSchema, make_dispatch_table
+
 # Commands to manage a server
 
 # Lobby
@@ -7,6 +9,7 @@ UPDATE_SELF_USER_INFO = 4
 LOBBY_INFO_LIST = 6
 ROOMS_LIST = 9
 ROOM_INFO = 12
+ROOMS_LIST_DELTA = 17
 # Room
 GAME_INFO = 21
 PLAYER_INFO = 23
@@ -38,6 +41,7 @@ DESCRIPTION_BY_CODE[UPDATE_SELF_USER_INFO] = "UPDATE_SELF_USER_INFO"
 DESCRIPTION_BY_CODE[LOBBY_INFO_LIST] = "LOBBY_INFO_LIST"
 DESCRIPTION_BY_CODE[ROOMS_LIST] = "ROOMS_LIST"
 DESCRIPTION_BY_CODE[ROOM_INFO] = "ROOM_INFO"
+DESCRIPTION_BY_CODE[ROOMS_LIST_DELTA] = "ROOMS_LIST_DELTA"
 
 DESCRIPTION_BY_CODE[GAME_INFO] = "GAME_INFO"
 DESCRIPTION_BY_CODE[PLAYER_INFO] = "PLAYER_INFO"
@@ -62,3 +66,43 @@ DESCRIPTION_BY_CODE[PLAYER_WINS_THE_TOURNAMENT] = "PLAYER_WINS_THE_TOURNAMENT"
 DESCRIPTION_BY_CODE[UPDATE1] = "UPDATE1"
 DESCRIPTION_BY_CODE[UPDATE2] = "UPDATE2"
 DESCRIPTION_BY_CODE[RAW_BINARY_UPDATE] = "RAW_BINARY_UPDATE"
+
+# Dispatch table (see GameClientProtocol._process_command()): CommandSchema(params as (name, type, default),
+# required params count). Handlers are GameClientProtocol._process_<lowered description>()
+SCHEMA_BY_CODE = dict()
+SCHEMA_BY_CODE[GOTO_LOBBY] = CommandSchema([("lobby_info", None, None)], 1)
+SCHEMA_BY_CODE[UPDATE_SELF_USER_INFO] = CommandSchema([("self_user_info", None, None)], 1)
+SCHEMA_BY_CODE[LOBBY_INFO_LIST] = CommandSchema([("house_id", str, None), ("lobby_info_list", None, None)], 2)
+# (sequence: only if subscribed, see SUBSCRIBE_ROOMS_LIST)
+SCHEMA_BY_CODE[ROOMS_LIST] = CommandSchema([("room_info_list", None, None), ("sequence", int, None)], 1)
+SCHEMA_BY_CODE[ROOM_INFO] = CommandSchema([("room_info", None, None), ("player_info_list", None, None)], 1)
+SCHEMA_BY_CODE[ROOMS_LIST_DELTA] = CommandSchema([("sequence", int, None), ("delta_type", int, None),
+                                                  ("delta_data", None, None)], 3)
+
+SCHEMA_BY_CODE[GAME_INFO] = CommandSchema([("game_info", None, None), ("player_info_list", None, None)], 1)
+SCHEMA_BY_CODE[PLAYER_INFO] = CommandSchema([("place_index", int, None), ("player_info", None, None)], 2)
+SCHEMA_BY_CODE[CONFIRM_JOINED_THE_ROOM] = CommandSchema([("room_info", None, None)], 1)
+SCHEMA_BY_CODE[PLAYER_JOINED_THE_ROOM] = CommandSchema([("player_info", None, None)], 1)
+SCHEMA_BY_CODE[PLAYER_JOINED_THE_GAME] = CommandSchema([("place_index", int, None), ("player_info", None, None)], 2)
+SCHEMA_BY_CODE[PLAYER_LEFT_THE_GAME] = CommandSchema([("place_index", int, None)], 1)
+SCHEMA_BY_CODE[CONFIRM_LEFT_THE_ROOM] = CommandSchema()
+SCHEMA_BY_CODE[PLAYER_LEFT_THE_ROOM] = CommandSchema([("user_id", str, None)], 1)
+SCHEMA_BY_CODE[MESSAGE] = CommandSchema([("message_type", int, None), ("text", str, None), ("sender_id", str, None),
+                                         ("color_index", int, None), ("receiver_id", str, None)], 4)
+SCHEMA_BY_CODE[SHOW_MESSAGE_DIALOG] = CommandSchema([("dialog_type", int, None), ("title", str, None),
+                                                     ("text", str, None)], 3)
+SCHEMA_BY_CODE[LOG] = CommandSchema([("log_text", str, None)], 1)
+
+SCHEMA_BY_CODE[READY_TO_START] = CommandSchema([("place_index", int, None), ("is_ready", int, None),
+                                                ("start_game_countdown_sec", int, None)], 3)
+SCHEMA_BY_CODE[RESET_GAME] = CommandSchema()
+SCHEMA_BY_CODE[CHANGE_PLAYER_TURN] = CommandSchema([("place_index", int, None), ("turn_timeout_sec", int, None)], 2)
+SCHEMA_BY_CODE[SHOW_CASHBOX_DIALOG] = CommandSchema()
+SCHEMA_BY_CODE[PLAYER_WINS] = CommandSchema([("place_index", int, None), ("money_win", float, None),
+                                             ("player_money_in_play", float, None)], 3)
+SCHEMA_BY_CODE[PLAYER_WINS_THE_TOURNAMENT] = CommandSchema([("place_index", int, None), ("money_win", float, None)], 2)
+SCHEMA_BY_CODE[UPDATE1] = CommandSchema(rest_param="args")
+# (RAW_BINARY_UPDATE has the same code as UPDATE2, so it's processed as UPDATE2)
+SCHEMA_BY_CODE[UPDATE2] = CommandSchema(rest_param="args", handler_name="_process_update2")
+
+make_dispatch_table(SCHEMA_BY_CODE, DESCRIPTION_BY_CODE)
@@ -1,2 +1,79 @@
+from unittest import TestCase
+from unittest.mock import Mock
 
+from napalm.play import server_commands, client_commands
+from napalm.play.client import GameClientProtocol, ClientPlayer
+from napalm.play.protocol import RoomsListDelta
 
+
+class TestGameClientProtocol(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.protocol = GameClientProtocol(app=Mock())
+        self.protocol.send = Mock()
+        self.protocol.player = ClientPlayer(["123"], self.protocol)
+
+    def test_dispatch_table(self):
+        for command_code, schema in server_commands.SCHEMA_BY_CODE.items():
+            self.assertTrue(callable(getattr(self.protocol, schema.handler_name)), schema)
+
+    def test_process_command(self):
+        self.protocol.on_goto_lobby = Mock()
+        self.protocol.on_rooms_list = Mock()
+        self.protocol.on_message = Mock()
+        self.protocol.on_player_wins_the_tournament = Mock()
+        self.protocol.on_update1 = Mock()
+
+        self.protocol._process_command(server_commands.GOTO_LOBBY, ["3", ["1", "Lobby 1"]], 2)
+
+        self.assertEqual(self.protocol.player.lobby.lobby_id, "1")
+        self.protocol.on_goto_lobby.assert_called_once_with(self.protocol.player.lobby)
+
+        self.protocol._process_command(server_commands.ROOMS_LIST, ["9", [["1", "Room 1"], ["2", "Room 2"]]], 2)
+
+        self.assertEqual([room.room_id for room in self.protocol.player.lobby.rooms], ["1", "2"])
+        self.protocol.on_rooms_list.assert_called_once_with(self.protocol.player.lobby.rooms)
+        self.assertIsNone(self.protocol.rooms_list_sequence)
+
+        # Params decoded by schema
+        self.protocol._process_command(server_commands.MESSAGE, ["37", "1", "hello", "123", "2"], 5)
+
+        self.protocol.on_message.assert_called_once_with(1, "hello", "123", 2, None)
+
+        # (Wrong params - rejected)
+        self.protocol._process_command(server_commands.PLAYER_WINS_THE_TOURNAMENT, ["44", "abc", "10"], 3)
+        self.protocol._process_command(server_commands.PLAYER_WINS_THE_TOURNAMENT, ["44", "1"], 2)
+
+        self.protocol.on_player_wins_the_tournament.assert_not_called()
+
+        # Rest params
+        self.protocol._process_command(server_commands.UPDATE1, ["52", "1", "2", "3"], 4)
+
+        self.protocol.on_update1.assert_called_once_with("1", "2", "3")
+
+    def test_process_rooms_list_delta(self):
+        self.protocol.on_rooms_list = Mock()
+        self.protocol._process_command(server_commands.GOTO_LOBBY, ["3", ["1", "Lobby 1"]], 2)
+
+        # Not subscribed - skip
+        self.protocol._process_command(server_commands.ROOMS_LIST_DELTA, ["17", "1", "0", ["3", "Room 3"]], 4)
+
+        self.protocol.on_rooms_list.assert_not_called()
+
+        # Subscribed
+        self.protocol._process_command(server_commands.ROOMS_LIST, ["9", [["1", "Room 1"]], "5"], 3)
+        self.protocol._process_command(server_commands.ROOMS_LIST_DELTA,
+                                       ["17", "6", str(RoomsListDelta.ROOM_ADDED), ["2", "Room 2"]], 4)
+
+        self.assertEqual(self.protocol.rooms_list_sequence, 6)
+        self.assertEqual([room.room_id for room in self.protocol.player.lobby.rooms], ["1", "2"])
+        self.assertEqual(self.protocol.on_rooms_list.call_count, 2)
+
+        # Sequence gap - resync
+        self.protocol._process_command(server_commands.ROOMS_LIST_DELTA,
+                                       ["17", "8", str(RoomsListDelta.ROOM_REMOVED), "1"], 4)
+
+        self.assertEqual(self.protocol.rooms_list_sequence, 6)
+        self.assertEqual([room.room_id for room in self.protocol.player.lobby.rooms], ["1", "2"])
+        self.protocol.send.assert_called_once_with([client_commands.SUBSCRIBE_ROOMS_LIST, 1])
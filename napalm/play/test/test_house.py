@@ -1027,6 +1027,26 @@ class TestLobbyManager:
             self.assertTrue(lobby in self.house._lobby_list)
             self.assertTrue(lobby.lobby_model in self.house.house_config.house_model.lobby_model_list)
 
+    def test_constructor_with_worker_shard(self):
+        house_config = self.house.house_config
+        house_class = self.house.__class__
+        self.house.dispose()
+        house_config.worker_count = 2
+
+        # Each worker has own lobbies
+        house_config.worker_index = 1
+        self.house = house_class(house_config)
+
+        self.assertEqual(list(self.house._lobby_by_id.keys()), ["2"])
+
+        # Workers more than lobbies
+        self.house.dispose()
+        house_config.worker_count = 3
+        house_config.worker_index = 2
+        self.house = house_class(house_config)
+
+        self.assertEqual(list(self.house._lobby_by_id.keys()), ["1"])
+
     def test_lobby_manager_dispose(self):
         self.assertEqual(len(self.house._lobby_list), 2)
         self.assertEqual(len(self.house._lobby_by_id), 2)
@@ -1314,6 +1334,14 @@ class TestHouse(TestCase, TestLobbyManager, TestUserManager, TestSaveLoadHouseSt
         # self.assertIn("lobbies_data", data)
         # self.assertIn("users_data", data)
 
+    def test_state_name(self):
+        self.assertEqual(self.house.state_name, "server1")
+
+        self.house.house_config.worker_count = 4
+        self.house.house_config.worker_index = 2
+
+        self.assertEqual(self.house.state_name, "server1_worker2")
+
     def test_model_data(self):
         self.assertEqual(self.house.house_model.house_name, "server1")
 
@@ -5,7 +5,7 @@ from napalm.core import BaseModel
 from napalm.play.core import HouseConfig
 from napalm.play.house import User, House
 from napalm.play.lobby import Lobby, RoomModel, Room, LobbyModel
-from napalm.play.protocol import FindAndJoin
+from napalm.play.protocol import FindAndJoin, RoomsListDelta
 from napalm.play.test import utils
 from napalm.play.test.test_lobby_room import TestRoomSendMixIn
 
@@ -589,6 +589,63 @@ class TestRoomManager(Asserts):
         self.assertEqual(len(self.lobby.rooms_export_public_data(player_owner)), 4)
         self.assertEqual(len(player_owner.protocol.rooms_list.call_args[0][0]), 4)
 
+    def test_subscribe_to_room_list(self):
+        player1 = self.player1
+        player_owner = self.player3
+        room1 = self.lobby.room_by_id["1"]
+
+        # Subscribe
+        self.lobby.subscribe_to_room_list(player1)
+
+        player1.protocol.rooms_list.assert_called_once_with(self.lobby.rooms_export_public_data(player1), 1)
+        player1.protocol.rooms_list_delta.assert_not_called()
+
+        # Changed (10 - index of visitor_count, 9 - of playing_count)
+        room1.add_player(player_owner)
+
+        player1.protocol.rooms_list_delta.assert_called_once_with(2, RoomsListDelta.ROOM_CHANGED, ["1", 10, 1])
+        player1.protocol.rooms_list_delta.reset_mock()
+
+        room1.join_the_game(player_owner, money_in_play=1000)
+
+        player1.protocol.rooms_list_delta.assert_called_once_with(3, RoomsListDelta.ROOM_CHANGED, ["1", 9, 1, 10, 0])
+        player1.protocol.rooms_list_delta.reset_mock()
+
+        # Not changed
+        room1.on_room_model_changed()
+
+        player1.protocol.rooms_list_delta.assert_not_called()
+
+        # Added and removed (private rooms only for owner)
+        self.lobby.subscribe_to_room_list(player_owner)
+        room_info = ["11", "room_name", "1_H_10_2", [50, 100, 5000, 100000], 0, -1, 6]
+        room = self.lobby._create_room(room_info, player_owner)
+
+        player1.protocol.rooms_list_delta.assert_not_called()
+        player_owner.protocol.rooms_list_delta.assert_called_once_with(
+            2, RoomsListDelta.ROOM_ADDED, room.room_model.export_public_data())
+        player_owner.protocol.rooms_list_delta.reset_mock()
+
+        room.dispose()
+
+        player1.protocol.rooms_list_delta.assert_not_called()
+        player_owner.protocol.rooms_list_delta.assert_called_once_with(3, RoomsListDelta.ROOM_REMOVED, "11")
+
+        # Resync
+        player1.protocol.rooms_list.reset_mock()
+        self.lobby.subscribe_to_room_list(player1)
+
+        player1.protocol.rooms_list.assert_called_once_with(self.lobby.rooms_export_public_data(player1), 4)
+
+        # Unsubscribe
+        self.lobby.unsubscribe_from_room_list(player1)
+        room1.remove_player(player_owner)
+
+        player1.protocol.rooms_list_delta.assert_not_called()
+        # (Left the game and then the room)
+        player_owner.protocol.rooms_list_delta.assert_has_calls([
+            call(4, RoomsListDelta.ROOM_CHANGED, ["1", 9, 0, 10, 1]), call(5, RoomsListDelta.ROOM_CHANGED, ["1", 10, 0])])
+
     def test_find_free_room(self):
         user1 = self.user1
         player1 = self.player1
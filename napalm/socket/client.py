@@ -9,7 +9,7 @@ from twisted.internet import reactor
 from twisted.internet.protocol import ClientFactory
 
 from napalm import utils
-from napalm.socket.server import Config, ProtocolFactory, TwistedHandler
+from napalm.socket.server import Config, ProtocolFactory, create_receive_buffer, get_twisted_handler_class, make_frame
 
 # from napalm.socket.test.test_server_with_client import ClientProtocol
 from napalm.utils import PrintLogging
@@ -115,7 +115,7 @@ class TwistedTCPClient(AbstractClient):
 
         self.factory = ClientFactory()
         self.factory.config = config
-        self.factory.protocol = TwistedHandler
+        self.factory.protocol = get_twisted_handler_class(self.config)
         self.factory.protocol_factory = self.protocol_factory
 
     def dispose(self):
@@ -158,7 +158,7 @@ class BlockingTCPClient(AbstractClient):
     address = None
     abort = False
     # (Used to continue after reconnection without data loses)
-    buffer = b""
+    receive_buffer = None
     # (Contain only the last unsent message, because pre-last messages don't raise exception)
     # ?needed?
     sending_buffer = None
@@ -230,10 +230,10 @@ class BlockingTCPClient(AbstractClient):
             connect_count += 1
             if connect_count == 1 and self.on_connect:
                 # (Note: protocol.on_connect() called from protocol's constructor)
-                print("CLIENT-on_connect")
+                self.logging.debug("on_connect")
                 self.on_connect()
             elif connect_count > 1:
-                print("CLIENT-on_reconnect")
+                self.logging.debug("on_reconnect")
                 if self.protocol and hasattr(self.protocol, "on_reconnect") and self.protocol.on_reconnect:
                     self.protocol.on_reconnect()
                 if self.on_reconnect:
@@ -261,8 +261,7 @@ class BlockingTCPClient(AbstractClient):
                 self.conn = None
 
             self.connected = False
-            print("    CLIENT###abort:", self.abort, self.protocol)
-            self.logging.debug("Closed. conn: %s abort: %s", self.conn, self.abort)
+            self.logging.debug("Closed. conn: %s abort: %s protocol: %s", self.conn, self.abort, self.protocol)
 
             # Connection lost. Reconnect... (if not aborted)
             tries_count = 0
@@ -298,23 +297,27 @@ class BlockingTCPClient(AbstractClient):
         #     self.logging.debug("Resend: %s", sending_buffer)
         #     self.send_raw(sending_buffer)
 
+        if not self.receive_buffer:
+            self.receive_buffer = create_receive_buffer(self.config, self.protocol)
+
         while not self.abort:
             # Receive
-            while not self.abort and self.config.DELIMITER not in self.buffer:
+            data_bytes_list = []
+            while not self.abort and not data_bytes_list:
                 try:
-                    data_bytes = self.conn.recv(self.config.RECV_SIZE)
-                    if data_bytes:
-                        self.buffer += data_bytes
-                    else:
+                    if not self.receive_buffer.recv_from(self.conn):
                         self.logging.error("Connection lost (empty bytes received)! abort: %s", self.abort)
                         return
-                except socket.error as error:
+                    data_bytes_list = self.receive_buffer.pop_frames()
+                # (ValueError: wrong frame)
+                except (socket.error, ValueError) as error:
                     self.logging.error("Connection lost (while receiving)! %s", error)
                     return
+            if not data_bytes_list:
+                # (Aborted)
+                return
 
-            data_bytes_list = self.buffer.split(self.config.DELIMITER)
-            self.logging.debug("Received: %s", self.buffer)
-            self.buffer = data_bytes_list.pop()
+            self.logging.debug("Received: %s", data_bytes_list)
 
             try:
                 self.data_received(data_bytes_list)
@@ -337,8 +340,8 @@ class BlockingTCPClient(AbstractClient):
         #     self.sending_buffer = None
         # # logging.debug("Send to server: %s", data_bytes)
         try:
-            if not data_bytes.endswith(self.config.DELIMITER):
-                data_bytes += self.config.DELIMITER
+            if self.config.is_length_prefixed or not data_bytes.endswith(self.config.DELIMITER):
+                data_bytes = make_frame(self.config, data_bytes)
 
             self.conn.send(data_bytes)
             # self.sending_buffer = None
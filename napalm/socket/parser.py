@@ -1,9 +1,17 @@
 import json
+import struct
+import threading
+from collections import OrderedDict
 
 
 class CommandParser:
     EMPTY = ""  # "-1"
 
+    # (True if commands are made as bytes and parsed from bytes, not str)
+    is_binary = False
+    # (True if received bytes are parsed without decoding to str)
+    is_bytes_parsing = False
+
     # 37||243||0::David,,David Federman,, ... ,,80;;3::Chris,,Chris Mattaboni,, ... ,,80##
     COMMAND_DELIM = "##"
     PARAMS_DELIM = "||"
@@ -16,6 +24,15 @@ class CommandParser:
                     "&dblsemi&": COMPLEX_LIST_DELIM, "&dblcolon&": DICT_KEY_DELIM,
                     "&dblcomma&": LIST_DELIM}
 
+    # (Max count of models with cached serialized export data, see ExportedModel)
+    export_cache_size = 10000
+
+    def __init__(self):
+        # {(model, is_public): (version, fragment)} in order of last use
+        self._export_cache = OrderedDict()
+        # (Parser is shared between connections, which could be in different threads)
+        self._export_cache_lock = threading.Lock()
+
     # Parse
 
     @staticmethod
@@ -136,7 +153,9 @@ class CommandParser:
             # print("P (make_command)", "command_params:", command_params)
             for index, param in enumerate(command_params):
                 # print("P  (make_command)", "index:", index, "param:", param)
-                if isinstance(param, dict):
+                if isinstance(param, ExportedModel):
+                    command_params[index] = self.serialize_exported(param)
+                elif isinstance(param, dict):
                     # Param is dict (possibly with lists as values)
                     command_params[index] = self._serialize_dict(param)
                 elif isinstance(param, list):
@@ -160,6 +179,38 @@ class CommandParser:
             command = self.PARAMS_DELIM.join(command_params)
         return command + self.COMMAND_DELIM
 
+    def serialize_exported(self, exported):
+        """
+        Serialize export data of model (ExportedModel) or of models (ExportedModels)
+        as make_command() does for plain lists and lists of lists, but using cached
+        fragments for models which were not changed since last serialization.
+        """
+        if isinstance(exported, ExportedModels):
+            return self.COMPLEX_LIST_DELIM.join([self._get_export_fragment(model, exported.is_public)
+                                                 for model in exported.models])
+        return self._get_export_fragment(exported.model, exported.is_public)
+
+    def _get_export_fragment(self, model, is_public):
+        key = (model, is_public)
+        version = model.version
+        with self._export_cache_lock:
+            version_and_fragment = self._export_cache.get(key)
+            if version_and_fragment and version_and_fragment[0] == version:
+                self._export_cache.move_to_end(key)
+                return version_and_fragment[1]
+
+        fragment = self._serialize_export_data(model.export_public_data() if is_public else model.export_data())
+        with self._export_cache_lock:
+            self._export_cache[key] = (version, fragment)
+            self._export_cache.move_to_end(key)
+            if len(self._export_cache) > self.export_cache_size:
+                self._export_cache.popitem(last=False)
+        return fragment
+
+    def _serialize_export_data(self, data):
+        # (As item of complex list)
+        return self.LIST_DELIM.join(self._str_items(data))
+
     def _str_items(self, items):
         return [json.dumps(item) if isinstance(item, list) or isinstance(item, dict)
                 else str(int(item) if isinstance(item, bool) else (item if item is not None else ""))
@@ -194,3 +245,495 @@ class CommandParser:
 
         # ["a,,b,,c,,['a', 2, ''],,10", "v1"] -> "a,,b,,c,,['a', 2, ''],,10;;v1"
         return self.COMPLEX_LIST_DELIM.join(items)
+
+
+class LazyCommandParams:
+    """
+    Params of text command which are parsed only on first access,
+    so commands which are dropped are not parsed at all.
+    If complex_param_indexes (indexes of params which could be lists or dicts)
+    is given, all other params are plain str and command is just split.
+    Otherwise command is parsed by parser.parse_command().
+    """
+
+    def __init__(self, parser, command, complex_param_indexes=None):
+        self.parser = parser
+        self.command = command
+        self.complex_param_indexes = complex_param_indexes
+        self._param_list = None
+        # (Command is bytes for BytesCommandParser)
+        self._params_delim = parser.PARAMS_DELIM if isinstance(command, str) else parser.PARAMS_DELIM.encode()
+
+    @property
+    def command_code(self):
+        # (Without parsing params)
+        return self.command.split(self._params_delim, 1)[0]
+
+    @property
+    def param_list(self):
+        if self._param_list is None:
+            if self.complex_param_indexes is None:
+                self._param_list = self.parser.parse_command(self.command)
+            else:
+                param_list = self.command.split(self._params_delim)
+                for index in self.complex_param_indexes:
+                    if index < len(param_list):
+                        param_list[index] = self.parser.parse_command(param_list[index])[0]
+                self._param_list = param_list
+        return self._param_list
+
+    @property
+    def is_parsed(self):
+        return self._param_list is not None
+
+    def __len__(self):
+        if self._param_list is None:
+            return self.command.count(self._params_delim) + 1
+        return len(self._param_list)
+
+    def __getitem__(self, index):
+        return self.param_list[index]
+
+    def __iter__(self):
+        return iter(self.param_list)
+
+    def __eq__(self, other):
+        if isinstance(other, LazyCommandParams):
+            other = other.param_list
+        return self.param_list == other
+
+    def __repr__(self):
+        # (Don't parse for logging)
+        return repr(self.param_list) if self._param_list is not None else repr(self.command)
+
+
+class ExportedModel:
+    """
+    Command param to be serialized from export data of model (see ExportableMixIn).
+    Serialized data is cached by parser until model.version is changed, so data
+    of models which rarely change (rooms, lobbies, players) is not exported and
+    serialized again for each sending. Result is same as for param
+    model.export_public_data() (model.export_data() if not is_public)
+    if its first item is not a list.
+
+    Properties changed in place (not by setting) should be followed by
+    model.mark_changed().
+    """
+
+    def __init__(self, model, is_public=True):
+        self.model = model
+        self.is_public = is_public
+
+    @property
+    def data(self):
+        return self.model.export_public_data() if self.is_public else self.model.export_data()
+
+    def __eq__(self, other):
+        if isinstance(other, ExportedModel):
+            other = other.data
+        return self.data == other
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, index):
+        return self.data[index]
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __repr__(self):
+        return repr(self.data)
+
+
+class ExportedModels(ExportedModel):
+    """
+    Same as ExportedModel, but for list of models.
+    Result is same as for param [model.export_public_data() for model in models].
+    """
+
+    def __init__(self, models, is_public=True):
+        super().__init__(None, is_public)
+        self.models = models
+
+    @property
+    def data(self):
+        return [model.export_public_data() if self.is_public else model.export_data() for model in self.models]
+
+
+class FastCommandParser(CommandParser):
+    """
+    Same format and output as CommandParser has, but faster: plain commands (most of game
+    commands) are split by single str.split(), strings without delimiters or codes
+    are returned as is, and command params are serialized without extra passes
+    and without changing given list.
+
+    Use: HouseConfig(command_parser_class=FastCommandParser).
+    """
+
+    def __init__(self):
+        super().__init__()
+        # (Precomputed tables)
+        self._decode_list = list(self.AUTO_REPLACE.items())
+        self._encode_list = [(delim, code) for code, delim in self._decode_list]
+
+    def parse_command(self, command):
+        params_delim, complex_list_delim, dict_key_delim, list_delim = \
+            self.PARAMS_DELIM, self.COMPLEX_LIST_DELIM, self.DICT_KEY_DELIM, self.LIST_DELIM
+        param_list = command.split(params_delim)
+        if list_delim not in command and complex_list_delim not in command:
+            # No lists or dicts
+            return param_list
+
+        for index, param in enumerate(param_list):
+            if complex_list_delim in param:
+                if dict_key_delim in param:
+                    # "k1::a,,b,,c;;k2::;;k3::v3" -> {"k1": ["a", "b", "c"], "k2": "", "k3": "v3"}
+                    subdict = {}
+                    for subitem in param.split(complex_list_delim):
+                        key_value_list = subitem.split(dict_key_delim)
+                        value = key_value_list[1] if len(key_value_list) > 1 else None
+                        if value and list_delim in value:
+                            value = value.split(list_delim)
+                        subdict[key_value_list[0]] = value
+                    param_list[index] = subdict
+                elif list_delim in param:
+                    # "a,,b,,c,,d;;abc;;d,,e,,f" -> [["a", "b", "c", "d"], "abc", ["d", "e", "f"]]
+                    param_list[index] = [subitem.split(list_delim) if list_delim in subitem else subitem
+                                         for subitem in param.split(complex_list_delim)]
+                else:
+                    # (Same as in CommandParser)
+                    param_list[index] = None
+            elif list_delim in param:
+                # "a,,b,,c" -> ["a", "b", "c"]
+                param_list[index] = param.split(list_delim)
+        return param_list
+
+    def decode_string(self, string):
+        string = str(string)
+        if "&" not in string:
+            return string
+        # (Sequential replacing is kept because single pass could give other result
+        # for codes sharing "&", e.g. "&dblsemi&dblstick&")
+        for code, delim in self._decode_list:
+            if code in string:
+                string = string.replace(code, delim)
+        return string
+
+    def encode_string(self, string):
+        string = str(string)
+        for delim, code in self._encode_list:
+            if delim in string:
+                string = string.replace(delim, code)
+        return string
+
+    def make_command(self, command):
+        if isinstance(command, str):
+            return command + self.COMMAND_DELIM
+
+        params = []
+        for param in command:
+            if param is None:
+                params.append("")
+            elif isinstance(param, str):
+                params.append(param)
+            elif isinstance(param, ExportedModel):
+                params.append(self.serialize_exported(param))
+            elif isinstance(param, dict):
+                params.append(self._serialize_dict(param))
+            elif isinstance(param, list):
+                # (Complex if first item is list)
+                if param and isinstance(param[0], list):
+                    params.append(self._serialize_complex_list(param))
+                else:
+                    params.append(self.LIST_DELIM.join(self._str_items(param)))
+            else:
+                params.append(str(param))
+        return self.PARAMS_DELIM.join(params) + self.COMMAND_DELIM
+
+    def _str_items(self, items):
+        # (Most of items are str and int, so they are checked first)
+        result = []
+        for item in items:
+            item_class = item.__class__
+            if item_class is str:
+                result.append(item)
+            elif item_class is int:
+                result.append(str(item))
+            else:
+                result.append(super()._str_items([item])[0])
+        return result
+
+
+class BytesCommandParser(FastCommandParser):
+    """
+    FastCommandParser which also parses received bytes without decoding them to str:
+    commands are split by bytes delimiters, and params of commands without lists and
+    dicts (most of client commands) are left as bytes (int() and float() accept them,
+    and CommandSchema decodes params of str type). Commands with lists or dicts are
+    decoded and parsed as str. Str commands are parsed as before.
+
+    Use: HouseConfig(command_parser_class=BytesCommandParser).
+    """
+
+    is_bytes_parsing = True
+
+    def __init__(self):
+        super().__init__()
+        # (Precomputed)
+        self._command_delim_bytes = self.COMMAND_DELIM.encode()
+        self._params_delim_bytes = self.PARAMS_DELIM.encode()
+        self._complex_list_char = self.COMPLEX_LIST_DELIM.encode()[0]
+        self._list_char = self.LIST_DELIM.encode()[0]
+
+    def split_commands(self, commands_data):
+        if isinstance(commands_data, str):
+            return super().split_commands(commands_data)
+        return commands_data.split(self._command_delim_bytes)
+
+    def parse_command(self, command):
+        if isinstance(command, str):
+            return super().parse_command(command)
+
+        # (Searching for int (single byte) in bytes is much faster than for bytes)
+        if self._list_char not in command and self._complex_list_char not in command:
+            # No lists or dicts
+            return command.split(self._params_delim_bytes)
+        # (Decoding whole command at once is faster than by params)
+        return super().parse_command(command.decode("utf-8"))
+
+
+class BinaryCommandParser(CommandParser):
+    """
+    Binary codec with typed values: int, float, str, bool, None, list (tuple) and dict
+    (of any depth) are parsed back as they were made. Other types are made as str.
+
+    Command: START byte + length of body (varint) + body; body - values one after another,
+    value - type tag (1 byte) + packed value (msgpack-like): small ints, short str,
+    lists and dicts have value or length inside tag; others have varint length or
+    zigzag varint value after tag; float is packed as repr() to be exact and short.
+    As commands are sent in frames separated by DELIMITER (b"\\x00" by default),
+    b"\\x00" and ESCAPE bytes are escaped in made command (which is very rare).
+
+    Connections switch to it by the first frame, see Protocol.binary_parser_class.
+    """
+
+    is_binary = True
+    is_bytes_parsing = True
+
+    # (Text commands never start with it)
+    START = b"\x02"
+    ESCAPE = b"\x1b"
+    ESCAPE_BY_BYTE = {b"\x00": b"\x1b\x01", ESCAPE: b"\x1b\x02"}
+
+    NONE = 0x4e  # N
+    TRUE = 0x54  # T
+    FALSE = 0x46  # F
+    INT = 0x69  # i
+    FLOAT = 0x64  # d
+    STR = 0x73  # s
+    LIST = 0x6c  # l
+    DICT = 0x6d  # m
+    # (Value or length inside tag)
+    FIX_INT = 0x80  # 0..63
+    FIX_STR = 0xc0  # 0..31
+    FIX_LIST = 0xe0  # 0..15
+    FIX_DICT = 0xf0  # 0..15
+
+    @staticmethod
+    def is_binary_data(data_bytes):
+        return data_bytes[:1] == BinaryCommandParser.START
+
+    # Parse
+
+    def split_commands(self, commands_data):
+        commands_data = bytes(commands_data)
+        if self.ESCAPE in commands_data:
+            # Unescape
+            # (Escaped ESCAPE is always followed by b"\x01" or b"\x02", so replacing can't give wrong result)
+            commands_data = commands_data.replace(self.ESCAPE_BY_BYTE[b"\x00"], b"\x00") \
+                .replace(self.ESCAPE_BY_BYTE[self.ESCAPE], self.ESCAPE)
+
+        command_list = []
+        index = 0
+        commands_data_length = len(commands_data)
+        while index < commands_data_length and commands_data[index] == self.START[0]:
+            length, index = self._unpack_varint(commands_data, index + 1)
+            command_list.append(commands_data[index:index + length])
+            index += length
+        return command_list
+
+    def parse_command(self, command):
+        if isinstance(command, str):
+            return super().parse_command(command)
+
+        param_list = []
+        index = 0
+        command_length = len(command)
+        while index < command_length:
+            value, index = self._unpack_value(command, index)
+            param_list.append(value)
+        return param_list
+
+    def decode_string(self, string):
+        # (Nothing is encoded)
+        return str(string)
+
+    def _unpack_value(self, data, index):
+        tag = data[index]
+        index += 1
+        if tag >= self.FIX_INT:
+            if tag < self.FIX_STR:
+                return tag - self.FIX_INT, index
+            if tag < self.FIX_LIST:
+                length = tag - self.FIX_STR
+                return data[index:index + length].decode("utf-8"), index + length
+            if tag < self.FIX_DICT:
+                return self._unpack_list(data, index, tag - self.FIX_LIST)
+            return self._unpack_dict(data, index, tag - self.FIX_DICT)
+        if tag == self.INT:
+            value, index = self._unpack_varint(data, index)
+            # (Zigzag)
+            return (value >> 1) ^ -(value & 1), index
+        if tag == self.STR or tag == self.FLOAT:
+            length, index = self._unpack_varint(data, index)
+            value = data[index:index + length].decode("utf-8")
+            return (float(value) if tag == self.FLOAT else value), index + length
+        if tag == self.LIST:
+            length, index = self._unpack_varint(data, index)
+            return self._unpack_list(data, index, length)
+        if tag == self.DICT:
+            length, index = self._unpack_varint(data, index)
+            return self._unpack_dict(data, index, length)
+        if tag == self.NONE:
+            return None, index
+        if tag == self.TRUE:
+            return True, index
+        if tag == self.FALSE:
+            return False, index
+        raise ValueError("Wrong value type: %s at %s" % (tag, index - 1))
+
+    def _unpack_list(self, data, index, length):
+        value = []
+        append = value.append
+        # (Small ints and short strings, which are the most of items, are unpacked inline)
+        fix_int, fix_str, fix_list = self.FIX_INT, self.FIX_STR, self.FIX_LIST
+        for _ in range(length):
+            tag = data[index]
+            if fix_int <= tag < fix_str:
+                append(tag - fix_int)
+                index += 1
+            elif fix_str <= tag < fix_list:
+                end = index + 1 + tag - fix_str
+                append(data[index + 1:end].decode("utf-8"))
+                index = end
+            else:
+                item, index = self._unpack_value(data, index)
+                append(item)
+        return value, index
+
+    def _unpack_dict(self, data, index, length):
+        value = {}
+        for _ in range(length):
+            key, index = self._unpack_value(data, index)
+            value[key], index = self._unpack_value(data, index)
+        return value, index
+
+    @staticmethod
+    def _unpack_varint(data, index):
+        value = 0
+        shift = 0
+        while True:
+            byte = data[index]
+            index += 1
+            value |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                return value, index
+            shift += 7
+
+    # Serialize
+
+    def encode_string(self, string):
+        # (Not needed)
+        return str(string)
+
+    def join_commands(self, command_data_list):
+        return b"".join(command_data_list)
+
+    def serialize_exported(self, exported):
+        if isinstance(exported, ExportedModels):
+            chunks = []
+            self._pack_length(len(exported.models), self.FIX_LIST, 16, b"l", chunks)
+            chunks.extend([self._get_export_fragment(model, exported.is_public) for model in exported.models])
+            return b"".join(chunks)
+        return self._get_export_fragment(exported.model, exported.is_public)
+
+    def _serialize_export_data(self, data):
+        chunks = []
+        self._pack_value(data, chunks)
+        return b"".join(chunks)
+
+    def make_command(self, command):
+        """
+        :param command: iterable|str - text command (see CommandParser.make_command())
+        is converted to binary one
+        :return: bytes
+        """
+        if isinstance(command, str):
+            command = super().parse_command(command)
+
+        chunks = []
+        for param in command:
+            self._pack_value(param, chunks)
+        body = b"".join(chunks)
+        command_bytes = self.START + self._pack_varint(len(body)) + body
+
+        if b"\x00" in command_bytes or self.ESCAPE in command_bytes:
+            # Escape
+            command_bytes = command_bytes.replace(self.ESCAPE, self.ESCAPE_BY_BYTE[self.ESCAPE]) \
+                .replace(b"\x00", self.ESCAPE_BY_BYTE[b"\x00"])
+        return command_bytes
+
+    def _pack_value(self, value, chunks):
+        if value is None:
+            chunks.append(b"N")
+        elif isinstance(value, ExportedModel):
+            chunks.append(self.serialize_exported(value))
+        elif value is True:
+            chunks.append(b"T")
+        elif value is False:
+            chunks.append(b"F")
+        elif isinstance(value, int):
+            if 0 <= value < self.FIX_STR - self.FIX_INT:
+                chunks.append(bytes((self.FIX_INT + value,)))
+            else:
+                # (Zigzag: 0, -1, 1, -2, ... -> 0, 1, 2, 3, ...)
+                chunks.append(b"i" + self._pack_varint(value << 1 if value >= 0 else (-value << 1) - 1))
+        elif isinstance(value, float):
+            value_bytes = repr(value).encode("utf-8")
+            chunks.append(b"d" + self._pack_varint(len(value_bytes)) + value_bytes)
+        elif isinstance(value, (list, tuple)):
+            self._pack_length(len(value), self.FIX_LIST, 16, b"l", chunks)
+            for item in value:
+                self._pack_value(item, chunks)
+        elif isinstance(value, dict):
+            self._pack_length(len(value), self.FIX_DICT, 16, b"m", chunks)
+            for key, item in value.items():
+                self._pack_value(key, chunks)
+                self._pack_value(item, chunks)
+        else:
+            value_bytes = str(value).encode("utf-8")
+            self._pack_length(len(value_bytes), self.FIX_STR, 32, b"s", chunks)
+            chunks.append(value_bytes)
+
+    def _pack_length(self, length, fix_tag, fix_count, tag_bytes, chunks):
+        chunks.append(bytes((fix_tag + length,)) if length < fix_count else tag_bytes + self._pack_varint(length))
+
+    @staticmethod
+    def _pack_varint(value):
+        result = bytearray()
+        while value >= 0x80:
+            result.append(value & 0x7f | 0x80)
+            value >>= 7
+        result.append(value)
+        return bytes(result)
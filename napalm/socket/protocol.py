@@ -1,21 +1,110 @@
 import inspect
 import logging as _logging
 import traceback
+from collections import OrderedDict
 
 import os
 
-from napalm.socket.parser import CommandParser
+from napalm.socket.parser import CommandParser, LazyCommandParams
+from napalm.socket.rate_limit import RateLimitAction, RateLimiter
 from napalm.socket.server import ServerConfig
+from napalm.utils.trace_util import get_tracer
 
 logging = _logging.getLogger("PROTOCOL")
+# (For each command)
+tracer = get_tracer("PROTOCOL")
 
 
 # Protocol
 
+def _to_str(value):
+    # (BytesCommandParser leaves plain params as bytes)
+    return value.decode("utf-8") if isinstance(value, bytes) else str(value)
+
+
+def _decode_bytes(value):
+    return value.decode("utf-8") if isinstance(value, bytes) else value
+
+
+class SendPriority:
+    # Game state (turns, wins): sent before all other data, also before data queued
+    # for slow client (if server supports it: protocol.send_urgent_bytes_method is set)
+    HIGH = 0
+    NORMAL = 1
+    # Chat, lobby lists: held while writing is paused (or until flush()), latest data
+    # replaces previous with the same merge_key, oldest are dropped over max_low_count
+    LOW = 2
+
+
+class CommandSchema:
+    """
+    Declaration of command params to decode them before handler is called (see make_dispatch_table()).
+    :param params: list of (name, type, default), where type is a converter (int, float, str)
+    or None for params which could be lists or dicts (not converted)
+    :param required_count: command with less params is rejected
+    :param rest_param: name of param to get all params after declared ones as list
+    :param handler_name: method of protocol to call with decoded params as keyword arguments
+    """
+
+    def __init__(self, params=None, required_count=0, rest_param=None, handler_name=None):
+        self.params = params or []
+        self.required_count = required_count
+        self.rest_param = rest_param
+        self.handler_name = handler_name
+
+        # (Precomputed)
+        self.first_rest_index = len(self.params) + 1
+        self._converters = [(name, _to_str if type_ is str else (type_ or _decode_bytes), default)
+                            for name, type_, default in self.params]
+        # For lazy parsing (see LazyCommandParams)
+        self.complex_param_indexes = None if rest_param else \
+            tuple(index for index, (name, type_, default) in enumerate(self.params, 1) if type_ is None)
+
+    def __repr__(self):
+        return "<CommandSchema %s%s>" % (self.handler_name, [name for name, type_, default in self.params])
+
+    def decode(self, command_params, params_count):
+        """
+        :param command_params: list with command code at 0
+        :param params_count: len(command_params)
+        :return: dict of params by name
+        :raise: ValueError, TypeError
+        """
+        if params_count - 1 < self.required_count:
+            raise ValueError("Wrong params count: %s (required: %s)" % (params_count - 1, self.required_count))
+
+        kwargs = {}
+        index = 1
+        for name, convert, default in self._converters:
+            kwargs[name] = convert(command_params[index]) if index < params_count else default
+            index += 1
+        if self.rest_param:
+            kwargs[self.rest_param] = [_decode_bytes(value) for value in command_params[self.first_rest_index:]]
+        return kwargs
+
+
+def make_dispatch_table(schema_by_code, description_by_code=None):
+    """
+    Set default handler names: "_process_" + lowered description of command code.
+    :param schema_by_code: dict of CommandSchema by code
+    :param description_by_code: dict of str by code
+    :return: schema_by_code
+    """
+    for command_code, schema in schema_by_code.items():
+        if not schema.handler_name:
+            schema.handler_name = "_process_" + description_by_code[command_code].lower()
+    return schema_by_code
+
+
 class SimpleProtocol:
     is_server_protocol = True
     logging = None
 
+    # (True while client doesn't take sent data fast enough)
+    is_writing_paused = False
+    # (Optional. Set by server to send data before data queued already, see SendPriority)
+    send_urgent_bytes_method = None
+
     def __init__(self, send_bytes_method=None, close_connection_method=None, address=None, config=None, app=None):
         """
         Created on connection established.
@@ -46,6 +135,7 @@ class SimpleProtocol:
         """
         address = self.address
         self.send_bytes_method = None
+        self.send_urgent_bytes_method = None
         self.address = None
         self.config = None
         if self.close_connection_method:
@@ -68,37 +158,54 @@ class SimpleProtocol:
 
     # Send
 
-    def send_raw(self, data):
+    def send_raw(self, data, priority=SendPriority.NORMAL):
         """
         Send data as it is, without moving it through parser.
         :param data: str|bytes
+        :param priority: SendPriority (only HIGH makes difference here)
         :return:
         """
         if self.send_bytes_method and data:
             # self.logging.debug("Protocol send: %s (%s)", data_bytes, self.address)
             data_bytes = data if isinstance(data, bytes) else data.encode("utf-8")
-            self.send_bytes_method(data_bytes)
+            self._get_send_bytes_method(priority)(data_bytes)
 
-    def send_all_raw(self, data_list):
+    def send_all_raw(self, data_list, priority=SendPriority.NORMAL):
         """
         (Here is an optimization: Grouping all data to fit IP frame maximally.)
         :param data_list: iterable of str|bytes
+        :param priority: see send_raw()
         :return:
         """
         if self.send_bytes_method and data_list:
+            send_bytes_method = self._get_send_bytes_method(priority)
             buffer = b""
             # -delim_len = len(self.config.DELIMITER)
             for data in data_list:
                 data_bytes = data if isinstance(data, bytes) else data.encode("utf-8")
                 if len(buffer) + len(data_bytes) > self.config.RECV_SIZE:  # + delim_len
                     # self.logging.debug("Protocol send: %s (%s)", buffer, self.address)
-                    self.send_bytes_method(buffer)
+                    send_bytes_method(buffer)
                     buffer = data_bytes
                 else:
                     buffer += data_bytes  # (self.config.DELIMITER if buffer else b"") +
             if buffer:
                 # self.logging.debug("Protocol send: %s (%s)", buffer, self.address)
-                self.send_bytes_method(buffer)
+                send_bytes_method(buffer)
+
+    def _get_send_bytes_method(self, priority):
+        return self.send_urgent_bytes_method if priority == SendPriority.HIGH and self.send_urgent_bytes_method \
+            else self.send_bytes_method
+
+    def pause_writing(self):
+        # (Called by server when outbound queue gets over high watermark)
+        self.logging.debug("Pause writing (%s)", self.address)
+        self.is_writing_paused = True
+
+    def resume_writing(self):
+        # (Called by server when outbound queue gets under low watermark)
+        self.logging.debug("Resume writing (%s)", self.address)
+        self.is_writing_paused = False
 
     # Process
 
@@ -140,11 +247,19 @@ class Protocol(SimpleProtocol):
 
     parser_class = CommandParser
     parser = None
+    # (Set to BinaryCommandParser (or config.binary_command_parser_class) to let clients
+    # switch to binary codec: connection switches to it if first received frame is binary.
+    # Client protocols use it from the start. Legacy clients keep text codec)
+    binary_parser_class = None
+    binary_parser = None
     player = None
 
     # (Set plugins here in subclasses to instantiate them in constructor)
     plugins = []
 
+    # (Max count of LOW priority data held while writing paused, see SendPriority)
+    max_low_count = 100
+
     last_protocol_id = 0
 
     is_auth_required = False
@@ -153,6 +268,17 @@ class Protocol(SimpleProtocol):
     CLIENT_COMMAND_DESCRIPTION_BY_CODE = None
     SERVER_COMMAND_DESCRIPTION_BY_CODE = None
 
+    # (If True, text commands are parsed on first access to command_params (see LazyCommandParams))
+    is_lazy_parsing = False
+    # Schemas for lazy parsing: indexes of params which could be lists or dicts by code
+    # (all other params are plain str). Commands not listed are fully parsed
+    CLIENT_COMMAND_COMPLEX_PARAM_INDEXES_BY_CODE = None
+    SERVER_COMMAND_COMPLEX_PARAM_INDEXES_BY_CODE = None
+
+    # Dispatch tables: CommandSchema by code (see make_dispatch_table() and _dispatch_command())
+    CLIENT_COMMAND_SCHEMA_BY_CODE = None
+    SERVER_COMMAND_SCHEMA_BY_CODE = None
+
     # todo remove as its always ready until disposed
     @property
     def is_ready(self):
@@ -171,19 +297,45 @@ class Protocol(SimpleProtocol):
                             if hasattr(self.config, "command_parser_class") else None
                             ) or self.parser_class
             Protocol.parser = parser_class()
+        if not Protocol.binary_parser:
+            binary_parser_class = getattr(self.config, "binary_command_parser_class", None) or \
+                                  self.binary_parser_class
+            Protocol.binary_parser = binary_parser_class() if binary_parser_class else None
         # self.parser = Protocol.parser
         self.player = None
+        # (Codec of connection is selected on first received frame)
+        self.is_codec_selected = not self.is_server_protocol or not self.binary_parser
+        if not self.is_server_protocol and self.binary_parser:
+            self.parser = self.binary_parser
 
         self._instantiate_plugins()
 
+        # Flood protection (see ServerConfig.rate_limit_by_code)
+        rate_limit_by_code = getattr(self.config, "rate_limit_by_code", None)
+        total_rate_limit = getattr(self.config, "total_rate_limit", None)
+        self.rate_limiter = RateLimiter(rate_limit_by_code, total_rate_limit) \
+            if self.is_server_protocol and (rate_limit_by_code or total_rate_limit) else None
+        # (Sorted by time: [(time, command_parsed), ...])
+        self._delayed_commands = []
+        self._delayed_commands_timer = None
+
         # State
         self.is_send_on_flush = False
+        # (Deferred data of NORMAL and HIGH priority, and not sent LOW, see SendPriority)
         self.deferred_bytes_list = []
+        self.deferred_high_bytes_list = []
+        self._low_data_by_key = OrderedDict()
 
     def dispose(self):
         # Send all deferred commands accumulated
         self.flush()
 
+        self._low_data_by_key.clear()
+        self._delayed_commands = []
+        if self._delayed_commands_timer:
+            self._delayed_commands_timer.dispose()
+            self._delayed_commands_timer = None
+
         if self.plugins:
             # (list() needed to make a copy)
             for plugin in list(self.plugins):
@@ -233,68 +385,107 @@ class Protocol(SimpleProtocol):
 
     def flush(self):
         self.is_send_on_flush = False
+        if self.deferred_high_bytes_list:
+            deferred_bytes_list = self.deferred_high_bytes_list
+            self.deferred_high_bytes_list = []
+            self.send_all_raw(deferred_bytes_list, SendPriority.HIGH)
         if self.deferred_bytes_list:
             deferred_bytes_list = self.deferred_bytes_list
             self.deferred_bytes_list = []
             self.send_all_raw(deferred_bytes_list)
+        if not self.is_writing_paused:
+            self._send_low_data()
 
-    def send(self, command):
+    def send(self, command, is_critical=True, priority=SendPriority.NORMAL, merge_key=None):
         """
         :param command: iterable|str
+        :param is_critical: False for updates which could be skipped (e.g. next update
+        would override it), they are dropped while writing is paused for slow client
+        :param priority: SendPriority
+        :param merge_key: for LOW priority: only latest data with same key is sent
         :return:
         """
-        if not self.send_bytes_method:
+        if not self.send_bytes_method or (not is_critical and self.is_writing_paused):
             return
 
         # ["1", "param1", "param2"] -> "1||param1||param2##"
         # Or "1||param1||param2" -> "1||param1||param2##"
         command = self.parser.make_command(command)
         # "1||param1||param2" -> b"1||param1||param2##"
-        command_bytes = command.encode("utf-8")
+        command_bytes = command if self.parser.is_binary else command.encode("utf-8")
 
-        if self.is_send_on_flush:
-            self.deferred_bytes_list.append(command_bytes)
-            return
-
-        self.send_bytes_method(command_bytes)
+        self._put_data(command_bytes, priority, merge_key)
 
-    def send_all(self, command_list):
+    def send_all(self, command_list, is_critical=True, priority=SendPriority.NORMAL):
         """
         :param command_list: iterable of iterable|str
+        :param is_critical: see send()
+        :param priority: see send()
         :return:
         """
-        if not self.send_bytes_method:
+        if not self.send_bytes_method or (not is_critical and self.is_writing_paused):
             return
 
         # [["1", "param1", "param2"], "4||param1||param2"] -> [b"1||param1||param2##", b"4||param1||param2##"]
-        command_bytes_list = [self.parser.make_command(command).encode("utf-8")
-                              for command in command_list if command]
+        command_bytes_list = [self.parser.make_command(command) for command in command_list if command]
+        if not self.parser.is_binary:
+            command_bytes_list = [command.encode("utf-8") for command in command_bytes_list]
 
-        if self.is_send_on_flush:
-            self.deferred_bytes_list.extend(command_bytes_list)
+        self.send_all_raw(command_bytes_list, priority)
+
+    def send_raw(self, data, priority=SendPriority.NORMAL, merge_key=None):
+        if not self.send_bytes_method:
             return
 
-        self.send_all_raw(command_bytes_list)
+        self._put_data(data, priority, merge_key)
 
-    def send_raw(self, data):
+    def send_all_raw(self, data_list, priority=SendPriority.NORMAL):
         if not self.send_bytes_method:
             return
 
+        if priority == SendPriority.LOW:
+            for data in data_list:
+                self._put_data(data, priority)
+            return
         if self.is_send_on_flush:
-            self.deferred_bytes_list.append(data)
+            (self.deferred_high_bytes_list if priority == SendPriority.HIGH else self.deferred_bytes_list)\
+                .extend(data_list)
             return
 
-        super().send_raw(data)
+        super().send_all_raw(data_list, priority)
 
-    def send_all_raw(self, data_list):
-        if not self.send_bytes_method:
+    def _put_data(self, data, priority, merge_key=None):
+        if priority == SendPriority.LOW:
+            if merge_key is None:
+                merge_key = object()
+            else:
+                # (Latest replaces previous and goes to the end)
+                self._low_data_by_key.pop(merge_key, None)
+            self._low_data_by_key[merge_key] = data
+            if len(self._low_data_by_key) > self.max_low_count:
+                self._low_data_by_key.popitem(last=False)
+            if not self.is_send_on_flush and not self.is_writing_paused:
+                self._send_low_data()
             return
 
         if self.is_send_on_flush:
-            self.deferred_bytes_list.extend(data_list)
+            (self.deferred_high_bytes_list if priority == SendPriority.HIGH else self.deferred_bytes_list)\
+                .append(data)
             return
 
-        super().send_all_raw(data_list)
+        super().send_raw(data, priority)
+
+    def _send_low_data(self):
+        if self._low_data_by_key:
+            data_list = list(self._low_data_by_key.values())
+            self._low_data_by_key.clear()
+            super().send_all_raw(data_list)
+
+    def resume_writing(self):
+        super().resume_writing()
+        # Send LOW priority data held while paused
+        if not self.is_send_on_flush:
+            self._send_low_data()
 
     # Process
 
@@ -319,9 +510,18 @@ class Protocol(SimpleProtocol):
         self.flush()
 
     def process_bytes(self, data_bytes):
+        if not self.parser:
+            # (Disposed)
+            return
+        if not self.is_codec_selected:
+            self.is_codec_selected = True
+            if self.binary_parser.is_binary_data(data_bytes):
+                self.logging.debug("Switch to binary codec (%s)", self.address)
+                self.parser = self.binary_parser
+
         # b"1||param1||param2##4||param1||param2##" ->
         #  ["1||param1||param2", "4||param1||param2"]
-        commands = data_bytes.decode("utf-8")
+        commands = data_bytes if self.parser.is_bytes_parsing else data_bytes.decode("utf-8")
         command_list = self.parser.split_commands(commands)
 
         # For each command
@@ -335,41 +535,118 @@ class Protocol(SimpleProtocol):
             if not command_parsed:
                 continue
 
-            # Process
-            if command_parsed[0] == self.authorize_command_to_process:
-                # Authorize
-                self.player = self._process_auth_command(command_parsed[0], command_parsed[1], command_parsed[2])
-            elif not self.player and self.is_auth_required:
-                # Not authorized but should be
-                print(self.protocol_id, "WARNING! (process_auth_command) Command cannot be processed "
-                                        "because user is not authorized yet!", "command_params:", command_parsed)
-                # todo
-                result = "You are not authorized yet! So command cannot be processed: " + str(command_parsed)
-                self.send([0, result])
-            else:
-                # Authorized
-                self._process_command(command_parsed[0], command_parsed[1], command_parsed[2])
+            # Flood protection (before any processing)
+            if self.rate_limiter and not self._check_rate_limit(command_parsed):
+                if not self.parser:
+                    # (Disconnected)
+                    return
+                continue
+
+            self._process_parsed_command(command_parsed)
+
+    def _process_parsed_command(self, command_parsed):
+        if command_parsed[0] == self.authorize_command_to_process:
+            # Authorize
+            self.player = self._process_auth_command(command_parsed[0], command_parsed[1], command_parsed[2])
+        elif not self.player and self.is_auth_required:
+            # Not authorized but should be
+            self.logging.warning("%s WARNING! (process_auth_command) Command cannot be processed "
+                                 "because user is not authorized yet! command_params: %s",
+                                 self.protocol_id, command_parsed)
+            # todo
+            result = "You are not authorized yet! So command cannot be processed: " + str(command_parsed)
+            self.send([0, result])
+        else:
+            # Authorized
+            self._process_command(command_parsed[0], command_parsed[1], command_parsed[2])
+
+    def _check_rate_limit(self, command_parsed):
+        """
+        :return: False if command shouldn't be processed now (delayed, dropped or disconnected)
+        """
+        command_code = command_parsed[0]
+        action, delay_sec = self.rate_limiter.check(command_code)
+        if not action:
+            return True
+
+        timer_class = getattr(self.config, "timer_class", None)
+        if action == RateLimitAction.DELAY and timer_class:
+            # (Delayed commands are processed after not limited ones received later)
+            process_time = self.rate_limiter.get_time() + delay_sec
+            index = len(self._delayed_commands)
+            while index and self._delayed_commands[index - 1][0] > process_time:
+                index -= 1
+            self._delayed_commands.insert(index, (process_time, command_parsed))
+            if not self._delayed_commands_timer:
+                self._delayed_commands_timer = timer_class(self._process_delayed_commands, delay_sec, 1)
+                self._delayed_commands_timer.start()
+            return False
+
+        if action == RateLimitAction.DISCONNECT:
+            self.logging.warning("%s WARNING! Rate limit exceeded! Disconnecting... command_code: %s (%s)",
+                                 self.protocol_id, command_code, self.address)
+            # (Protocol.dispose() doesn't close connection)
+            SimpleProtocol.dispose(self)
+            self.dispose()
+            return False
+
+        # Drop (log only first one for each code not to flood the log)
+        if self.rate_limiter.count_by_action_by_code[command_code].get(action) == 1:
+            self.logging.warning("%s WARNING! Rate limit exceeded! Command dropped. command_code: %s (%s)",
+                                 self.protocol_id, command_code, self.address)
+        return False
+
+    def _process_delayed_commands(self):
+        # (One-shot timer stops itself)
+        self._delayed_commands_timer = None
+        if not self.parser:
+            # (Disposed)
+            return
+
+        now = self.rate_limiter.get_time()
+        self.set_send_on_flush()
+        while self._delayed_commands and self._delayed_commands[0][0] <= now and self.parser:
+            self._process_parsed_command(self._delayed_commands.pop(0)[1])
+        self.flush()
+
+        if self._delayed_commands and self.parser:
+            timer_class = getattr(self.config, "timer_class", None)
+            self._delayed_commands_timer = timer_class(self._process_delayed_commands,
+                                                       self._delayed_commands[0][0] - now, 1)
+            self._delayed_commands_timer.start()
 
     def _parse_command(self, command):
         if not command:
             return
 
         # Policy request
-        if "<policy-file-request/>" in command:
+        if ("<policy-file-request/>" if isinstance(command, str) else b"<policy-file-request/>") in command:
             self.send_raw('<?xml version="1.0"?>'
                           '<cross-domain-policy>'
                           '<allow-access-from domain="*" to-ports="*"/>'
                           '</cross-domain-policy>')
             return
 
-        command_params = self.parser.parse_command(command)
-        command_code = int(command_params[0]) if command_params[0].isdigit() else command_params[0]
+        if self.is_lazy_parsing and not self.parser.is_binary:
+            command_params = LazyCommandParams(self.parser, command)
+            command_code = _decode_bytes(command_params.command_code)
+            command_code = int(command_code) if command_code.isdigit() else command_code
+            command_params.complex_param_indexes = self.get_command_complex_param_indexes(
+                command_code, not self.is_server_protocol)
+        else:
+            command_params = self.parser.parse_command(command)
+            if not command_params:
+                return
+            # (Binary codec gives typed values)
+            command_code = _decode_bytes(command_params[0])
+            if isinstance(command_code, str) and command_code.isdigit():
+                command_code = int(command_code)
         params_count = len(command_params)
 
         # Log
-        command_description = self.get_command_description(command_code, not self.is_server_protocol)
-        print(self.protocol_id, "  parsed command code: %s (%s) params: %s" %
-              (command_code, command_description, str(command_params)))
+        if tracer.is_enabled and tracer.is_sampled():
+            tracer.trace("%s  parsed command code: %s (%s) params: %s", self.protocol_id, command_code,
+                         self.get_command_description(command_code, not self.is_server_protocol), command_params)
 
         return command_code, command_params, params_count
 
@@ -385,6 +662,27 @@ class Protocol(SimpleProtocol):
             for plugin in self.plugins:
                 plugin.process_command(command_code, command_params, params_count)
 
+    def _dispatch_command(self, command_code, command_params, params_count):
+        """
+        Decode params by schema from dispatch table and call its handler.
+        Command with wrong params is rejected before handler called.
+        :return: False if command is not in dispatch table
+        """
+        schema_by_code = self.CLIENT_COMMAND_SCHEMA_BY_CODE if self.is_server_protocol \
+            else self.SERVER_COMMAND_SCHEMA_BY_CODE
+        schema = schema_by_code.get(command_code) if schema_by_code else None
+        if not schema:
+            return False
+
+        try:
+            kwargs = schema.decode(command_params, params_count)
+        except (ValueError, TypeError) as error:
+            self.logging.warning("Wrong params! Command rejected. %s command_code: %s command_params: %s (%s)",
+                                 error, command_code, command_params, self.address)
+            return True
+        getattr(self, schema.handler_name)(**kwargs)
+        return True
+
     # Utility
 
     def get_command_description(self, command_code, is_server_command=False):
@@ -394,6 +692,46 @@ class Protocol(SimpleProtocol):
             if description_by_code and command_code in description_by_code \
             else ("WRONG COMMAND!" if description_by_code else "-")
 
+    def get_command_complex_param_indexes(self, command_code, is_server_command=False):
+        complex_param_indexes_by_code = self.SERVER_COMMAND_COMPLEX_PARAM_INDEXES_BY_CODE if is_server_command \
+            else self.CLIENT_COMMAND_COMPLEX_PARAM_INDEXES_BY_CODE
+        return complex_param_indexes_by_code.get(command_code) if complex_param_indexes_by_code else None
+
+
+def broadcast(protocols, command, exclude_protocols=None, get_private_command=None, is_critical=True,
+              priority=SendPriority.NORMAL, merge_key=None):
+    """
+    Send same command to many protocols making and encoding it only once.
+    :param protocols: iterable of Protocol
+    :param command: iterable|str
+    :param exclude_protocols: protocols not to send to
+    :param get_private_command: function(protocol) which returns command to send to
+    given protocol instead of common one (e.g. with private data) or None
+    :param is_critical: see Protocol.send()
+    :param priority: see Protocol.send()
+    :param merge_key: see Protocol.send()
+    :return:
+    """
+    command_bytes_by_parser = {}
+    for protocol in protocols:
+        if not protocol or not protocol.send_bytes_method or \
+                (exclude_protocols and protocol in exclude_protocols) or \
+                (not is_critical and protocol.is_writing_paused):
+            continue
+        private_command = get_private_command(protocol) if get_private_command else None
+        if private_command is not None:
+            protocol.send(private_command, is_critical, priority, merge_key)
+            continue
+        # (Protocols share text and binary parsers)
+        parser = protocol.parser
+        command_bytes = command_bytes_by_parser.get(parser)
+        if command_bytes is None:
+            command_bytes = parser.make_command(command)
+            if not parser.is_binary:
+                command_bytes = command_bytes.encode("utf-8")
+            command_bytes_by_parser[parser] = command_bytes
+        protocol.send_raw(command_bytes, priority, merge_key)
+
 
 # Experimental
 class ProtocolPlugin:
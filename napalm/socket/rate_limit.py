@@ -0,0 +1,139 @@
+import threading
+import time
+
+
+class RateLimitAction:
+    # Process command later, when the limit lets it (needs config.timer_class)
+    DELAY = "delay"
+    # Skip command
+    DROP = "drop"
+    # Close connection
+    DISCONNECT = "disconnect"
+
+
+class RateLimit:
+    """
+    Settings of token bucket: rate commands per second on average with bursts up to burst commands.
+    :param action: RateLimitAction applied to commands over the limit
+    :param max_delayed_count: for DELAY, commands over this count are dropped
+    """
+
+    def __init__(self, rate, burst=None, action=RateLimitAction.DROP, max_delayed_count=10):
+        self.rate = rate
+        self.burst = burst or rate
+        self.action = action
+        self.max_delayed_count = max_delayed_count
+
+    def __repr__(self):
+        return "<RateLimit %s/sec burst: %s action: %s>" % (self.rate, self.burst, self.action)
+
+
+class TokenBucket:
+    def __init__(self, rate_limit, now):
+        self.rate_limit = rate_limit
+        self.tokens = rate_limit.burst
+        self.last_time = now
+
+    def _refill(self, now):
+        self.tokens = min(self.rate_limit.burst, self.tokens + (now - self.last_time) * self.rate_limit.rate)
+        self.last_time = now
+
+    def take(self, now):
+        """
+        :return: False if no tokens left
+        """
+        self._refill(now)
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def reserve(self, now):
+        """
+        Take token in advance (tokens go below zero for reserved ones).
+        :return: seconds to wait for reserved token (0 - available now),
+        or None if max_delayed_count of tokens already reserved
+        """
+        self._refill(now)
+        if self.tokens < 1 - self.rate_limit.max_delayed_count:
+            return None
+        self.tokens -= 1
+        return -self.tokens / self.rate_limit.rate if self.tokens < 0 else 0
+
+
+class RateLimiter:
+    """
+    Flood protection for a connection (see Protocol.process_bytes()).
+    Each command is checked by limit of its code (if any), and then by
+    limit for all commands of connection.
+    :param rate_limit_by_code: dict of RateLimit by command code
+    :param total_rate_limit: RateLimit for all commands
+    """
+
+    # Totals of all connections for monitoring: count of limited commands by action
+    _total_count_by_action = {}
+    _total_lock = threading.Lock()
+
+    @classmethod
+    def get_total_count_by_action(cls):
+        with cls._total_lock:
+            return dict(cls._total_count_by_action)
+
+    @classmethod
+    def reset_total_counts(cls):
+        with cls._total_lock:
+            cls._total_count_by_action.clear()
+
+    def __init__(self, rate_limit_by_code=None, total_rate_limit=None, get_time=time.monotonic):
+        self.rate_limit_by_code = rate_limit_by_code or {}
+        self.total_rate_limit = total_rate_limit
+        self.get_time = get_time
+
+        self._bucket_by_code = {}
+        self._total_bucket = None
+        # Counters for monitoring: {command_code: {action: count}}
+        self.count_by_action_by_code = {}
+
+    def check(self, command_code):
+        """
+        :return: (None, 0) if command could be processed now, otherwise (action, delay_sec),
+        where delay_sec - when to process command for DELAY (if there are too many
+        commands delayed already, DROP is returned instead)
+        """
+        now = self.get_time()
+        rate_limit = self.rate_limit_by_code.get(command_code)
+        if rate_limit:
+            bucket = self._bucket_by_code.get(command_code)
+            if not bucket:
+                bucket = self._bucket_by_code[command_code] = TokenBucket(rate_limit, now)
+            action, delay_sec = self._take(bucket, now)
+            if action:
+                self._count(command_code, action)
+                return action, delay_sec
+
+        if self.total_rate_limit:
+            if not self._total_bucket:
+                self._total_bucket = TokenBucket(self.total_rate_limit, now)
+            action, delay_sec = self._take(self._total_bucket, now)
+            if action:
+                self._count(command_code, action)
+                return action, delay_sec
+        return None, 0
+
+    @staticmethod
+    def _take(bucket, now):
+        if bucket.rate_limit.action != RateLimitAction.DELAY:
+            return (None, 0) if bucket.take(now) else (bucket.rate_limit.action, 0)
+        delay_sec = bucket.reserve(now)
+        if delay_sec is None:
+            return RateLimitAction.DROP, 0
+        return (RateLimitAction.DELAY, delay_sec) if delay_sec else (None, 0)
+
+    def _count(self, command_code, action):
+        count_by_action = self.count_by_action_by_code.get(command_code)
+        if count_by_action is None:
+            count_by_action = self.count_by_action_by_code[command_code] = {}
+        count_by_action[action] = count_by_action.get(action, 0) + 1
+
+        with self._total_lock:
+            RateLimiter._total_count_by_action[action] = RateLimiter._total_count_by_action.get(action, 0) + 1
@@ -1,7 +1,12 @@
-import errno
+import asyncio
+import collections
+import concurrent.futures
+import itertools
 import logging as _logging
+import selectors
 import socket
 import socketserver
+import struct
 import threading
 import time
 
@@ -15,7 +20,7 @@ logging = _logging.getLogger("SERVER")
 try:
     from twisted.internet import reactor
     from twisted.internet.protocol import connectionDone, Protocol, ServerFactory
-    from twisted.protocols.basic import LineReceiver
+    from twisted.protocols.basic import Int32StringReceiver, LineReceiver
 except ImportError:
     logging.warning("There is no Twisted module!")
 
@@ -34,6 +39,14 @@ class Config:
     DELIMITER = b"\x00"
     # 1200 - the most optimal max message size to fit IP(?) frame when using TCP
     RECV_SIZE = 1200  # 1024  # 4096
+    # Frames are prefixed with their length (4 bytes, big-endian) instead of ending with DELIMITER,
+    # so payload can contain any bytes. Should be the same for server and its clients
+    is_length_prefixed = False
+    # (For length-prefixed frames. Bigger frame is treated as protocol error)
+    MAX_FRAME_SIZE = 16 * 1024 * 1024
+    # Commands of received frames are processed as soon as they are received,
+    # not waiting for the end of frame (see CommandReceiveBuffer). Not for length-prefixed frames
+    is_streaming = False
 
     @property
     def host(self):
@@ -52,7 +65,368 @@ class Config:
 
 class ServerConfig(Config):
     logging = None
-    pass
+
+    # Size of thread pool to process frames (0 - separate thread for each connection)
+    max_threads = 0
+    # Max frames waiting for processing in thread pool
+    max_queue_size = 1000
+
+    # Limits of outbound queue of each connection, in bytes (0 - no limit).
+    # Over high watermark protocol is paused (non-critical updates are dropped)
+    # until queue gets under low watermark. Over max size client is disconnected.
+    send_high_watermark = 64 * 1024
+    send_low_watermark = 16 * 1024
+    send_max_size = 1024 * 1024
+
+    # Flood protection: limits of commands received by each connection (see RateLimiter).
+    # dict of RateLimit by command code, and RateLimit for all commands (None - no limit)
+    rate_limit_by_code = None
+    total_rate_limit = None
+
+    # Allow few processes to listen the same port (used by WorkerSupervisor)
+    is_reuse_port = False
+    # (Set by WorkerSupervisor for each worker process)
+    worker_index = 0
+    worker_count = 1
+
+
+LENGTH_PREFIX = struct.Struct("!I")
+
+
+class ReceiveBuffer:
+    """
+    Accumulates received bytes and splits them to frames by delimiter.
+
+    Data is read by recv_into() directly to preallocated bytearray, delimiter is
+    searched only in newly received bytes, and only incomplete frame is moved when
+    there is no space left. So large frames, received in many chunks, cost linear
+    time instead of quadratic (as with buffer += data_bytes; buffer.split()).
+    """
+
+    # (Buffer which grew for large frames is reallocated to this size after use)
+    max_idle_size = 65536
+
+    @property
+    def pending_bytes(self):
+        # (Incomplete frame)
+        return bytes(self._view[self._start:self._end])
+
+    def __init__(self, delimiter=Config.DELIMITER, recv_size=Config.RECV_SIZE, is_length_prefixed=False,
+                 max_frame_size=Config.MAX_FRAME_SIZE):
+        self.delimiter = delimiter
+        self.recv_size = recv_size
+        self.is_length_prefixed = is_length_prefixed
+        self.max_frame_size = max_frame_size
+        self._init_buffer(max(recv_size * 2, 4096))
+
+    def _init_buffer(self, size):
+        self._buffer = bytearray(size)
+        self._view = memoryview(self._buffer)
+        self._start = 0
+        self._end = 0
+        # (Position to continue searching delimiter from)
+        self._search_index = 0
+
+    def recv_from(self, sock):
+        """
+        Read available data from socket. Raises socket.error as socket.recv() does.
+        :return: count of received bytes (0 if connection is closed)
+        """
+        self._reserve(self.recv_size)
+        count = sock.recv_into(self._view[self._end:])
+        self._end += count
+        return count
+
+    def feed(self, data_bytes):
+        # (For transports which get data already received, e.g. asyncio)
+        self._reserve(len(data_bytes))
+        self._view[self._end:self._end + len(data_bytes)] = data_bytes
+        self._end += len(data_bytes)
+
+    def pop_frames(self):
+        """
+        Raises ValueError if length-prefixed frame is bigger than max_frame_size.
+        :return: list of complete frames (without delimiter or length prefix)
+        """
+        if self.is_length_prefixed:
+            return self._pop_length_prefixed_frames()
+
+        data_bytes_list = []
+        delimiter_size = len(self.delimiter)
+        while True:
+            index = self._buffer.find(self.delimiter, self._search_index, self._end)
+            if index < 0:
+                # (Delimiter could be received partially)
+                self._search_index = max(self._start, self._end - delimiter_size + 1)
+                break
+            data_bytes_list.append(bytes(self._view[self._start:index]))
+            self._start = self._search_index = index + delimiter_size
+
+        self._on_frames_popped()
+        return data_bytes_list
+
+    def _pop_length_prefixed_frames(self):
+        data_bytes_list = []
+        prefix_size = LENGTH_PREFIX.size
+        while self._end - self._start >= prefix_size:
+            frame_size = LENGTH_PREFIX.unpack_from(self._buffer, self._start)[0]
+            if self.max_frame_size and frame_size > self.max_frame_size:
+                raise ValueError("Frame size: %d is bigger than max: %d" % (frame_size, self.max_frame_size))
+            frame_end = self._start + prefix_size + frame_size
+            if frame_end > self._end:
+                # (Allocate for the whole frame at once)
+                self._reserve(frame_end - self._end)
+                break
+            data_bytes_list.append(bytes(self._view[self._start + prefix_size:frame_end]))
+            self._start = frame_end
+
+        self._on_frames_popped()
+        return data_bytes_list
+
+    def _on_frames_popped(self):
+        if self._start == self._end:
+            # All processed
+            if len(self._buffer) > self.max_idle_size:
+                self._init_buffer(self.max_idle_size)
+            else:
+                self._start = self._end = self._search_index = 0
+
+    def clear(self):
+        self._start = self._end = self._search_index = 0
+
+    def _reserve(self, size):
+        if len(self._buffer) - self._end >= size:
+            return
+        pending_size = self._end - self._start
+        if len(self._buffer) - pending_size >= size and pending_size < self._start:
+            # Move incomplete frame to the beginning
+            # (Only if it's smaller than freed space, so the moving costs not more than receiving)
+            self._buffer[:pending_size] = self._view[self._start:self._end]
+        else:
+            # Grow (at least twice to make growing cost linear)
+            buffer = bytearray(max(len(self._buffer) * 2, pending_size + size))
+            buffer[:pending_size] = self._view[self._start:self._end]
+            self._view.release()
+            self._buffer = buffer
+            self._view = memoryview(buffer)
+        self._search_index -= self._start
+        self._start = 0
+        self._end = pending_size
+
+
+class CommandReceiveBuffer(ReceiveBuffer):
+    """
+    ReceiveBuffer which pops commands instead of frames (see Config.is_streaming).
+
+    Each command is popped as soon as its command delimiter (b"##") is received,
+    so processing of large multi-command frames starts before the whole frame is
+    received, and frames are never copied, decoded or split as a whole. Frames
+    which start with binary_prefix (binary codec) are popped whole. Rest of frame
+    after last command delimiter (if any) is popped as a command.
+    """
+
+    def __init__(self, delimiter=Config.DELIMITER, recv_size=Config.RECV_SIZE, command_delimiter=b"##",
+                 binary_prefix=None):
+        super().__init__(delimiter, recv_size)
+        self.command_delimiter = command_delimiter
+        self.binary_prefix = binary_prefix
+        # (End of current frame if received, -1 otherwise)
+        self._frame_end = -1
+        # (Position to continue searching command delimiter from)
+        self._command_search_index = 0
+        # (None while start of frame is not received)
+        self._is_binary_frame = None
+
+    def pop_frames(self):
+        """
+        :return: list of complete commands (without delimiters)
+        """
+        commands = []
+        buffer = self._buffer
+        delimiter_size = len(self.delimiter)
+        command_delimiter_size = len(self.command_delimiter)
+        while self._start < self._end:
+            if self._is_binary_frame is None:
+                if self.binary_prefix and self._end - self._start < len(self.binary_prefix):
+                    break
+                self._is_binary_frame = bool(self.binary_prefix) and buffer.startswith(self.binary_prefix,
+                                                                                       self._start)
+            if self._frame_end < 0:
+                self._frame_end = buffer.find(self.delimiter, self._search_index, self._end)
+                if self._frame_end < 0:
+                    # (Delimiter could be received partially)
+                    self._search_index = max(self._start, self._end - delimiter_size + 1)
+
+            search_end = self._frame_end if self._frame_end >= 0 else self._end
+            if not self._is_binary_frame and \
+                    buffer.find(self.command_delimiter, self._command_search_index, search_end) >= 0:
+                # (All received commands are split at once, as CommandParser.split_commands() does)
+                command_list = bytes(self._view[self._start:search_end]).split(self.command_delimiter)
+                commands.extend(command_list[:-1])
+                self._start = search_end - len(command_list[-1])
+
+            if self._frame_end < 0:
+                # (Command delimiter could be received partially)
+                self._command_search_index = max(self._start, self._end - command_delimiter_size + 1)
+                break
+            # Rest of frame
+            if self._frame_end > self._start:
+                commands.append(bytes(self._view[self._start:self._frame_end]))
+            self._start = self._search_index = self._command_search_index = self._frame_end + delimiter_size
+            self._frame_end = -1
+            self._is_binary_frame = None
+
+        self._on_frames_popped()
+        return commands
+
+    def clear(self):
+        super().clear()
+        self._frame_end = -1
+        self._command_search_index = 0
+        self._is_binary_frame = None
+
+    def _init_buffer(self, size):
+        super()._init_buffer(size)
+        # (Positions are reset, but not the state of current frame)
+        self._frame_end = -1
+        self._command_search_index = 0
+
+    def _on_frames_popped(self):
+        super()._on_frames_popped()
+        if self._start == self._end:
+            self._command_search_index = 0
+
+    def _reserve(self, size):
+        start = self._start
+        super()._reserve(size)
+        if self._start != start:
+            # Moved
+            if self._frame_end >= 0:
+                self._frame_end -= start
+            self._command_search_index -= start
+
+
+class SendQueue:
+    """
+    Outbound data of a connection which could not be sent at once (slow client).
+    Queued frames are sent coalesced by single sendmsg(). Urgent frames (e.g. game
+    state) are sent before all others queued, but after frames already being sent.
+    """
+
+    # (IOV_MAX is 1024 on Linux)
+    max_send_count = 512
+
+    def __init__(self, high_watermark=0, low_watermark=0, max_size=0, on_pause=None, on_resume=None):
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark
+        self.max_size = max_size
+        self.on_pause = on_pause
+        self.on_resume = on_resume
+
+        self.is_paused = False
+        # (Frames got by peek() and not sent yet (first one could be sent partially),
+        # then urgent frames, then others)
+        self._sending_data_list = collections.deque()
+        self._urgent_data_list = collections.deque()
+        self._data_list = collections.deque()
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def is_overflown(self):
+        return bool(self.max_size) and self._size > self.max_size
+
+    def put(self, data_bytes, is_urgent=False):
+        """
+        :return: False if max_size exceeded
+        """
+        if is_urgent:
+            self._urgent_data_list.append(data_bytes)
+        else:
+            self._data_list.append(data_bytes)
+        self._size += len(data_bytes)
+        if not self.is_paused and self.high_watermark and self._size >= self.high_watermark:
+            self.is_paused = True
+            if self.on_pause:
+                self.on_pause()
+        return not self.is_overflown
+
+    def peek(self):
+        """
+        :return: frames to send, in order (only they can be consumed then)
+        """
+        sending_data_list = self._sending_data_list
+        for data_list in (self._urgent_data_list, self._data_list):
+            while data_list and len(sending_data_list) < self.max_send_count:
+                sending_data_list.append(data_list.popleft())
+        return list(sending_data_list)
+
+    def send(self, sock):
+        """
+        Send as much as socket can take. Raises socket.error as socket.send() does.
+        :return: count of sent bytes
+        """
+        data_list = self.peek()
+        if hasattr(sock, "sendmsg"):
+            count = sock.sendmsg(data_list)
+        else:
+            count = sock.send(b"".join(data_list))
+        self.consume(count)
+        return count
+
+    def consume(self, count):
+        self._size -= count
+        while count:
+            if not self._sending_data_list:
+                self._sending_data_list.append(self._urgent_data_list.popleft() if self._urgent_data_list
+                                               else self._data_list.popleft())
+            data_bytes = self._sending_data_list[0]
+            if count < len(data_bytes):
+                self._sending_data_list[0] = memoryview(data_bytes)[count:]
+                break
+            count -= len(data_bytes)
+            self._sending_data_list.popleft()
+        if self.is_paused and self._size <= self.low_watermark:
+            self.is_paused = False
+            if self.on_resume:
+                self.on_resume()
+
+    def clear(self):
+        self._sending_data_list.clear()
+        self._urgent_data_list.clear()
+        self._data_list.clear()
+        self._size = 0
+
+
+def create_receive_buffer(config, protocol=None):
+    if config.is_streaming and not config.is_length_prefixed:
+        # (Protocols without text parser get frames)
+        parser = getattr(protocol, "parser", None)
+        if parser and not parser.is_binary:
+            binary_parser = getattr(protocol, "binary_parser", None)
+            return CommandReceiveBuffer(config.DELIMITER, config.RECV_SIZE, parser.COMMAND_DELIM.encode("utf-8"),
+                                        binary_parser.START if binary_parser else None)
+    return ReceiveBuffer(config.DELIMITER, config.RECV_SIZE, config.is_length_prefixed, config.MAX_FRAME_SIZE)
+
+
+def make_frame(config, data_bytes):
+    if config.is_length_prefixed:
+        return LENGTH_PREFIX.pack(len(data_bytes)) + data_bytes
+    return data_bytes + config.DELIMITER
+
+
+def create_send_queue(config, protocol=None):
+    return SendQueue(config.send_high_watermark, config.send_low_watermark, config.send_max_size,
+                     getattr(protocol, "pause_writing", None), getattr(protocol, "resume_writing", None))
+
+
+def set_reuse_port(sock):
+    if not hasattr(socket, "SO_REUSEPORT"):
+        logging.warning("SO_REUSEPORT is not supported on current platform")
+        return
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
 
 
 class ProtocolFactory:
@@ -141,6 +515,76 @@ class TwistedHandler(LineReceiver):
         self.protocol = None
 
 
+class TwistedLengthPrefixedHandler(Int32StringReceiver):
+    """
+    TwistedHandler for config.is_length_prefixed.
+    """
+
+    protocol = None
+
+    def connectionMade(self):
+        # Config
+        self.MAX_LENGTH = self.factory.config.MAX_FRAME_SIZE
+        # Create app protocol
+        address = self.transport.getPeer()
+        self.protocol = self.factory.protocol_factory.create(self.sendString, self.transport.loseConnection,
+                                                             (address.host, address.port))
+        logging.debug("connectionMade for %s protocol: %s", address, self.protocol)
+
+    def stringReceived(self, string):
+        # logging.debug("dataReceived for %s line: %s", self.protocol, string)
+        if string:
+            self.protocol.process_bytes_list((string,))
+
+    def lengthLimitExceeded(self, length):
+        logging.debug(" (connectionLost for %s reason: Frame size: %d is bigger than max: %d)",
+                      self.protocol, length, self.MAX_LENGTH)
+        self.transport.loseConnection()
+
+    def connectionLost(self, reason=connectionDone):
+        logging.debug("connectionLost for %s reason: %s", self.protocol, reason)
+        self.protocol.dispose()
+        self.protocol = None
+
+
+class TwistedStreamHandler(Protocol):
+    """
+    TwistedHandler for config.is_streaming: received data is split by ReceiveBuffer
+    (CommandReceiveBuffer), as for other servers.
+    """
+
+    protocol = None
+    receive_buffer = None
+
+    def connectionMade(self):
+        # Create app protocol
+        address = self.transport.getPeer()
+        self.protocol = self.factory.protocol_factory.create(self.send_bytes, self.transport.loseConnection,
+                                                             (address.host, address.port))
+        self.receive_buffer = create_receive_buffer(self.factory.config, self.protocol)
+        logging.debug("connectionMade for %s protocol: %s", address, self.protocol)
+
+    def send_bytes(self, data_bytes):
+        self.transport.write(make_frame(self.factory.config, data_bytes))
+
+    def dataReceived(self, data):
+        self.receive_buffer.feed(data)
+        data_bytes_list = self.receive_buffer.pop_frames()
+        if data_bytes_list:
+            self.protocol.process_bytes_list(data_bytes_list)
+
+    def connectionLost(self, reason=connectionDone):
+        logging.debug("connectionLost for %s reason: %s", self.protocol, reason)
+        self.protocol.dispose()
+        self.protocol = None
+
+
+def get_twisted_handler_class(config):
+    if config.is_length_prefixed:
+        return TwistedLengthPrefixedHandler
+    return TwistedStreamHandler if config.is_streaming else TwistedHandler
+
+
 class TwistedTCPServer(AbstractServer):
     factory = None
     port = None
@@ -149,7 +593,7 @@ class TwistedTCPServer(AbstractServer):
         super().__init__(config, app)
 
         self.factory = ServerFactory()
-        self.factory.protocol = TwistedHandler
+        self.factory.protocol = get_twisted_handler_class(config)
         # Custom references
         self.factory.config = config
         self.factory.protocol_factory = self.protocol_factory
@@ -175,6 +619,8 @@ class TwistedTCPServer(AbstractServer):
         logging.debug("Server starting... address: %s", (self.config.host, self.config.port))
         self.started = True
         self.__started_lock.release()
+        if self.config.is_reuse_port:
+            logging.warning("is_reuse_port is not supported by %s", self.__class__.__name__)
         self.port = reactor.listenTCP(self.config.port, self.factory)
         if not reactor.running:
             reactor.run()
@@ -227,7 +673,8 @@ class ThreadedTCPHandler(socketserver.BaseRequestHandler):
     # static
     abort = False
 
-    buffer_bytes = b""
+    receive_buffer = None
+    send_queue = None
     # is_first = True
 
     config = None
@@ -236,8 +683,14 @@ class ThreadedTCPHandler(socketserver.BaseRequestHandler):
     def setup(self):
         threading.current_thread().name += "-srv-handler"
         self.config = self.server.config
+        self._send_lock = threading.RLock()
+        self._flush_thread = None
         self.protocol = self.server.protocol_factory.create(self.send_bytes, self.request.close,
                                                             self.client_address)
+        # (See SendPriority)
+        self.protocol.send_urgent_bytes_method = self.send_urgent_bytes
+        self.receive_buffer = create_receive_buffer(self.config, self.protocol)
+        self.send_queue = create_send_queue(self.config, self.protocol)
         logging.debug("connectionMade for %s protocol: %s", self.client_address, self.protocol)
 
     def finish(self):
@@ -246,34 +699,77 @@ class ThreadedTCPHandler(socketserver.BaseRequestHandler):
         self.protocol = None
         self.config = None
 
-    def send_bytes(self, data_bytes):
+    def send_bytes(self, data_bytes, is_urgent=False):
         # logging.debug("sendData for %s line: %s", self.protocol, data_bytes)
-        self.request.sendall(data_bytes + self.config.DELIMITER)
+        data_bytes = make_frame(self.config, data_bytes)
+        with self._send_lock:
+            if not self.send_queue:
+                # (Don't block caller (e.g. game thread) if client is slow)
+                try:
+                    sent_count = self.request.send(data_bytes, getattr(socket, "MSG_DONTWAIT", 0))
+                except (BlockingIOError, InterruptedError):
+                    sent_count = 0
+                if sent_count == len(data_bytes):
+                    return
+                data_bytes = data_bytes[sent_count:]
+
+            # Send the rest from other thread
+            # (Rest of partially sent frame goes first to not be interleaved with others)
+            is_urgent = is_urgent or not self.send_queue
+            if not self.send_queue.put(data_bytes, is_urgent):
+                logging.warning("Send queue limit exceeded for %s (%d bytes). Disconnecting...",
+                                self.protocol, len(self.send_queue))
+                self.send_queue.clear()
+                # (Makes recv() in handle() return)
+                self.request.shutdown(socket.SHUT_RDWR)
+                return
+            if not self._flush_thread:
+                self._flush_thread = threading.Thread(target=self._flush, name="srv-handler-flush", daemon=True)
+                self._flush_thread.start()
+
+    def send_urgent_bytes(self, data_bytes):
+        self.send_bytes(data_bytes, True)
+
+    def _flush(self):
+        while True:
+            with self._send_lock:
+                data_bytes = b"".join(self.send_queue.peek())
+                if not data_bytes:
+                    self._flush_thread = None
+                    return
+            try:
+                self.request.sendall(data_bytes)
+            except socket.error as error:
+                logging.debug(" (connectionLost (while sending) for %s reason: %s)", self.protocol, error)
+                with self._send_lock:
+                    self.send_queue.clear()
+                    self._flush_thread = None
+                return
+            with self._send_lock:
+                self.send_queue.consume(len(data_bytes))
 
     def handle(self):
         while not self.server.abort:
             # Read
-            is_data = True
-            data_bytes = None
-            while not self.server.abort and is_data and self.config.DELIMITER not in self.buffer_bytes:
+            count = 0
+            data_bytes_list = []
+            while not self.server.abort and not data_bytes_list:
                 try:
-                    data_bytes = self.request.recv(self.config.RECV_SIZE)
-                    is_data = bool(data_bytes)
-                    self.buffer_bytes += data_bytes
-                except socket.error as error:
+                    count = self.receive_buffer.recv_from(self.request)
+                    if not count:
+                        break
+                    # Parse bytes
+                    # b"command1##command2##\x00command3##\x00" -> [b"command1##command2##", b"command3##"]
+                    # b"1||param||##5||param||##\x0010||param||##\x00" ->
+                    #  [b"1||param||##5||param||##", b"10||param||##"]
+                    data_bytes_list = self.receive_buffer.pop_frames()
+                # (ValueError: wrong frame)
+                except (socket.error, ValueError) as error:
                     # Note: current buffer won't be processed, but it usually empty in such cases
                     logging.debug(" (connectionLost (abort) for %s reason: %s)", self.protocol, error)
                     return
 
-            # Parse bytes
-            # b"command1##command2##\x00command3##\x00" -> [b"command1##command2##", b"command3##", b""]
-            # b"1||param||##5||param||##\x0010||param||##\x00" ->
-            #  [b"1||param||##5||param||##", b"10||param||##", b""]
-            if self.buffer_bytes:
-                # print("TEMP SERVER config:", self.server and self.config)
-                data_bytes_list = self.buffer_bytes.split(self.config.DELIMITER)
-                self.buffer_bytes = data_bytes_list.pop()
-
+            if data_bytes_list:
                 # Process
                 try:
                     # (Try-except: because send method could be invoked during processing)
@@ -285,19 +781,29 @@ class ThreadedTCPHandler(socketserver.BaseRequestHandler):
                     logging.debug(" (connectionLost for %s reason: %s)", self.protocol, error)
                     return
 
-            if not data_bytes:
+            if not count:
                 if not self.server.abort:
-                    reason = "(Empty data received: %s)" % data_bytes
+                    reason = "(Empty data received)"
                     logging.debug(" (connectionLost for %s reason: %s)", self.protocol, reason)
                 return
 
 
 class ThreadedTCPServer(AbstractServer):
+    """
+    Thread per connection, or bounded thread pool if config.max_threads is set
+    (then ThreadPoolTCPServer is used under the hood).
+    """
+
     server = None
+    pool_server = None
 
     def __init__(self, config, app=None):
         super().__init__(config, app)
 
+        if config and config.max_threads:
+            self.pool_server = ThreadPoolTCPServer(config, app)
+            self.pool_server.protocol_factory = self.protocol_factory
+
         self.started = False
         self.__started_lock = threading.RLock()
         self.__shutdown_event = threading.Event()
@@ -310,6 +816,9 @@ class ThreadedTCPServer(AbstractServer):
         if not self.config:
             logging.error("Server is not initialized")
             return
+        if self.pool_server:
+            self.pool_server.start()
+            return
         self.__started_lock.acquire()
         if self.started:
             logging.warning("Server is already running. address: %s", (self.config.host, self.config.port))
@@ -321,7 +830,13 @@ class ThreadedTCPServer(AbstractServer):
         logging.debug("Server starting... address: %s", address)
         self.started = True
         self.__started_lock.release()
-        self.server = socketserver.ThreadingTCPServer(address, ThreadedTCPHandler)
+        if self.config.is_reuse_port:
+            self.server = socketserver.ThreadingTCPServer(address, ThreadedTCPHandler, bind_and_activate=False)
+            set_reuse_port(self.server.socket)
+            self.server.server_bind()
+            self.server.server_activate()
+        else:
+            self.server = socketserver.ThreadingTCPServer(address, ThreadedTCPHandler)
         self.server.protocol_factory = self.protocol_factory
         self.server.config = self.config
         self.server.abort = False
@@ -350,6 +865,9 @@ class ThreadedTCPServer(AbstractServer):
         # sys.exit()
 
     def stop(self):
+        if self.pool_server:
+            self.pool_server.stop()
+            return
         self.__started_lock.acquire()
         if not self.started:
             logging.warning("Server is not running. address: %s", (self.config.host, self.config.port))
@@ -369,15 +887,29 @@ class ThreadedTCPServer(AbstractServer):
 # Non-blocking
 
 class NonBlockingTCPServer(AbstractServer):
+    """
+    All connections are served in single thread. Sockets are watched by selector
+    (epoll on Linux), so only ready sockets are touched and idle server doesn't use CPU.
+    """
+
     _sock = None
+    _selector = None
+    _wakeup_sock = None
+
+    # Max connections accepted on one readiness event of listening socket
+    accept_batch_size = 64
+    # (Selector wakes up at least once per this time to check abort flag)
+    select_timeout_sec = .5
 
     def __init__(self, config, app=None):
         super().__init__(config, app)
 
-        # (Needed for walking through all connections on each tick and receiving available data)
-        self._protocol_list = []
-        self._request_by_protocol = {}
-        self._buffer_by_protocol = {}
+        self._protocol_by_request = {}
+        self._buffer_by_request = {}
+        # (Data which was not sent because kernel buffer was full)
+        self._send_queue_by_request = {}
+        # (send_bytes() could be called from other threads, e.g. by timers)
+        self._lock = threading.RLock()
 
         self._abort = False
         self.started = False
@@ -405,6 +937,8 @@ class NonBlockingTCPServer(AbstractServer):
 
         self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if self.config.is_reuse_port:
+            set_reuse_port(self._sock)
 
         self._sock.bind(address)
         self._sock.listen()
@@ -427,11 +961,11 @@ class NonBlockingTCPServer(AbstractServer):
         self._sock = None
 
         # (list() needed to make a copy)
-        for protocol in list(self._protocol_list):
+        for protocol in list(self._protocol_by_request.values()):
             protocol.dispose()
-        self._protocol_list.clear()
-        self._request_by_protocol.clear()
-        self._buffer_by_protocol.clear()
+        self._protocol_by_request.clear()
+        self._buffer_by_request.clear()
+        self._send_queue_by_request.clear()
         logging.debug("Server shut down")
         # logging.debug("Server stopped")
         self.__shutdown_event.set()
@@ -454,83 +988,479 @@ class NonBlockingTCPServer(AbstractServer):
         self.started = False
         self.__started_lock.release()
         self._abort = True
+        self._wakeup()
         self.__shutdown_event.wait()
         logging.debug("Server stopped")
 
-    def _process_disconnect(self, protocol, error):
-        logging.debug("connectionLost for %s reason: %s", protocol, error)
-        protocol.dispose()
-        self._protocol_list.remove(protocol)
-        if protocol in list(self._request_by_protocol):
-            del self._request_by_protocol[protocol]
-        if protocol in list(self._buffer_by_protocol):
-            del self._buffer_by_protocol[protocol]
+    def _wakeup(self):
+        # (Interrupt waiting in select())
+        wakeup_sock = self._wakeup_sock
+        if wakeup_sock:
+            try:
+                wakeup_sock.send(b"\x00")
+            except socket.error:
+                pass
 
     def _workflow(self, sock):
-        while not self._abort:
-            # print("SERVER. While...")
-            # Connect
-            request, address = None, None
+        self._selector = selectors.DefaultSelector()
+        wakeup_reader, self._wakeup_sock = socket.socketpair()
+        wakeup_reader.setblocking(0)
+        self._selector.register(sock, selectors.EVENT_READ, self._accept)
+        self._selector.register(wakeup_reader, selectors.EVENT_READ, self._read_wakeup)
+        try:
+            while not self._abort:
+                for key, mask in self._selector.select(self.select_timeout_sec):
+                    if self._abort:
+                        break
+                    if key.data:
+                        # Listening socket or wakeup
+                        key.data(key.fileobj)
+                        continue
+                    request = key.fileobj
+                    if mask & selectors.EVENT_WRITE:
+                        self._write(request)
+                    if mask & selectors.EVENT_READ:
+                        self._read(request)
+        finally:
+            with self._lock:
+                self._selector.close()
+                self._selector = None
+                self._wakeup_sock.close()
+                self._wakeup_sock = None
+            wakeup_reader.close()
+
+    def _read_wakeup(self, wakeup_reader):
+        try:
+            wakeup_reader.recv(self.config.RECV_SIZE)
+        except socket.error:
+            pass
+
+    def _accept(self, sock):
+        for _ in range(self.accept_batch_size):
             try:
                 request, address = sock.accept()
-            # socket.error (real error is [WinError 10035])
+            except (BlockingIOError, InterruptedError):
+                # There is no more new connections
+                break
+            except socket.error as error:
+                logging.error("Error while accepting connection: %s", error)
+                break
+
+            # New connection
+            request.setblocking(0)
+            with self._lock:
+                self._selector.register(request, selectors.EVENT_READ)
+
+            # (Default arguments to bind current request to closures)
+            def send_bytes(data_bytes, request=request):
+                # logging.debug("sendData for %s line: %s", self.protocol, data_bytes)
+                self._send(request, make_frame(self.config, data_bytes))
+
+            def send_urgent_bytes(data_bytes, request=request):
+                self._send(request, make_frame(self.config, data_bytes), True)
+
+            def close_connection(request=request):
+                self._remove_request(request)
+
+            # Create protocol
+            try:
+                protocol = self.protocol_factory.create(send_bytes, close_connection, address)
             except Exception as error:
-                # print("accept error:", error)
-                # There is no new connections - skip
+                logging.error("Error while creating protocol for %s: %s", address, error)
+                self._remove_request(request)
+                continue
+            # (See SendPriority)
+            protocol.send_urgent_bytes_method = send_urgent_bytes
+            logging.debug("connectionMade for %s protocol: %s", address, protocol)
+            with self._lock:
+                # (Protocol could be disposed while creating)
+                if request.fileno() >= 0:
+                    self._protocol_by_request[request] = protocol
+
+    def _send(self, request, data_bytes, is_urgent=False):
+        with self._lock:
+            if request.fileno() < 0:
+                # (Already closed)
+                return
+            send_queue = self._send_queue_by_request.get(request)
+            if send_queue:
+                # (Preserve order: previous data is not sent yet)
+                self._put_to_send_queue(request, send_queue, data_bytes, is_urgent)
+                return
+
+            try:
+                sent_count = request.send(data_bytes)
+            except (BlockingIOError, InterruptedError):
+                sent_count = 0
+            except socket.error as error:
+                # (Could be called from any thread, so disconnect here and not raise)
+                self._process_disconnect(request, error)
+                return
+            if sent_count < len(data_bytes):
+                # Kernel buffer is full - send the rest when socket gets writable
+                if send_queue is None:
+                    send_queue = create_send_queue(self.config, self._protocol_by_request.get(request))
+                    self._send_queue_by_request[request] = send_queue
+                # (Rest of partially sent frame goes first to not be interleaved with others)
+                if self._put_to_send_queue(request, send_queue, data_bytes[sent_count:], True):
+                    self._modify_events(request, selectors.EVENT_READ | selectors.EVENT_WRITE)
+
+    def _put_to_send_queue(self, request, send_queue, data_bytes, is_urgent=False):
+        if send_queue.put(data_bytes, is_urgent):
+            return True
+        logging.warning("Send queue limit exceeded for %s (%d bytes). Disconnecting...",
+                        self._protocol_by_request.get(request), len(send_queue))
+        send_queue.clear()
+        self._process_disconnect(request, "(Send queue limit exceeded)")
+        return False
+
+    def _write(self, request):
+        with self._lock:
+            send_queue = self._send_queue_by_request.get(request)
+            if send_queue:
+                try:
+                    # (All queued frames by one syscall)
+                    send_queue.send(request)
+                except (BlockingIOError, InterruptedError):
+                    return
+                except socket.error as error:
+                    self._process_disconnect(request, error)
+                    return
+            if not send_queue:
+                self._send_queue_by_request.pop(request, None)
+                self._modify_events(request, selectors.EVENT_READ)
+
+    def _modify_events(self, request, events):
+        if self._selector:
+            try:
+                self._selector.modify(request, events)
+            except (KeyError, ValueError):
+                # (Not registered or already closed)
                 pass
-            if request:
-                # New connection
-                def send_bytes(data_bytes):
-                    # logging.debug("sendData for %s line: %s", self.protocol, data_bytes)
-                    request.sendall(data_bytes + self.config.DELIMITER)
-
-                # Create protocol
-                protocol = self.protocol_factory.create(send_bytes, request.close, address)
-                logging.debug("connectionMade for %s protocol: %s", address, protocol)
-                self._protocol_list.append(protocol)
-                self._request_by_protocol[protocol] = request
-
-            # Walk through all connections looking for new data to receive
-            i = 0
-            for protocol in self._protocol_list:
-                i += 1
-                request = self._request_by_protocol[protocol]
-
-                # Read
-                buffer_bytes = self._buffer_by_protocol.get(self, b"")
-                is_data = True
-                data_bytes = None
-                while is_data:
-                    try:
-                        data_bytes = request.recv(self.config.RECV_SIZE)
-                        is_data = bool(data_bytes)
-                        buffer_bytes += data_bytes
-                        # print("SERVER. recv data_bytes:", data_bytes, "buffer_bytes:", buffer_bytes)
-                    # socket.error
-                    except Exception as error:
-                        # (break) is_data = False
-                        # print("SERVER. Error (recv)", error)
-                        if not hasattr(error, "errno") or error.errno != errno.EWOULDBLOCK:
-                            self._process_disconnect(protocol, error)
-                        # Process next connection for both disconnect and no data received now
-                        break
-                    if not data_bytes:
-                        self._process_disconnect(protocol, "(Empty data received: %s)" % data_bytes)
 
-                if not buffer_bytes:
-                    continue
+    def _read(self, request):
+        with self._lock:
+            protocol = self._protocol_by_request.get(request)
+            receive_buffer = self._buffer_by_request.get(request)
+        if not receive_buffer:
+            receive_buffer = create_receive_buffer(self.config, protocol)
+        try:
+            count = receive_buffer.recv_from(request)
+        except (BlockingIOError, InterruptedError):
+            return
+        # socket.error
+        except Exception as error:
+            self._process_disconnect(request, error)
+            return
+        if not count:
+            self._process_disconnect(request, "(Empty data received)")
+            return
 
-                # Parse bytes
-                data_bytes_list = buffer_bytes.split(self.config.DELIMITER)
-                self._buffer_by_protocol[self] = data_bytes_list.pop()
+        with self._lock:
+            if request not in self._protocol_by_request:
+                # (Disconnected from other thread)
+                return
+            self._buffer_by_request[request] = receive_buffer
+        # Parse bytes
+        # (Buffer is used only by selector thread, so no lock needed)
+        try:
+            data_bytes_list = receive_buffer.pop_frames()
+        except ValueError as error:
+            self._process_disconnect(request, error)
+            return
 
-                # Process
+        # Process
+        if protocol and data_bytes_list:
+            logging.debug("dataReceived for %s lines: %s", protocol, data_bytes_list)
+            self._process(request, protocol, data_bytes_list)
+
+    def _process(self, request, protocol, data_bytes_list):
+        try:
+            # (Try-except: because send method could be invoked during processing)
+            protocol.process_bytes_list(data_bytes_list)
+        # socket.error
+        except Exception as error:
+            self._process_disconnect(request, error)
+
+    def _process_disconnect(self, request, error):
+        with self._lock:
+            protocol = self._protocol_by_request.get(request)
+        logging.debug("connectionLost for %s reason: %s", protocol, error)
+        if protocol:
+            # (Calls _remove_request())
+            protocol.dispose()
+        self._remove_request(request)
+
+    def _remove_request(self, request):
+        with self._lock:
+            if self._selector:
                 try:
-                    # (Try-except: because send method could be invoked during processing)
-                    if protocol and data_bytes_list:
-                        logging.debug("dataReceived for %s line: %s", protocol, buffer_bytes)
-                        protocol.process_bytes_list(data_bytes_list)
-                # socket.error
-                except Exception as error:
-                    self._process_disconnect(protocol, error)
-                    break
+                    self._selector.unregister(request)
+                except (KeyError, ValueError):
+                    pass
+            self._protocol_by_request.pop(request, None)
+            self._buffer_by_request.pop(request, None)
+            self._send_queue_by_request.pop(request, None)
+            request.close()
+
+
+# Thread pool
+
+class ThreadPoolTCPServer(NonBlockingTCPServer):
+    """
+    I/O for all connections is made in single thread by selector (as in NonBlockingTCPServer),
+    while received frames are processed by bounded pool of config.max_threads threads.
+    Frames of each connection are processed in order, one at a time.
+
+    If more than config.max_queue_size frames are waiting for processing, receiving is
+    paused until the pool catches up.
+    """
+
+    _executor = None
+
+    def __init__(self, config, app=None):
+        super().__init__(config, app)
+
+        self._task_queue_by_request = {}
+        self._queue_semaphore = None
+
+    def _workflow(self, sock):
+        self._queue_semaphore = threading.BoundedSemaphore(self.config.max_queue_size)
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            self.config.max_threads)
+        try:
+            super()._workflow(sock)
+        finally:
+            # (Wait for all frames processed before disposing protocols)
+            self._executor.shutdown(wait=True)
+            self._executor = None
+            self._task_queue_by_request.clear()
+
+    def _process(self, request, protocol, data_bytes_list):
+        def process():
+            super(ThreadPoolTCPServer, self)._process(request, protocol, data_bytes_list)
+        self._submit(request, process)
+
+    def _process_disconnect(self, request, error):
+        with self._lock:
+            protocol = self._protocol_by_request.pop(request, None)
+            # (Stop receiving right now)
+            if self._selector:
+                try:
+                    self._selector.unregister(request)
+                except (KeyError, ValueError):
+                    pass
+        logging.debug("connectionLost for %s reason: %s", protocol, error)
+
+        # (Dispose after all frames received before are processed)
+        def dispose():
+            if protocol:
+                protocol.dispose()
+            self._remove_request(request)
+        self._submit(request, dispose, is_bounded=False)
+
+    def _submit(self, request, task, is_bounded=True):
+        if is_bounded:
+            # (Pause receiving if queue is full)
+            while not self._queue_semaphore.acquire(timeout=self.select_timeout_sec):
+                if self._abort:
+                    return
+        with self._lock:
+            task_queue = self._task_queue_by_request.get(request)
+            if task_queue is not None:
+                # (Connection's frames are being processed - add to the end)
+                task_queue.append((task, is_bounded))
+                return
+            self._task_queue_by_request[request] = collections.deque([(task, is_bounded)])
+        executor = self._executor
+        try:
+            if executor:
+                executor.submit(self._run_tasks, request)
+                return
+        except RuntimeError:
+            # (Executor is shut down)
+            pass
+        self._run_tasks(request)
+
+    def _run_tasks(self, request):
+        while True:
+            with self._lock:
+                task_queue = self._task_queue_by_request.get(request)
+                if not task_queue:
+                    self._task_queue_by_request.pop(request, None)
+                    return
+                task, is_bounded = task_queue.popleft()
+            if is_bounded:
+                self._queue_semaphore.release()
+            try:
+                task()
+            except Exception as error:
+                logging.error("Error while processing task for %s: %s", request, error)
+
+
+# Asyncio
+
+class AsyncioHandler(asyncio.Protocol):
+    """
+    Adapter between asyncio transport and app protocol (same as TwistedHandler for Twisted).
+    """
+
+    config = None
+    protocol = None
+    transport = None
+
+    def __init__(self, server):
+        self.server = server
+        self.receive_buffer = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.config = self.server.config
+        self.server.handler_set.add(self)
+        # Create app protocol
+        address = transport.get_extra_info("peername")
+        self.protocol = self.server.protocol_factory.create(self.send_bytes, transport.close, address)
+        self.receive_buffer = create_receive_buffer(self.config, self.protocol)
+        logging.debug("connectionMade for %s protocol: %s", address, self.protocol)
+        # (Transport's buffer is used as send queue and calls pause_writing()/resume_writing())
+        transport.set_write_buffer_limits(self.config.send_high_watermark, self.config.send_low_watermark)
+
+    def send_bytes(self, data_bytes):
+        # logging.debug("sendData for %s line: %s", self.protocol, data_bytes)
+        if self.transport:
+            self.transport.write(make_frame(self.config, data_bytes))
+            if self.config.send_max_size and self.transport.get_write_buffer_size() > self.config.send_max_size:
+                logging.warning("Send queue limit exceeded for %s (%d bytes). Disconnecting...",
+                                self.protocol, self.transport.get_write_buffer_size())
+                self.transport.abort()
+
+    def pause_writing(self):
+        if self.protocol:
+            self.protocol.pause_writing()
+
+    def resume_writing(self):
+        if self.protocol:
+            self.protocol.resume_writing()
+
+    def data_received(self, data_bytes):
+        # logging.debug("dataReceived for %s line: %s", self.protocol, data_bytes)
+        self.receive_buffer.feed(data_bytes)
+        # Parse bytes
+        try:
+            data_bytes_list = self.receive_buffer.pop_frames()
+        except ValueError as error:
+            logging.debug(" (connectionLost for %s reason: %s)", self.protocol, error)
+            self.transport.close()
+            return
+        if not data_bytes_list:
+            return
+
+        # Process
+        try:
+            # (Try-except: because send method could be invoked during processing)
+            if self.protocol and data_bytes_list:
+                self.protocol.process_bytes_list(data_bytes_list)
+        except Exception as error:
+            logging.debug(" (connectionLost for %s reason: %s)", self.protocol, error)
+            if self.transport:
+                self.transport.close()
+
+    def connection_lost(self, reason):
+        logging.debug("connectionLost for %s reason: %s", self.protocol, reason)
+        self.server.handler_set.discard(self)
+        if self.protocol:
+            self.protocol.dispose()
+            self.protocol = None
+        self.transport = None
+        self.config = None
+
+
+class AsyncioTCPServer(AbstractServer):
+    """
+    All connections are served in single thread by asyncio event loop.
+    Timers should be also run in this loop, so AsyncioTimer is set up
+    by SocketApplication as timer_class for this server.
+    """
+
+    # (Created on init if not set. Shared with AsyncioTimer by SocketApplication)
+    loop = None
+    server = None
+
+    def __init__(self, config, app=None):
+        super().__init__(config, app)
+
+        if not self.loop:
+            self.loop = asyncio.new_event_loop()
+        self.handler_set = set()
+
+        self.started = False
+        self.__started_lock = threading.RLock()
+        self.__shutdown_event = threading.Event()
+        self.__shutdown_event.set()
+        self.__loop_thread_id = None
+
+    def start(self):
+        if not self.config:
+            logging.warning("Server is not initialized")
+            return
+        self.__started_lock.acquire()
+        if self.started:
+            logging.warning("Server is already running. address: %s", (self.config.host, self.config.port))
+            self.__started_lock.release()
+            return
+
+        address = (self.config.host, self.config.port)
+        logging.debug("Server starting... address: %s", address)
+        # (Lock is kept until the server is listening, so that stop() always finds loop running)
+        asyncio.set_event_loop(self.loop)
+        self.__loop_thread_id = threading.get_ident()
+        try:
+            self.server = self.loop.run_until_complete(self.loop.create_server(
+                lambda: AsyncioHandler(self), self.config.host or None, self.config.port, reuse_address=True,
+                reuse_port=self.config.is_reuse_port or None))
+        except Exception as error:
+            logging.error("Error while starting server: %s address: %s", error, address)
+            self.__loop_thread_id = None
+            self.__started_lock.release()
+            return
+        self.started = True
+        self.__shutdown_event.clear()
+        self.__started_lock.release()
+        logging.debug("Server started")
+
+        try:
+            self.loop.run_forever()
+        except KeyboardInterrupt as error:
+            logging.debug("^C KeyboardInterrupt %s", error)
+
+        # Here we shutting down the server
+        logging.debug("Server shutting down...")
+        self.server.close()
+        self.loop.run_until_complete(self.server.wait_closed())
+        self.server = None
+        # (list() needed to make a copy)
+        for handler in list(self.handler_set):
+            handler.transport.close()
+        # (One more iteration to call connection_lost() for all closed transports)
+        self.loop.call_soon(self.loop.stop)
+        self.loop.run_forever()
+        self.handler_set.clear()
+        self.__loop_thread_id = None
+        logging.debug("Server shut down")
+        self.__shutdown_event.set()
+
+    def stop(self):
+        self.__started_lock.acquire()
+        if not self.started:
+            logging.warning("Server is not running. address: %s", (self.config.host, self.config.port))
+            self.__started_lock.release()
+            return
+
+        logging.debug("Server stopping... address: %s", (self.config.host, self.config.port))
+        self.started = False
+        self.__started_lock.release()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        # (Cannot wait inside the loop, e.g. if stop() called from protocol)
+        if self.__loop_thread_id != threading.get_ident():
+            self.__shutdown_event.wait()
+        logging.debug("Server stopped")
@@ -309,6 +309,15 @@ class TestBlockingTCPClient(TestAbstractClient):
 
         with self.assertRaises(Exception):
             self.client.send_raw(b"data1")
+
+    def test_send_raw_length_prefixed(self):
+        self.client.config = ClientConfig()
+        self.client.config.is_length_prefixed = True
+        self.client.conn = MagicMock()
+
+        self.client.send_raw(b"data1\x00")
+
+        self.client.conn.send.assert_called_once_with(b"\x00\x00\x00\x06data1\x00")
             # self.client.send_raw(b"data2\x00")
 
         # self.assertEqual(self.client.conn.send.call_count, 2)
@@ -1,6 +1,21 @@
 from unittest import TestCase
+from unittest.mock import patch
 
-from napalm.socket.parser import CommandParser
+from napalm.core import ExportableMixIn
+from napalm.socket.parser import BinaryCommandParser, BytesCommandParser, CommandParser, ExportedModel, \
+    ExportedModels, FastCommandParser, LazyCommandParams
+
+
+class MyModel(ExportableMixIn):
+    _property_names = ["model_id", "name", "secret"]
+    _public_property_names = ["model_id", "name", "params"]
+
+    def __init__(self, model_id, name):
+        super().__init__()
+        self.model_id = model_id
+        self.name = name
+        self.secret = "secret"
+        self.params = [1, "a"]
 
 
 class TestCommandParser(TestCase):
@@ -134,3 +149,241 @@ class TestCommandParser(TestCase):
         #                                                ["a", 2, "", True, False, None]],
         #                                               "v1"])
         # self.assertEqual(string, 'a,,,,2,,1,,0,,,,["a", 2, "", true, false, null];;v1')
+
+
+    def test_make_command_with_exported_models(self):
+        model1 = MyModel(1, "name1")
+        model2 = MyModel(2, "name2")
+
+        command = self.parser.make_command(["10", ExportedModel(model1), ExportedModels([model1, model2]),
+                                            ExportedModel(model2, False), ExportedModels([])])
+
+        self.assertEqual(command, CommandParser().make_command(
+            ["10", model1.export_public_data(), [model1.export_public_data(), model2.export_public_data()],
+             model2.export_data(), []]))
+        self.assertEqual(command, '10||1,,name1,,[1, "a"]||1,,name1,,[1, "a"];;2,,name2,,[1, "a"]||'
+                                  '2,,name2,,secret||##')
+
+    def test_export_cache(self):
+        model1 = MyModel(1, "name1")
+        model2 = MyModel(2, "name2")
+        self.parser.make_command(["10", ExportedModels([model1, model2])])
+
+        # Cached
+        with patch.object(MyModel, "export_public_data") as export_public_data:
+            command = self.parser.make_command(["10", ExportedModels([model1, model2])])
+
+            export_public_data.assert_not_called()
+            self.assertEqual(command, '10||1,,name1,,[1, "a"];;2,,name2,,[1, "a"]##')
+
+        # Changed
+        model2.name = "name22"
+        command = self.parser.make_command(["10", ExportedModels([model1, model2])])
+
+        self.assertEqual(command, '10||1,,name1,,[1, "a"];;2,,name22,,[1, "a"]##')
+
+        # Changed in place
+        model2.params.append("b")
+        model2.mark_changed()
+        command = self.parser.make_command(["10", ExportedModel(model2)])
+
+        self.assertEqual(command, '10||2,,name22,,[1, "a", "b"]##')
+
+        # Least recently used are removed
+        self.parser.export_cache_size = 2
+        self.parser.make_command(["10", ExportedModel(model1, False)])
+
+        self.assertEqual(len(self.parser._export_cache), 2)
+        self.assertNotIn((model1, True), self.parser._export_cache)
+        self.assertIn((model2, True), self.parser._export_cache)
+
+    def test_exported_model(self):
+        model1 = MyModel(1, "name1")
+        model2 = MyModel(2, "name2")
+
+        exported = ExportedModels([model1, model2])
+
+        # (Behaves like exported data)
+        self.assertEqual(exported, [[1, "name1", [1, "a"]], [2, "name2", [1, "a"]]])
+        self.assertEqual(len(exported), 2)
+        self.assertEqual(exported[1], [2, "name2", [1, "a"]])
+        self.assertEqual(list(ExportedModel(model1, False)), [1, "name1", "secret"])
+        self.assertEqual(repr(ExportedModel(model1)), repr([1, "name1", [1, "a"]]))
+
+
+class TestLazyCommandParams(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.parser = CommandParser()
+
+    def test_full_parsing(self):
+        command_params = LazyCommandParams(self.parser, "10||a,,b||k::v||text")
+
+        self.assertEqual(command_params.command_code, "10")
+        self.assertEqual(len(command_params), 4)
+        self.assertEqual(repr(command_params), repr("10||a,,b||k::v||text"))
+        self.assertFalse(command_params.is_parsed)
+
+        self.assertEqual(command_params[1], ["a", "b"])
+        self.assertTrue(command_params.is_parsed)
+        self.assertEqual(command_params, ["10", ["a", "b"], "k::v", "text"])
+        self.assertEqual(command_params[1:], [["a", "b"], "k::v", "text"])
+        self.assertEqual(list(command_params), ["10", ["a", "b"], "k::v", "text"])
+        self.assertEqual(len(command_params), 4)
+        self.assertEqual(repr(command_params), repr(["10", ["a", "b"], "k::v", "text"]))
+
+    def test_parsing_by_schema(self):
+        # (Only param with index 2 could be complex)
+        command_params = LazyCommandParams(self.parser, "10||a,,b||k::v;;k2::v2||text", (2, 5))
+
+        self.assertEqual(command_params, ["10", "a,,b", {"k": "v", "k2": "v2"}, "text"])
+
+        command_params = LazyCommandParams(self.parser, "36||0||hello,, all||", ())
+
+        self.assertEqual(command_params, ["36", "0", "hello,, all", ""])
+
+
+class TestFastCommandParser(TestCommandParser):
+    def setUp(self):
+        super().setUp()
+        self.parser = FastCommandParser()
+        self.original_parser = CommandParser()
+
+    def test_same_as_original(self):
+        for command in ["1||param1||param2", "1||", "", "1||a,,b||c;;d||k::v;;k2::a,,b",
+                        "1||k1::a,,b,,c;;k2::;;k3::v3;;k4||a,,b,,c,,d;;abc;;d,,e,,f;;g,,h||a,,b,,c", "1||,,||;;",
+                        "1||a;;b||k1::v1::v2;;k2||k1::a,,b;;k2::"]:
+            self.assertEqual(self.parser.parse_command(command), self.original_parser.parse_command(command))
+
+        for string in ["text", "some||text##a;;b::c,,d|||###", "&dblsemi&dblstick&", "&dblsharp&&dblstick&", 123]:
+            self.assertEqual(self.parser.encode_string(string), self.original_parser.encode_string(string))
+            self.assertEqual(self.parser.decode_string(string), self.original_parser.decode_string(string))
+
+        def make_command_params():
+            return ["10", 5, 2.5, True, None, "", [], [3, 100, None, True, [1, 2], {"a": 1}],
+                    [[23123, "name1", 2000], "v1", [None, False]], {"0": "some", 5: ["a", "b", 7], "k": None},
+                    (1, 2)]
+        self.assertEqual(self.parser.make_command(make_command_params()),
+                         self.original_parser.make_command(make_command_params()))
+        self.assertEqual(self.parser.make_command("1||param1"), self.original_parser.make_command("1||param1"))
+
+    def test_make_command_does_not_change_params(self):
+        command_params = ["10", [3, 100], {"0": "some"}]
+
+        self.parser.make_command(command_params)
+
+        self.assertEqual(command_params, ["10", [3, 100], {"0": "some"}])
+
+
+class TestBytesCommandParser(TestFastCommandParser):
+    def setUp(self):
+        super().setUp()
+        self.parser = BytesCommandParser()
+
+    def test_split_commands_bytes(self):
+        self.assertEqual(self.parser.split_commands(b"1||param1##2||param2##"), [b"1||param1", b"2||param2", b""])
+
+    def test_parse_command_bytes(self):
+        # Plain
+        self.assertEqual(self.parser.parse_command(b"1||param1||15"), [b"1", b"param1", b"15"])
+        self.assertEqual(int(self.parser.parse_command(b"1||param1||15")[2]), 15)
+
+        # With lists and dicts (decoded)
+        command = "1||k1::a,,b,,c;;k2::;;k3::v3;;k4||a,,b,,c,,d;;abc;;d,,e,,f;;g,,h||a,,b,,c||текст"
+        self.assertEqual(self.parser.parse_command(command.encode("utf-8")),
+                         ["1", {"k1": ["a", "b", "c"], "k2": "", "k3": "v3", "k4": None},
+                          [["a", "b", "c", "d"], "abc", ["d", "e", "f"], ["g", "h"]], ["a", "b", "c"], "текст"])
+
+        # Same as from str
+        for command in ["1||param1||param2", "1||", "", "1||a,,b||c;;d||k::v;;k2::a,,b", "1||,,||;;",
+                        "1||a;;b||k1::v1::v2;;k2||k1::a,,b;;k2::"]:
+            self.assertEqual([param.decode("utf-8") if isinstance(param, bytes) else param
+                              for param in self.parser.parse_command(command.encode("utf-8"))],
+                             self.original_parser.parse_command(command))
+
+    def test_lazy_command_params(self):
+        command_params = LazyCommandParams(self.parser, b"10||a,,b||k::v;;k2::v2||text", (2,))
+
+        self.assertEqual(command_params.command_code, b"10")
+        self.assertEqual(len(command_params), 4)
+        self.assertEqual(command_params, [b"10", b"a,,b", {"k": "v", "k2": "v2"}, b"text"])
+
+        command_params = LazyCommandParams(self.parser, b"10||a||text", ())
+
+        self.assertEqual(command_params, [b"10", b"a", b"text"])
+
+
+class TestBinaryCommandParser(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.parser = BinaryCommandParser()
+
+    def test_make_and_parse_command(self):
+        command_params = [31, "", "text", "long text" * 10, 0, 63, 64, -1, 10 ** 30, -10 ** 30, 0.1, -2.5,
+                          None, True, False, [], [1, "a", [2, [3]]], list(range(100)),
+                          {}, {"0": [1, "player1", 1000], 5: {"a": None}}, "\x00\x01\x02\x1b#|"]
+
+        command = self.parser.make_command(command_params)
+
+        self.assertIsInstance(command, bytes)
+        self.assertTrue(self.parser.is_binary_data(command))
+        # (Could be sent in frames separated by b"\x00")
+        self.assertNotIn(b"\x00", command)
+        command_list = self.parser.split_commands(command)
+        self.assertEqual(len(command_list), 1)
+        self.assertEqual(self.parser.parse_command(command_list[0]), command_params)
+        # (Tuples are lists)
+        command_list = self.parser.split_commands(self.parser.make_command([1, (2, 3)]))
+        self.assertEqual(self.parser.parse_command(command_list[0]), [1, [2, 3]])
+
+    def test_make_command_from_text(self):
+        command = self.parser.make_command("10||3,,100||k::v;;k2::a,,b")
+
+        command_list = self.parser.split_commands(command)
+        self.assertEqual(self.parser.parse_command(command_list[0]), ["10", ["3", "100"], {"k": "v", "k2": ["a", "b"]}])
+
+    def test_split_commands(self):
+        commands = self.parser.join_commands([self.parser.make_command([1, "a\x00"]),
+                                              self.parser.make_command([]),
+                                              self.parser.make_command([2, "b" * 200])])
+
+        command_list = self.parser.split_commands(commands)
+
+        self.assertEqual([self.parser.parse_command(command) for command in command_list],
+                         [[1, "a\x00"], [], [2, "b" * 200]])
+        self.assertEqual(self.parser.split_commands(b""), [])
+
+    def test_parse_command_wrong(self):
+        with self.assertRaises(ValueError):
+            self.parser.parse_command(b"\x01")
+
+    def test_is_binary_data(self):
+        self.assertTrue(self.parser.is_binary_data(self.parser.make_command([1])))
+        self.assertFalse(self.parser.is_binary_data(b"1||param1##"))
+        self.assertFalse(self.parser.is_binary_data(b"<policy-file-request/>"))
+        self.assertFalse(self.parser.is_binary_data(b""))
+
+    def test_make_command_with_exported_models(self):
+        model1 = MyModel(1, "name1")
+        model2 = MyModel(2, "name2")
+        command_params = [10, ExportedModel(model1), ExportedModels([model1, model2]), ExportedModel(model2, False)]
+
+        for _ in range(2):
+            # (Second time from cache)
+            command = self.parser.make_command(command_params)
+
+            command_list = self.parser.split_commands(command)
+            self.assertEqual(self.parser.parse_command(command_list[0]), [
+                10, [1, "name1", [1, "a"]], [[1, "name1", [1, "a"]], [2, "name2", [1, "a"]]], [2, "name2", "secret"]])
+            self.assertEqual(command, self.parser.make_command([
+                10, model1.export_public_data(), [model1.export_public_data(), model2.export_public_data()],
+                model2.export_data()]))
+
+    def test_size(self):
+        # Game update
+        command_params = [31, [[i, 1000, 500 * i, 9.5, "Player %d" % i, -1] for i in range(9)], [2, 9, 13, 22, 40]]
+
+        text_command = CommandParser().make_command(list(command_params)).encode("utf-8")
+        command = self.parser.make_command(command_params)
+
+        self.assertLess(len(command), len(text_command) * .75)
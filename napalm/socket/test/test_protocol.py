@@ -1,8 +1,10 @@
 from unittest import TestCase
 from unittest.mock import Mock, MagicMock, call
 
-from napalm.socket.parser import CommandParser
-from napalm.socket.protocol import Protocol, SimpleProtocol, ProtocolPlugin
+from napalm.socket.parser import BinaryCommandParser, BytesCommandParser, CommandParser
+from napalm.socket.protocol import CommandSchema, Protocol, SendPriority, SimpleProtocol, ProtocolPlugin, \
+    broadcast, make_dispatch_table
+from napalm.socket.rate_limit import RateLimit, RateLimitAction, RateLimiter
 from napalm.socket.server import ServerConfig
 
 
@@ -129,6 +131,8 @@ class TestProtocol(TestCase):
     def tearDown(self):
         Protocol.parser_class = self.default_parser_class
         Protocol.parser = None
+        Protocol.binary_parser_class = None
+        Protocol.binary_parser = None
 
         super().tearDown()
 
@@ -328,6 +332,69 @@ class TestProtocol(TestCase):
                          [b"1||param1||param2##", b"2||param1||param2##"])
         self.protocol.send_bytes_method.assert_not_called()
 
+    def test_send_when_writing_paused(self):
+        self.protocol.send_bytes_method = Mock()
+
+        self.protocol.pause_writing()
+        self.protocol.send("1||param1", is_critical=False)
+        self.protocol.send_all(["2||param1"], is_critical=False)
+        self.protocol.send("3||param1")
+        self.protocol.resume_writing()
+        self.protocol.send("4||param1", is_critical=False)
+
+        # (Non-critical updates are dropped while paused)
+        self.assertEqual(self.protocol.send_bytes_method.call_args_list,
+                         [call(b"3||param1##"), call(b"4||param1##")])
+
+    def test_send_with_priority(self):
+        self.protocol.send_bytes_method = Mock()
+        self.protocol.send_urgent_bytes_method = Mock()
+
+        # Normal
+        self.protocol.send("1||param1", priority=SendPriority.HIGH)
+        self.protocol.send("2||param1", priority=SendPriority.LOW)
+        self.protocol.send("3||param1")
+
+        self.protocol.send_urgent_bytes_method.assert_called_once_with(b"1||param1##")
+        self.assertEqual(self.protocol.send_bytes_method.call_args_list,
+                         [call(b"2||param1##"), call(b"3||param1##")])
+
+        # Deferred (HIGH first, LOW last)
+        self.protocol.send_bytes_method.reset_mock()
+        self.protocol.send_urgent_bytes_method.reset_mock()
+        self.protocol.set_send_on_flush()
+
+        self.protocol.send("1||param1", priority=SendPriority.LOW)
+        self.protocol.send("2||param1")
+        self.protocol.send_all(["3||param1", "4||param1"], priority=SendPriority.HIGH)
+        self.protocol.flush()
+
+        self.protocol.send_urgent_bytes_method.assert_called_once_with(b"3||param1##4||param1##")
+        self.assertEqual(self.protocol.send_bytes_method.call_args_list,
+                         [call(b"2||param1##"), call(b"1||param1##")])
+
+    def test_send_low_when_writing_paused(self):
+        self.protocol.send_bytes_method = Mock()
+        self.protocol.max_low_count = 3
+
+        self.protocol.pause_writing()
+        self.protocol.send("1||list1", priority=SendPriority.LOW, merge_key=1)
+        self.protocol.send("2||message1", priority=SendPriority.LOW)
+        self.protocol.send("1||list2", priority=SendPriority.LOW, merge_key=1)
+        self.protocol.send("3||param1")
+        self.protocol.flush()
+
+        # (Only NORMAL is sent while paused)
+        self.protocol.send_bytes_method.assert_called_once_with(b"3||param1##")
+
+        self.protocol.send_bytes_method.reset_mock()
+        self.protocol.send("2||message2", priority=SendPriority.LOW)
+        self.protocol.send("2||message3", priority=SendPriority.LOW)
+        self.protocol.resume_writing()
+
+        # (Latest with merge_key replaces previous, oldest dropped over max_low_count)
+        self.protocol.send_bytes_method.assert_called_once_with(b"1||list2##2||message2##2||message3##")
+
     def test_send_raw(self):
         # Normal
         # see TestSimpleProtocol
@@ -430,6 +497,127 @@ class TestProtocol(TestCase):
         # "4||param5||param6##" - processed
         self.protocol._process_command.assert_called_once_with(4, ["4", "param5", "param6"], 3)
 
+    def test_process_bytes_rate_limited(self):
+        config = ServerConfig()
+        config.rate_limit_by_code = {5: RateLimit(1, 2), 6: RateLimit(1, 1, RateLimitAction.DISCONNECT),
+                                     7: RateLimit(1, 1, RateLimitAction.DELAY)}
+        config.timer_class = Mock()
+        close_connection_method = Mock()
+        self.protocol = Protocol(Mock(), close_connection_method, config=config)
+        self.protocol._process_command = Mock()
+        self.now = 100
+        self.protocol.rate_limiter.get_time = lambda: self.now
+        self.assertIsNone(Protocol(Mock()).rate_limiter)
+
+        # Drop
+        self.protocol.process_bytes(b"5||a##5||b##5||c##4||d##")
+
+        self.assertEqual(self.protocol._process_command.call_args_list,
+                         [call(5, ["5", "a"], 2), call(5, ["5", "b"], 2), call(4, ["4", "d"], 2)])
+        self.assertEqual(self.protocol.rate_limiter.count_by_action_by_code, {5: {RateLimitAction.DROP: 1}})
+
+        # Delay
+        self.protocol._process_command.reset_mock()
+
+        self.protocol.process_bytes(b"7||a##7||b##7||c##4||d##")
+
+        self.assertEqual(self.protocol._process_command.call_args_list, [call(7, ["7", "a"], 2), call(4, ["4", "d"], 2)])
+        config.timer_class.assert_called_once_with(self.protocol._process_delayed_commands, 1, 1)
+        config.timer_class.return_value.start.assert_called_once()
+
+        self.protocol._process_command.reset_mock()
+        self.now += 1
+        self.protocol._process_delayed_commands()
+
+        self.assertEqual(self.protocol._process_command.call_args_list, [call(7, ["7", "b"], 2)])
+        self.assertEqual(config.timer_class.call_args, call(self.protocol._process_delayed_commands, 1, 1))
+
+        self.protocol._process_command.reset_mock()
+        self.now += 1
+        self.protocol._process_delayed_commands()
+
+        self.assertEqual(self.protocol._process_command.call_args_list, [call(7, ["7", "c"], 2)])
+        self.assertEqual(config.timer_class.call_count, 2)
+
+        # Disconnect
+        self.protocol._process_command.reset_mock()
+
+        self.protocol.process_bytes(b"6||a##6||b##4||c##")
+
+        self.assertEqual(self.protocol._process_command.call_args_list, [call(6, ["6", "a"], 2)])
+        close_connection_method.assert_called_once()
+        self.protocol.process_bytes(b"4||d##")
+        self.protocol._process_command.assert_called_once()
+        RateLimiter.reset_total_counts()
+
+    def test_process_bytes_binary(self):
+        Protocol.binary_parser_class = BinaryCommandParser
+        self.protocol = Protocol(Mock())
+        self.protocol._process_command = Mock()
+        text_protocol = Protocol(Mock())
+        text_protocol._process_command = Mock()
+        binary_parser = Protocol.binary_parser
+
+        # Binary client
+        self.protocol.process_bytes(binary_parser.make_command([1, "param1", 2]) +
+                                    binary_parser.make_command([4, [1, 2]]))
+
+        self.assertIs(self.protocol.parser, binary_parser)
+        self.assertEqual(self.protocol._process_command.call_args_list,
+                         [call(1, [1, "param1", 2], 3), call(4, [4, [1, 2]], 2)])
+        self.protocol.send([5, "param1", 2])
+        self.protocol.send_bytes_method.assert_called_once_with(binary_parser.make_command([5, "param1", 2]))
+
+        # Legacy client
+        text_protocol.process_bytes(b"1||param1||2##")
+
+        self.assertIs(text_protocol.parser, Protocol.parser)
+        self.assertEqual(text_protocol._process_command.call_args_list, [call(1, ["1", "param1", "2"], 3)])
+        text_protocol.send([5, "param1", 2])
+        text_protocol.send_bytes_method.assert_called_once_with(b"5||param1||2##")
+
+    def test_process_bytes_without_decoding(self):
+        Protocol.parser_class = BytesCommandParser
+        Protocol.parser = None
+        self.protocol = Protocol(Mock())
+        self.protocol._process_send_message = Mock()
+        self.protocol.CLIENT_COMMAND_SCHEMA_BY_CODE = make_dispatch_table({
+            7: CommandSchema([("message_type", int, None), ("text", str, None), ("receiver_id", str, -1)], 2)},
+            {7: "SEND_MESSAGE"})
+        self.protocol._process_command = Mock(side_effect=self.protocol._dispatch_command)
+
+        self.protocol.process_bytes("7||1||привет##8||a,,b||c##".encode("utf-8"))
+
+        self.assertEqual(self.protocol._process_command.call_args_list,
+                         [call(7, [b"7", b"1", "привет".encode("utf-8")], 3), call(8, ["8", ["a", "b"], "c"], 3)])
+        self.protocol._process_send_message.assert_called_once_with(message_type=1, text="привет", receiver_id=-1)
+
+        # Lazy
+        self.protocol.is_lazy_parsing = True
+        self.protocol._process_command.reset_mock()
+
+        self.protocol.process_bytes(b"7||1||hello##")
+
+        self.assertEqual(self.protocol._process_command.call_args_list, [call(7, [b"7", b"1", b"hello"], 3)])
+
+        # Policy request
+        self.protocol.send_raw = Mock()
+        self.protocol.process_bytes(b"<policy-file-request/>")
+        self.protocol.send_raw.assert_called_once()
+
+    def test_binary_client_protocol(self):
+        Protocol.binary_parser_class = BinaryCommandParser
+
+        class MyClientProtocol(Protocol):
+            is_server_protocol = False
+
+        self.protocol = MyClientProtocol(Mock())
+        self.protocol.send_all([[1, "param1"], [2]])
+
+        self.assertIs(self.protocol.parser, Protocol.binary_parser)
+        self.protocol.send_bytes_method.assert_called_once_with(
+            Protocol.binary_parser.make_command([1, "param1"]) + Protocol.binary_parser.make_command([2]))
+
     # protected
 
     def test_parse_command(self):
@@ -451,6 +639,50 @@ class TestProtocol(TestCase):
         self.assertEqual(command_params, ["7", "zz", "bb", "cc"])
         self.assertEqual(params_count, 4)
 
+    def test_parse_command_lazy(self):
+        self.protocol.is_lazy_parsing = True
+        self.protocol.CLIENT_COMMAND_COMPLEX_PARAM_INDEXES_BY_CODE = {7: (2,)}
+
+        command_code, command_params, params_count = self.protocol._parse_command("7||zz,,yy||bb,,cc")
+
+        self.assertEqual(command_code, 7)
+        self.assertEqual(params_count, 3)
+        self.assertFalse(command_params.is_parsed)
+        self.assertEqual(command_params, ["7", "zz,,yy", ["bb", "cc"]])
+
+        # (Not in schema)
+        command_code, command_params, params_count = self.protocol._parse_command("8a||zz,,yy")
+
+        self.assertEqual(command_code, "8a")
+        self.assertEqual(params_count, 2)
+        self.assertEqual(command_params, ["8a", ["zz", "yy"]])
+
+    def test_dispatch_command(self):
+        self.protocol._process_send_message = Mock()
+        self.protocol._process_action = Mock()
+        self.protocol.CLIENT_COMMAND_SCHEMA_BY_CODE = make_dispatch_table({
+            7: CommandSchema([("message_type", int, None), ("text", str, None), ("receiver_id", str, -1)], 2),
+            8: CommandSchema(rest_param="params", handler_name="_process_action")}, {7: "SEND_MESSAGE"})
+
+        self.assertTrue(self.protocol._dispatch_command(7, ["7", "1", "hello"], 3))
+        self.assertTrue(self.protocol._dispatch_command(8, ["8", "a", ["b", "c"]], 3))
+
+        self.protocol._process_send_message.assert_called_once_with(message_type=1, text="hello", receiver_id=-1)
+        self.protocol._process_action.assert_called_once_with(params=["a", ["b", "c"]])
+
+        # Wrong params - rejected
+        self.protocol._process_send_message.reset_mock()
+
+        self.assertTrue(self.protocol._dispatch_command(7, ["7", "1"], 2))
+        self.assertTrue(self.protocol._dispatch_command(7, ["7", "abc", "hello"], 3))
+
+        self.protocol._process_send_message.assert_not_called()
+
+        # Unknown command
+        self.assertFalse(self.protocol._dispatch_command(9, ["9"], 1))
+        self.protocol.CLIENT_COMMAND_SCHEMA_BY_CODE = None
+        self.assertFalse(self.protocol._dispatch_command(7, ["7", "1", "hello"], 3))
+
     # @unittest.skip("Empty method")
     def test_process_auth_command(self):
         # Test no exception
@@ -488,3 +720,104 @@ class TestProtocol(TestCase):
 
         self.assertEqual(self.protocol.get_command_description(1), "-")
         self.assertEqual(self.protocol.get_command_description(2, True), "-")
+
+
+class TestCommandSchema(TestCase):
+    def test_decode(self):
+        schema = CommandSchema([("room_id", str, ""), ("place_index", int, -1), ("money", float, 0),
+                                ("room_info", None, None)], 1)
+
+        self.assertEqual(schema.decode(["1", "5", "2", "10.5", ["a", "b"]], 5),
+                         {"room_id": "5", "place_index": 2, "money": 10.5, "room_info": ["a", "b"]})
+        # (Typed values of binary codec)
+        self.assertEqual(schema.decode([1, 5, 2, 10], 4),
+                         {"room_id": "5", "place_index": 2, "money": 10.0, "room_info": None})
+        # Defaults
+        self.assertEqual(schema.decode(["1", "5"], 2),
+                         {"room_id": "5", "place_index": -1, "money": 0, "room_info": None})
+        # (Bytes of BytesCommandParser)
+        self.assertEqual(schema.decode([b"1", b"5", b"2", b"10.5", b"info"], 5),
+                         {"room_id": "5", "place_index": 2, "money": 10.5, "room_info": "info"})
+        # Wrong
+        with self.assertRaises(ValueError):
+            schema.decode(["1"], 1)
+        with self.assertRaises(ValueError):
+            schema.decode(["1", "5", ""], 3)
+        with self.assertRaises(TypeError):
+            schema.decode(["1", "5", ["2"]], 3)
+
+    def test_decode_rest_params(self):
+        schema = CommandSchema([("place_index", int, -1)], 1, "params")
+
+        self.assertEqual(schema.decode(["1", "5", "a", "b"], 4), {"place_index": 5, "params": ["a", "b"]})
+        self.assertEqual(schema.decode(["1", "5"], 2), {"place_index": 5, "params": []})
+        self.assertEqual(schema.decode([b"1", b"5", b"a", ["b"]], 4), {"place_index": 5, "params": ["a", ["b"]]})
+
+    def test_complex_param_indexes(self):
+        self.assertEqual(CommandSchema().complex_param_indexes, ())
+        self.assertEqual(CommandSchema([("a", str, ""), ("b", None, None), ("c", None, None)]).complex_param_indexes,
+                         (2, 3))
+        self.assertEqual(CommandSchema(rest_param="params").complex_param_indexes, None)
+
+    def test_make_dispatch_table(self):
+        schema_by_code = {1: CommandSchema(), 2: CommandSchema(handler_name="process_some")}
+
+        result = make_dispatch_table(schema_by_code, {1: "SEND_MESSAGE", 2: "SOME"})
+
+        self.assertIs(result, schema_by_code)
+        self.assertEqual(schema_by_code[1].handler_name, "_process_send_message")
+        self.assertEqual(schema_by_code[2].handler_name, "process_some")
+
+
+class TestBroadcast(TestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.protocols = [Protocol(Mock()) for _ in range(4)]
+
+    def tearDown(self):
+        Protocol.parser = None
+        Protocol.binary_parser = None
+
+        super().tearDown()
+
+    def test_broadcast(self):
+        Protocol.parser.make_command = Mock(side_effect=Protocol.parser.make_command)
+        self.protocols[2].pause_writing()
+        self.protocols[3].set_send_on_flush()
+
+        broadcast(self.protocols + [None], ["1", "param1"])
+
+        # (Made and encoded once)
+        Protocol.parser.make_command.assert_called_once_with(["1", "param1"])
+        sent_bytes_list = [protocol.send_bytes_method.call_args[0][0] for protocol in self.protocols[:3]]
+        self.assertEqual(sent_bytes_list, [b"1||param1##"] * 3)
+        self.assertIs(sent_bytes_list[0], sent_bytes_list[1])
+        # (Deferred)
+        self.protocols[3].send_bytes_method.assert_not_called()
+        self.assertEqual(self.protocols[3].deferred_bytes_list, [b"1||param1##"])
+
+    def test_broadcast_with_exclude_and_private_command(self):
+        def get_private_command(protocol):
+            return ["1", "private"] if protocol is self.protocols[1] else None
+        self.protocols[2].pause_writing()
+
+        broadcast(self.protocols, ["1", "param1"], exclude_protocols={self.protocols[3]},
+                  get_private_command=get_private_command, is_critical=False)
+
+        self.protocols[0].send_bytes_method.assert_called_once_with(b"1||param1##")
+        self.protocols[1].send_bytes_method.assert_called_once_with(b"1||private##")
+        # (Paused and excluded)
+        self.protocols[2].send_bytes_method.assert_not_called()
+        self.protocols[3].send_bytes_method.assert_not_called()
+
+    def test_broadcast_to_binary_and_text_protocols(self):
+        binary_parser = BinaryCommandParser()
+        self.protocols[1].parser = self.protocols[2].parser = binary_parser
+
+        broadcast(self.protocols, [1, "param1"])
+
+        sent_bytes_list = [protocol.send_bytes_method.call_args[0][0] for protocol in self.protocols]
+        self.assertEqual(sent_bytes_list, [b"1||param1##", binary_parser.make_command([1, "param1"]),
+                                           binary_parser.make_command([1, "param1"]), b"1||param1##"])
+        self.assertIs(sent_bytes_list[1], sent_bytes_list[2])
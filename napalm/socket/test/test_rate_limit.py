@@ -0,0 +1,59 @@
+from unittest import TestCase
+
+from napalm.socket.rate_limit import RateLimit, RateLimitAction, RateLimiter, TokenBucket
+
+
+class TestTokenBucket(TestCase):
+    def test_take(self):
+        bucket = TokenBucket(RateLimit(2, 3), 100)
+
+        self.assertEqual([bucket.take(100) for _ in range(4)], [True, True, True, False])
+        # (Refilled at rate)
+        self.assertFalse(bucket.take(100.4))
+        self.assertTrue(bucket.take(100.5))
+        self.assertFalse(bucket.take(100.5))
+        # (Not over burst)
+        self.assertEqual([bucket.take(200) for _ in range(4)], [True, True, True, False])
+
+    def test_reserve(self):
+        bucket = TokenBucket(RateLimit(2, 1, RateLimitAction.DELAY, max_delayed_count=2), 100)
+
+        self.assertEqual(bucket.reserve(100), 0)
+        self.assertEqual(bucket.reserve(100), .5)
+        self.assertEqual(bucket.reserve(100), 1)
+        self.assertIsNone(bucket.reserve(100))
+        self.assertEqual(bucket.reserve(100.5), 1)
+
+
+class TestRateLimiter(TestCase):
+    def setUp(self):
+        super().setUp()
+        RateLimiter.reset_total_counts()
+        self.now = 100
+        self.limiter = RateLimiter({5: RateLimit(1, 2), 6: RateLimit(1, 1, RateLimitAction.DISCONNECT),
+                                    7: RateLimit(1, 1, RateLimitAction.DELAY, 1)},
+                                   RateLimit(10, 5), get_time=lambda: self.now)
+
+    def tearDown(self):
+        RateLimiter.reset_total_counts()
+        super().tearDown()
+
+    def test_check(self):
+        self.assertEqual([self.limiter.check(5) for _ in range(3)],
+                         [(None, 0), (None, 0), (RateLimitAction.DROP, 0)])
+        self.assertEqual([self.limiter.check(6) for _ in range(2)], [(None, 0), (RateLimitAction.DISCONNECT, 0)])
+        self.assertEqual([self.limiter.check(7) for _ in range(3)],
+                         [(None, 0), (RateLimitAction.DELAY, 1), (RateLimitAction.DROP, 0)])
+
+        # Total limit (1 token left after 4 allowed commands)
+        self.assertEqual([self.limiter.check(8) for _ in range(2)], [(None, 0), (RateLimitAction.DROP, 0)])
+
+        self.now += 1
+        self.assertEqual(self.limiter.check(5), (None, 0))
+
+        # Counters
+        self.assertEqual(self.limiter.count_by_action_by_code, {
+            5: {RateLimitAction.DROP: 1}, 6: {RateLimitAction.DISCONNECT: 1},
+            7: {RateLimitAction.DELAY: 1, RateLimitAction.DROP: 1}, 8: {RateLimitAction.DROP: 1}})
+        self.assertEqual(RateLimiter.get_total_count_by_action(), {
+            RateLimitAction.DROP: 3, RateLimitAction.DISCONNECT: 1, RateLimitAction.DELAY: 1})
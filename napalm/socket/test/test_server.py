@@ -1,8 +1,11 @@
+import asyncio
 import logging
 import random
+import selectors
 import socket
 import socketserver
-from threading import Thread, Event, Barrier
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread, Event, Barrier, BoundedSemaphore, Lock
 from unittest import TestCase
 from unittest.mock import Mock, MagicMock, call, patch
 
@@ -14,8 +17,13 @@ from twisted.internet.protocol import ServerFactory
 
 from napalm.core import SocketGameApplication
 from napalm.socket.protocol import Protocol, SimpleProtocol, ServerProtocol
-from napalm.socket.server import Config, ServerConfig, ProtocolFactory, AbstractServer, NonBlockingTCPServer
-from napalm.socket.server import TwistedHandler, TwistedTCPServer, ThreadedTCPHandler, ThreadedTCPServer
+from napalm.socket.parser import BinaryCommandParser
+from napalm.socket.server import Config, ServerConfig, ReceiveBuffer, SendQueue, ProtocolFactory, AbstractServer
+from napalm.socket.server import CommandReceiveBuffer, create_receive_buffer
+from napalm.socket.server import NonBlockingTCPServer
+from napalm.socket.server import TwistedHandler, TwistedLengthPrefixedHandler, TwistedStreamHandler, TwistedTCPServer
+from napalm.socket.server import ThreadedTCPHandler, ThreadedTCPServer
+from napalm.socket.server import ThreadPoolTCPServer, AsyncioHandler, AsyncioTCPServer
 
 # TODO TEST with protocol raises exception during processing
 
@@ -26,6 +34,19 @@ class MySpecificException(Exception):
     pass
 
 
+def mock_recv_into(data_bytes_list):
+    # (Mock of socket.recv_into() which receives given data or raises given exceptions)
+    data_iter = iter(data_bytes_list)
+
+    def recv_into(buffer, nbytes=0):
+        data_bytes = next(data_iter)
+        if not isinstance(data_bytes, bytes):
+            raise data_bytes
+        buffer[:len(data_bytes)] = data_bytes
+        return len(data_bytes)
+    return Mock(side_effect=recv_into)
+
+
 # Common
 
 class TestConfig(TestCase):
@@ -52,6 +73,210 @@ class TestConfig(TestCase):
         ServerConfig()
 
 
+class TestReceiveBuffer(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.buffer = ReceiveBuffer(b"[END]", 16)
+
+    def test_feed(self):
+        self.buffer.feed(b"1||param1||")
+        self.assertEqual(self.buffer.pop_frames(), [])
+        self.buffer.feed(b"param2##[END]2||param1||param2##[EN")
+        self.assertEqual(self.buffer.pop_frames(), [b"1||param1||param2##"])
+        self.assertEqual(self.buffer.pending_bytes, b"2||param1||param2##[EN")
+        # (Delimiter received partially)
+        self.buffer.feed(b"D][END]3||")
+
+        self.assertEqual(self.buffer.pop_frames(), [b"2||param1||param2##", b""])
+        self.assertEqual(self.buffer.pending_bytes, b"3||")
+
+        self.buffer.clear()
+        self.assertEqual(self.buffer.pending_bytes, b"")
+
+    def test_recv_from(self):
+        sock = Mock(recv_into=mock_recv_into([b"1||param1||param2##[END]2||", b"", socket.error]))
+
+        self.assertEqual(self.buffer.recv_from(sock), 27)
+        self.assertEqual(self.buffer.pop_frames(), [b"1||param1||param2##"])
+        self.assertEqual(self.buffer.recv_from(sock), 0)
+        self.assertEqual(self.buffer.pending_bytes, b"2||")
+        with self.assertRaises(socket.error):
+            self.buffer.recv_from(sock)
+
+    def test_large_frames(self):
+        self.buffer.max_idle_size = 1024
+        data_bytes = bytes(random.getrandbits(8) for _ in range(100000)).replace(b"[", b"(")
+        received_bytes = data_bytes + b"[END]" + data_bytes[:1000] + b"[END]small"
+
+        frames = []
+        for i in range(0, len(received_bytes), 1200):
+            self.buffer.feed(received_bytes[i:i + 1200])
+            frames.extend(self.buffer.pop_frames())
+
+        self.assertEqual(frames, [data_bytes, data_bytes[:1000]])
+        self.assertEqual(self.buffer.pending_bytes, b"small")
+        # (Grown buffer is reallocated when all is processed)
+        self.buffer.feed(b"[END]")
+        self.assertEqual(self.buffer.pop_frames(), [b"small"])
+        self.assertEqual(len(self.buffer._buffer), 1024)
+
+    def test_length_prefixed(self):
+        self.buffer = ReceiveBuffer(is_length_prefixed=True, max_frame_size=100000)
+        # (Delimiter is not used)
+        data_bytes = b"1||param\x00[END]##"
+        received_bytes = b"\x00\x00\x00\x10" + data_bytes + b"\x00\x00\x00\x00" + b"\x00\x01\x86\xa0" + \
+            b"x" * 100000 + b"\x00\x00"
+
+        frames = []
+        for i in range(0, len(received_bytes), 1200):
+            self.buffer.feed(received_bytes[i:i + 1200])
+            frames.extend(self.buffer.pop_frames())
+
+        self.assertEqual(frames, [data_bytes, b"", b"x" * 100000])
+        self.assertEqual(self.buffer.pending_bytes, b"\x00\x00")
+
+        # Too big
+        self.buffer.clear()
+        self.buffer.feed(b"\x00\x01\x86\xa1")
+        with self.assertRaises(ValueError):
+            self.buffer.pop_frames()
+
+
+class TestCommandReceiveBuffer(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.buffer = CommandReceiveBuffer(b"[END]", 16, b"##", b"\x02")
+
+    def test_feed(self):
+        self.buffer.feed(b"1||param1||")
+        self.assertEqual(self.buffer.pop_frames(), [])
+        # (Commands are popped before frame is received)
+        self.buffer.feed(b"param2##2||param1#")
+        self.assertEqual(self.buffer.pop_frames(), [b"1||param1||param2"])
+        self.buffer.feed(b"#3||param1##[EN")
+        self.assertEqual(self.buffer.pop_frames(), [b"2||param1", b"3||param1"])
+        self.assertEqual(self.buffer.pending_bytes, b"[EN")
+        # (Without command delimiter in the end of frame, and empty frame)
+        self.buffer.feed(b"D]4||param1[END][END]5|")
+
+        self.assertEqual(self.buffer.pop_frames(), [b"4||param1"])
+        self.assertEqual(self.buffer.pending_bytes, b"5|")
+
+        self.buffer.clear()
+        self.assertEqual(self.buffer.pending_bytes, b"")
+
+    def test_binary_frames(self):
+        command = BinaryCommandParser().make_command([10, "a##b"])
+
+        self.buffer.feed(b"1||param1##" + b"[END]" + command[:3])
+        self.assertEqual(self.buffer.pop_frames(), [b"1||param1"])
+        self.buffer.feed(command[3:] + b"[END]2||param1##")
+
+        # (Binary frames are not split)
+        self.assertEqual(self.buffer.pop_frames(), [command, b"2||param1"])
+
+    def test_large_frames(self):
+        self.buffer.max_idle_size = 1024
+        commands = [("%d||" % i).encode() + b"x" * random.randint(0, 3000) for i in range(100)]
+        received_bytes = b"##".join(commands) + b"##[END]" + b"##".join(commands[:10]) + b"[END]small"
+
+        popped_commands = []
+        for i in range(0, len(received_bytes), 1200):
+            self.buffer.feed(received_bytes[i:i + 1200])
+            popped_commands.extend(self.buffer.pop_frames())
+
+        self.assertEqual(popped_commands, commands + commands[:10])
+        self.assertEqual(self.buffer.pending_bytes, b"small")
+        # (Grown buffer is reallocated when all is processed)
+        self.buffer.feed(b"[END]")
+        self.assertEqual(self.buffer.pop_frames(), [b"small"])
+        self.assertEqual(len(self.buffer._buffer), 1024)
+
+    def test_create_receive_buffer(self):
+        config = ServerConfig()
+        protocol = Protocol(config=config)
+
+        self.assertIsInstance(create_receive_buffer(config, protocol), ReceiveBuffer)
+        self.assertNotIsInstance(create_receive_buffer(config, protocol), CommandReceiveBuffer)
+
+        config.is_streaming = True
+        receive_buffer = create_receive_buffer(config, protocol)
+
+        self.assertIsInstance(receive_buffer, CommandReceiveBuffer)
+        self.assertEqual(receive_buffer.command_delimiter, b"##")
+        # (No parser)
+        self.assertNotIsInstance(create_receive_buffer(config, SimpleProtocol(config=config)), CommandReceiveBuffer)
+        self.assertNotIsInstance(create_receive_buffer(config), CommandReceiveBuffer)
+
+        config.is_length_prefixed = True
+
+        self.assertNotIsInstance(create_receive_buffer(config, protocol), CommandReceiveBuffer)
+
+
+class TestSendQueue(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.on_pause = Mock()
+        self.on_resume = Mock()
+        self.queue = SendQueue(10, 3, 20, self.on_pause, self.on_resume)
+
+    def test_put_consume(self):
+        self.assertTrue(self.queue.put(b"12345"))
+        self.assertTrue(self.queue.put(b"6789"))
+        self.assertEqual(len(self.queue), 9)
+        self.on_pause.assert_not_called()
+
+        # High watermark
+        self.assertTrue(self.queue.put(b"0"))
+        self.on_pause.assert_called_once_with()
+        self.assertTrue(self.queue.is_paused)
+
+        # (Consumed partially)
+        self.queue.consume(5)
+        self.queue.consume(1)
+        self.assertEqual([bytes(data_bytes) for data_bytes in self.queue.peek()], [b"789", b"0"])
+        self.on_resume.assert_not_called()
+
+        # Low watermark
+        self.queue.consume(1)
+        self.on_resume.assert_called_once_with()
+        self.assertFalse(self.queue.is_paused)
+        self.assertEqual(len(self.queue), 3)
+
+        # Max size
+        self.assertFalse(self.queue.put(b"x" * 19))
+        self.assertTrue(self.queue.is_overflown)
+        self.queue.clear()
+        self.assertEqual(len(self.queue), 0)
+
+    def test_put_urgent(self):
+        self.queue.put(b"12345")
+        self.queue.consume(2)
+        self.queue.put(b"678")
+        self.queue.put(b"90", is_urgent=True)
+
+        # (After partially sent frame, but before others)
+        self.assertEqual([bytes(data_bytes) for data_bytes in self.queue.peek()], [b"345", b"90", b"678"])
+        self.queue.put(b"ab", is_urgent=True)
+        self.assertEqual([bytes(data_bytes) for data_bytes in self.queue.peek()], [b"345", b"90", b"678", b"ab"])
+        self.queue.consume(8)
+        self.assertEqual([bytes(data_bytes) for data_bytes in self.queue.peek()], [b"ab"])
+        self.assertEqual(len(self.queue), 2)
+
+    def test_send(self):
+        sock, client = socket.socketpair()
+        self.queue.put(b"1||param1##")
+        self.queue.put(b"2||param1##")
+
+        # (Coalesced)
+        self.assertEqual(self.queue.send(sock), 22)
+        self.assertEqual(client.recv(1024), b"1||param1##2||param1##")
+        self.assertEqual(len(self.queue), 0)
+
+        sock.close()
+        client.close()
+
+
 class TestProtocolFactory(TestCase):
     config = ServerConfig(protocol_class=ServerProtocol)
     app = SocketGameApplication(config)
@@ -183,6 +408,103 @@ class TestTwistedHandler(TestCase):
         self.assertIsNone(self.handler.protocol)
 
 
+class TestTwistedLengthPrefixedHandler(TestCase):
+    config = ServerConfig("somehost", 12345)
+    config.is_length_prefixed = True
+    config.MAX_FRAME_SIZE = 1000
+    config.protocol_class = Protocol
+    app = SocketGameApplication(config)
+
+    def setUp(self):
+        super().setUp()
+        self.handler = TwistedLengthPrefixedHandler()
+        self.handler.factory = ServerFactory()
+        self.handler.factory.config = self.config
+        self.handler.factory.protocol_factory = ProtocolFactory(self.config, self.app)
+        self.handler.transport = MagicMock(**{"getPeer.return_value": Mock(host="myhost", port=1234)})
+
+    def test_lifetime(self):
+        # connectionMade
+        self.handler.connectionMade()
+
+        self.assertEqual(self.handler.MAX_LENGTH, 1000)
+        protocol = self.handler.protocol
+        self.assertEqual(protocol.send_bytes_method, self.handler.sendString)
+        self.assertEqual(protocol.close_connection_method, self.handler.transport.loseConnection)
+
+        # sendString
+        protocol.send_raw(b"my\x00data")
+
+        self.handler.transport.write.assert_called_once_with(b"\x00\x00\x00\x07my\x00data")
+
+        # dataReceived
+        protocol.process_bytes_list = Mock()
+
+        self.handler.dataReceived(b"\x00\x00\x00\x07my\x00")
+        self.handler.dataReceived(b"data\x00\x00\x00\x00")
+
+        protocol.process_bytes_list.assert_called_once_with((b"my\x00data",))
+
+        # (Too big frame)
+        self.handler.dataReceived(b"\x00\x00\x03\xe9")
+
+        self.handler.transport.loseConnection.assert_called_once_with()
+
+        # connectionLost
+        protocol.dispose = Mock(side_effect=protocol.dispose)
+
+        self.handler.connectionLost()
+
+        protocol.dispose.assert_called_once()
+        self.assertIsNone(self.handler.protocol)
+
+
+class TestTwistedStreamHandler(TestCase):
+    config = ServerConfig("somehost", 12345)
+    config.is_streaming = True
+    config.protocol_class = Protocol
+    app = SocketGameApplication(config)
+
+    def setUp(self):
+        super().setUp()
+        self.handler = TwistedStreamHandler()
+        self.handler.factory = ServerFactory()
+        self.handler.factory.config = self.config
+        self.handler.factory.protocol_factory = ProtocolFactory(self.config, self.app)
+        self.handler.transport = MagicMock(**{"getPeer.return_value": Mock(host="myhost", port=1234)})
+
+    def test_lifetime(self):
+        # connectionMade
+        self.handler.connectionMade()
+
+        protocol = self.handler.protocol
+        self.assertIsInstance(protocol, Protocol)
+        self.assertEqual(protocol.send_bytes_method, self.handler.send_bytes)
+        self.assertEqual(protocol.close_connection_method, self.handler.transport.loseConnection)
+        self.assertEqual(protocol.address, ("myhost", 1234))
+
+        # send_bytes
+        protocol.send_raw(b"my||data")
+
+        self.handler.transport.write.assert_called_once_with(b"my||data\x00")
+
+        # dataReceived
+        protocol.process_bytes_list = Mock()
+
+        self.handler.dataReceived(b"my||data##my||da")
+        self.handler.dataReceived(b"ta2##\x00")
+
+        protocol.process_bytes_list.assert_has_calls([call([b"my||data"]), call([b"my||data2"])])
+
+        # connectionLost
+        protocol.dispose = Mock(side_effect=protocol.dispose)
+
+        self.handler.connectionLost()
+
+        protocol.dispose.assert_called_once()
+        self.assertIsNone(self.handler.protocol)
+
+
 class TestTwistedTCPServer(TestAbstractServer):
     config = ServerConfig("somehost", 12345)
     app = SocketGameApplication(config)
@@ -297,15 +619,45 @@ class TestThreadedTCPHandler(TestCase):
         self.assertIsNone(self.handler.protocol)
 
     def test_send_bytes(self):
-        self.request.sendall = Mock()
+        self.request.send = Mock(return_value=11)
+
+        self.handler.send_bytes(b"some_bytes")
+
+        self.request.send.assert_called_once_with(b"some_bytes\x00", socket.MSG_DONTWAIT)
+        self.assertIsNone(self.handler._flush_thread)
+
+    def test_send_bytes__client_is_slow(self):
+        sendall_event = Event()
+        self.request.send = Mock(return_value=4)
+        self.request.sendall = Mock(side_effect=lambda data_bytes: sendall_event.wait(5))
 
         self.handler.send_bytes(b"some_bytes")
+        self.handler.send_bytes(b"more")
+
+        # (Not sent by caller's thread while previous data is in queue)
+        self.request.send.assert_called_once_with(b"some_bytes\x00", socket.MSG_DONTWAIT)
+        self.assertIsNotNone(self.handler._flush_thread)
+
+        sendall_event.set()
+        while self.handler._flush_thread:
+            time.sleep(.01)
+        # (Could be coalesced)
+        self.assertEqual(b"".join(args[0] for args, kwargs in self.request.sendall.call_args_list),
+                         b"_bytes\x00more\x00")
+        self.assertEqual(len(self.handler.send_queue), 0)
 
-        self.request.sendall.assert_called_once_with(b"some_bytes\x00")
+        # Max size exceeded
+        self.request.send = Mock(return_value=0)
+        self.request.sendall = Mock(side_effect=lambda data_bytes: sendall_event.wait(5))
+        self.handler.send_queue.max_size = 5
+
+        self.handler.send_bytes(b"some_bytes")
+
+        self.request.shutdown.assert_called_once_with(socket.SHUT_RDWR)
 
     def test_handle(self):
         # Connection lost on recv() returns empty
-        self.request.recv = Mock(side_effect=[
+        self.request.recv_into = mock_recv_into([
             b"1||param1||",
             b"param2##\x002||param1||param2##\x00",
             b"3||", b"param1||", b"param2##\x00",
@@ -332,7 +684,7 @@ class TestThreadedTCPHandler(TestCase):
             if data_bytes_list == [b"4||param1||param2##"]:
                 self.server.abort = True
 
-        self.request.recv = Mock(side_effect=[
+        self.request.recv_into = mock_recv_into([
             b"3||", b"param1||", b"param2##\x00",
             b"4||param1||param2##\x00",
             b"5||param1||param2##\x00"
@@ -348,7 +700,7 @@ class TestThreadedTCPHandler(TestCase):
 
     def test_handle__recv_raises_exception(self):
         # Connection lost on recv() raises socket.error
-        self.request.recv = Mock(side_effect=[
+        self.request.recv_into = mock_recv_into([
             b"3||", b"param1||", b"param2##\x00",
             b"4||param1||param2##\x00",
             socket.error,
@@ -366,7 +718,7 @@ class TestThreadedTCPHandler(TestCase):
 
     def test_handle__process_raises_exception(self):
         # Connection lost on protocol.process_bytes_list() raises exception
-        self.request.recv = Mock(side_effect=[
+        self.request.recv_into = mock_recv_into([
             b"3||", b"param1||", b"param2##\x00",
             b"4||param1||param2##\x00",
             b"5||param1||param2##\x00"
@@ -490,11 +842,6 @@ class TestThreadedTCPServer(TestAbstractServer):
 
 # Non-blocking
 
-class MySocket(socket.socket):
-    def accept(self):
-        raise socket.error
-
-
 class MyNonBlockingTCPServer(NonBlockingTCPServer):
     started_event = Event()
 
@@ -503,16 +850,31 @@ class MyNonBlockingTCPServer(NonBlockingTCPServer):
         super()._workflow(sock)
 
 
-class MyWouldBlockSocketError(socket.error):
+class MyWouldBlockSocketError(BlockingIOError):
     errno = errno.EWOULDBLOCK
 
 
 class MyProtocol(SimpleProtocol):
     disposed_count = 0
 
+    def __init__(self, send_bytes_method=None, close_connection_method=None, address=None, config=None, app=None):
+        super().__init__(send_bytes_method, close_connection_method, address, config, app)
+        self.processed_event = Event()
+        self.disposed_event = Event()
+
+    def process_bytes_list(self, data_bytes_list):
+        self.processed_event.set()
+
     def dispose(self):
         super().dispose()
         MyProtocol.disposed_count += 1
+        self.disposed_event.set()
+
+    def wait_processed(self):
+        # (Wait for next process_bytes_list() call)
+        result = self.processed_event.wait(5)
+        self.processed_event.clear()
+        return result
 
 
 class TestNonBlockingTCPServer(TestAbstractServer):
@@ -523,11 +885,6 @@ class TestNonBlockingTCPServer(TestAbstractServer):
     def setUp(self):
         # super().setUp()
 
-        # # For test_start_stop()
-        # patcher = patch("napalm.socket.server.NonBlockingTCPServer", MyNonBlockingTCPServer)
-        # self.addCleanup(patcher.stop)
-        # patcher.start()
-
         self.server = MyNonBlockingTCPServer(self.config, self.app)
 
     def test_init_default(self):
@@ -540,9 +897,10 @@ class TestNonBlockingTCPServer(TestAbstractServer):
         self.server._workflow = Mock()
         # Simulate workflow activity
         protocol = MagicMock()
-        self.server._request_by_protocol = {protocol: Mock()}
-        self.server._buffer_by_protocol = {protocol: b"data"}
-        self.server._protocol_list = [protocol]
+        request = Mock()
+        self.server._protocol_by_request = {request: protocol}
+        self.server._buffer_by_request = {request: b"data"}
+        self.server._send_queue_by_request = {request: SendQueue()}
 
         self.server.start()
         # Should skip others without errors
@@ -559,9 +917,9 @@ class TestNonBlockingTCPServer(TestAbstractServer):
         # Should be cleared after serving ended
         self.assertIsNone(self.server._sock)
         protocol.dispose.assert_called_once()
-        self.assertEqual(self.server._protocol_list, [])
-        self.assertEqual(self.server._request_by_protocol, {})
-        self.assertEqual(self.server._buffer_by_protocol, {})
+        self.assertEqual(self.server._protocol_by_request, {})
+        self.assertEqual(self.server._buffer_by_request, {})
+        self.assertEqual(self.server._send_queue_by_request, {})
 
     def test_stop(self):
         self.assertFalse(self.server._abort)
@@ -594,14 +952,18 @@ class TestNonBlockingTCPServer(TestAbstractServer):
 
         sock = self.server._sock
 
+        t = time.time()
         self.server.stop()
         # Should skip others without errors
         self.server.stop()
         self.server.stop()
 
+        # Selector is woken up on stop (not waiting for select timeout)
+        self.assertLess(time.time() - t, self.server.select_timeout_sec)
         # Should be cleared after serving ended
         self.assertTrue(self.server._abort)
         self.assertIsNone(self.server._sock)
+        self.assertIsNone(self.server._selector)
         with self.assertRaises(OSError):
             # Error means socket closed
             # (OSError: [WinError 10038] Сделана попытка выполнить операцию на объекте, не являющемся сокетом)
@@ -611,154 +973,619 @@ class TestNonBlockingTCPServer(TestAbstractServer):
 
         thread.join()
 
-    def test_workflow(self):
+    def test_reuse_port(self):
+        config = ServerConfig("localhost", 12346, MyProtocol)
+        config.is_reuse_port = True
+        servers = [MyNonBlockingTCPServer(config), MyNonBlockingTCPServer(config)]
+
+        # Both listen the same port
+        threads = []
+        for server in servers:
+            MyNonBlockingTCPServer.started_event.clear()
+            thread = Thread(target=server.start)
+            thread.start()
+            threads.append(thread)
+            MyNonBlockingTCPServer.started_event.wait()
+            self.assertIsNotNone(server._sock)
+
+        for server, thread in zip(servers, threads):
+            server.stop()
+            thread.join()
+
+    def test_read(self):
         requests = [MagicMock(), MagicMock(), MagicMock()]
-        protocols = [MyProtocol(), MyProtocol(), MyProtocol(), MyProtocol()]
+        protocols = [MyProtocol(), MyProtocol(), MyProtocol()]
+        for request, protocol in zip(requests, protocols):
+            protocol.process_bytes_list = Mock()
+            self.server._protocol_by_request[request] = protocol
 
         # Set up data received by request and processed by protocol
+        # (One recv() on each readiness event)
         # (Connection lost on recv() returns empty)
-        requests[0].recv = Mock(side_effect=[
+        requests[0].recv_into = mock_recv_into([
             b"1||param1||",
             MyWouldBlockSocketError,
             b"param2##\x002||param1||param2##\x00",
-            MyWouldBlockSocketError,
             b"3||", b"param1||", b"param2##\x00",
             MyWouldBlockSocketError,
             b"4||param1||param2##\x00",
             b"",
-            b"5||param1||param2##\x00"
         ])
-        protocols[0].process_bytes_list = Mock()
 
         # (Connection lost on recv() raises socket.error)
-        requests[1].recv = Mock(side_effect=[
+        requests[1].recv_into = mock_recv_into([
             b"6||", b"param1||", b"param2##\x00",
             MyWouldBlockSocketError,
             b"7||param1||param2##\x00",
-            # (In our server implementation we suggest that error could not occur before
-            # between blocking if we've already received some data.
-            # So we place MyWouldBlockSocketError before socket.error.)
-            MyWouldBlockSocketError,
             socket.error,
-            b"8||param1||param2##\x00"
         ])
-        # protocols[1].process_bytes_list = Mock(
-        #     side_effect={b"4||param1||param2##": socket.error})
-        protocols[1].process_bytes_list = Mock()
 
         # (Connection lost on protocol.process_bytes_list() raises exception)
-        requests[2].recv = Mock(side_effect=[
+        requests[2].recv_into = mock_recv_into([
             b"9||", b"param1||", b"param2##\x00",
-            MyWouldBlockSocketError,
             b"10||param1||param2##\x00",
-            MyWouldBlockSocketError,
-            b"11||param1||param2##\x00"
         ])
 
         def do_raise(data_bytes_list):
             if data_bytes_list == [b"10||param1||param2##"]:
                 raise MySpecificException
 
-        protocols[2].process_bytes_list = Mock(side_effect=do_raise)
+        protocols[2].process_bytes_list.side_effect = do_raise
+
+        # Read
+        MyProtocol.disposed_count = 0
+        for request, recv_count in zip(requests, [9, 6, 4]):
+            for _ in range(recv_count):
+                self.server._read(request)
 
-        # Expected results
-        expected_call_args_list = [[
+        # Assert
+        self.assertEqual(protocols[0].process_bytes_list.call_args_list, [
             call([b"1||param1||param2##", b"2||param1||param2##"]),
             call([b"3||param1||param2##"]),
             call([b"4||param1||param2##"])
-        ], [
+        ])
+        self.assertEqual(protocols[1].process_bytes_list.call_args_list, [
             call([b"6||param1||param2##"]),
             call([b"7||param1||param2##"])
-        ], [
+        ])
+        self.assertEqual(protocols[2].process_bytes_list.call_args_list, [
             call([b"9||param1||param2##"]),
             call([b"10||param1||param2##"])
-        ], [
-            # Current protocol is not used
-        ]]
+        ])
+        # All disconnected
+        self.assertEqual(MyProtocol.disposed_count, 3)
+        for request in requests:
+            request.close.assert_called_once()
+        self.assertEqual(self.server._protocol_by_request, {})
+        self.assertEqual(self.server._buffer_by_request, {})
 
-        self.do_test_workflow(requests, protocols, expected_call_args_list)
+    def test_read_after_disconnect(self):
+        request = MagicMock()
+        request.recv_into = mock_recv_into([b"1||param1||param2##\x00"])
 
-        # todo assert instances in protocol_list and lookups
+        # (Not processed if disconnected from other thread)
+        self.server._read(request)
 
-    def test_workflow_with_abort(self):
-        requests = [MagicMock(), MagicMock()]
-        protocols = [MyProtocol(), MyProtocol(), MyProtocol()]
+        self.assertEqual(self.server._buffer_by_request, {})
 
-        # Set up data received by request and processed by protocol
-        # (Connection lost on recv() returns empty)
-        requests[0].recv = Mock(side_effect=[
-            b"1||param1||",
-            MyWouldBlockSocketError,
-            b"param2##\x002||param1||param2##\x00",
-            MyWouldBlockSocketError,
-            b"3||", b"param1||", b"param2##\x00",
-            MyWouldBlockSocketError,
-            b"4||param1||param2##\x00",
-            b"",
-            b"5||param1||param2##\x00"
-        ])
+    def test_accept(self):
+        sock = MagicMock()
+        requests = [MagicMock(**{"fileno.return_value": 1}) for _ in range(3)]
+        sock.accept.side_effect = [(request, ("somehost", 1000 + i)) for i, request in enumerate(requests)] + \
+                                  [MyWouldBlockSocketError]
+        self.server._selector = MagicMock()
+        protocols = [MyProtocol(), MyProtocol()]
+        # (Creating protocol for second request fails)
+        self.server.protocol_factory.create = Mock(side_effect=[protocols[0], MySpecificException, protocols[1]])
+
+        self.server._accept(sock)
+
+        # (All accepted in one batch)
+        self.assertEqual(sock.accept.call_count, 4)
+        self.assertEqual(self.server._selector.register.call_count, 3)
+        self.assertEqual(self.server._protocol_by_request, {requests[0]: protocols[0], requests[2]: protocols[1]})
+        # (Request with failed protocol is closed)
+        self.server._selector.unregister.assert_called_once_with(requests[1])
+        requests[1].close.assert_called_once()
+        requests[0].close.assert_not_called()
+
+    def test_send_error_disconnects(self):
+        request = MagicMock()
+        request.fileno.return_value = 1
+        request.send.side_effect = BrokenPipeError
+        protocol = MyProtocol()
+        self.server._protocol_by_request[request] = protocol
 
-        protocols[0].process_bytes_list = Mock()
+        # No exception
+        self.server._send(request, b"data")
 
-        # (Connection lost on recv() raises socket.error)
-        requests[1].recv = Mock(side_effect=[
-            b"6||", b"param1||", b"param2##\x00",
-            MyWouldBlockSocketError,
-            b"7||param1||param2##\x00",
-            MyWouldBlockSocketError,
-            b"8||param1||param2##\x00"
-        ])
+        self.assertTrue(protocol.disposed_event.is_set())
+        request.close.assert_called_once()
+        self.assertEqual(self.server._protocol_by_request, {})
+
+    def test_workflow(self):
+        protocols = [MyProtocol(), MyProtocol(), MyProtocol()]
+        thread, clients = self.start_workflow(protocols)
+
+        # Partial data
+        clients[0].sendall(b"1||param1||")
+        clients[0].sendall(b"param2##\x002||param1||param2##\x00")
+        self.assertTrue(protocols[0].wait_processed())
+        clients[1].sendall(b"6||param1||param2##\x00")
+        self.assertTrue(protocols[1].wait_processed())
+
+        # Disconnect by client
+        clients[0].close()
+        self.assertTrue(protocols[0].disposed_event.wait(5))
+
+        # Disconnect on protocol.process_bytes_list() raises exception
+        protocols[2].process_bytes_list = Mock(side_effect=MySpecificException)
+        clients[2].sendall(b"10||param1||param2##\x00")
+        self.assertTrue(protocols[2].disposed_event.wait(5))
+        self.assertEqual(clients[2].recv(1024), b"")
+
+        # Send from other thread
+        protocols[1].send_raw(b"11||param1||param2##")
+        self.assertEqual(clients[1].recv(1024), b"11||param1||param2##\x00")
+
+        self.stop_workflow(thread, clients)
+
+        self.assertTrue(protocols[1].disposed_event.is_set())
+        # All connections are removed
+        self.assertEqual(self.server._protocol_by_request, {})
+        self.assertEqual(self.server._buffer_by_request, {})
+
+    def test_workflow_length_prefixed(self):
+        self.server.config = ServerConfig(*self.address, Protocol)
+        self.server.config.is_length_prefixed = True
+        protocols = [MyProtocol()]
+        protocols[0].process_bytes_list = Mock(side_effect=lambda data_bytes_list: protocols[0].processed_event.set())
+        thread, clients = self.start_workflow(protocols)
+
+        # (Delimiter can be in data)
+        clients[0].sendall(b"\x00\x00\x00\x0c1||param1\x00#")
+        clients[0].sendall(b"#")
+        self.assertTrue(protocols[0].wait_processed())
+        protocols[0].send_raw(b"2\x00")
+        self.assertEqual(clients[0].recv(1024), b"\x00\x00\x00\x022\x00")
+
+        self.stop_workflow(thread, clients)
+
+        protocols[0].process_bytes_list.assert_called_once_with([b"1||param1\x00##"])
+
+    def test_workflow_with_abort(self):
+        protocols = [MyProtocol(), MyProtocol()]
+        thread, clients = self.start_workflow(protocols)
 
         def do_abort(data_bytes_list):
-            if data_bytes_list == [b"7||param1||param2##"]:
-                self.server._abort = True
+            self.server._abort = True
+            protocols[1].processed_event.set()
         protocols[1].process_bytes_list = Mock(side_effect=do_abort)
+        protocols[0].process_bytes_list = Mock(side_effect=protocols[0].process_bytes_list)
 
-        # Expected results
-        expected_call_args_list = [[
-            call([b"1||param1||param2##", b"2||param1||param2##"]),
-            call([b"3||param1||param2##"]),
-            # call([b"4||param1||param2##"])
-        ], [
-            call([b"6||param1||param2##"]),
-            call([b"7||param1||param2##"])
-            # Aborted
-        ], [
-            # Current protocol is not used
-        ]]
+        clients[0].sendall(b"1||param1||param2##\x00")
+        self.assertTrue(protocols[0].wait_processed())
+        clients[1].sendall(b"7||param1||param2##\x00")
+        self.assertTrue(protocols[1].wait_processed())
+        # (Aborted)
+        thread.join()
+        try:
+            clients[0].sendall(b"3||param1||param2##\x00")
+        except socket.error:
+            pass
+
+        self.stop_workflow(thread, clients)
+
+        protocols[0].process_bytes_list.assert_called_once_with([b"1||param1||param2##"])
+        protocols[1].process_bytes_list.assert_called_once_with([b"7||param1||param2##"])
+
+    def test_send_when_kernel_buffer_is_full(self):
+        request, client = socket.socketpair()
+        request.setblocking(0)
+        request.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+        self.server._selector = selectors.DefaultSelector()
+        self.server._selector.register(request, selectors.EVENT_READ)
+
+        # Send
+        data_bytes = bytes(random.getrandbits(8) for _ in range(100000))
+        self.server._send(request, data_bytes)
+        self.server._send(request, b"end")
+
+        self.assertIn(request, self.server._send_queue_by_request)
+        self.assertEqual(bytes(self.server._send_queue_by_request[request].peek()[-1]), b"end")
+        self.assertEqual(self.server._selector.get_key(request).events,
+                         selectors.EVENT_READ | selectors.EVENT_WRITE)
+
+        # Write when writable
+        received_bytes = b""
+        while len(received_bytes) < len(data_bytes) + 3:
+            received_bytes += client.recv(65536)
+            self.server._write(request)
+
+        self.assertEqual(received_bytes, data_bytes + b"end")
+        self.assertNotIn(request, self.server._send_queue_by_request)
+        self.assertEqual(self.server._selector.get_key(request).events, selectors.EVENT_READ)
+
+        # Tear down
+        self.server._selector.close()
+        request.close()
+        client.close()
+
+    def test_send_to_slow_client(self):
+        request, client = socket.socketpair()
+        request.setblocking(0)
+        request.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+        self.server._selector = selectors.DefaultSelector()
+        self.server._selector.register(request, selectors.EVENT_READ)
+        protocol = MyProtocol()
+        self.server._protocol_by_request[request] = protocol
+
+        # High watermark
+        data_bytes = b"x" * 1000
+        while not self.server._send_queue_by_request.get(request):
+            self.server._send(request, data_bytes)
+        while len(self.server._send_queue_by_request[request]) < self.config.send_high_watermark:
+            self.assertFalse(protocol.is_writing_paused)
+            self.server._send(request, data_bytes)
+        self.assertTrue(protocol.is_writing_paused)
+
+        # Low watermark
+        while self.server._send_queue_by_request.get(request):
+            client.recv(65536)
+            self.server._write(request)
+        self.assertFalse(protocol.is_writing_paused)
+
+        # Max size exceeded
+        for _ in range(self.config.send_max_size // len(data_bytes) + 100):
+            self.server._send(request, data_bytes)
+        self.assertTrue(protocol.disposed_event.is_set())
+        self.assertEqual(request.fileno(), -1)
+        self.assertEqual(self.server._send_queue_by_request, {})
+
+        # Tear down
+        self.server._selector.close()
+        client.close()
+
+    def start_workflow(self, protocols):
+        protocol_iter = iter(protocols)
+
+        def create(send_bytes_method, close_connection_method, address):
+            protocol = next(protocol_iter)
+            protocol.send_bytes_method = send_bytes_method
+            protocol.close_connection_method = close_connection_method
+            protocol.address = address
+            return protocol
+        self.server.protocol_factory.create = Mock(side_effect=create)
+
+        # Start
+        MyNonBlockingTCPServer.started_event.clear()
+        thread = Thread(target=self.server.start)
+        thread.start()
+        MyNonBlockingTCPServer.started_event.wait()
+
+        # Connect
+        clients = [socket.create_connection(self.address) for _ in protocols]
+        # (Wait until all accepted)
+        while len(self.server._protocol_by_request) < len(clients):
+            time.sleep(.01)
+        return thread, clients
+
+    def stop_workflow(self, thread, clients):
+        if self.server.started:
+            self.server.stop()
+        thread.join()
+        for client in clients:
+            client.close()
+
+
+# Thread pool
+
+class MyOrderProtocol(SimpleProtocol):
+    lock = Lock()
+    active_count = 0
+    max_active_count = 0
 
-        self.do_test_workflow(requests, protocols, expected_call_args_list)
+    def __init__(self, send_bytes_method=None, close_connection_method=None, address=None, config=None, app=None):
+        super().__init__(send_bytes_method, close_connection_method, address, config, app)
+        self.received_list = []
+        self.done_event = Event()
 
-        # todo assert instances in protocol_list and lookups
+    def process_bytes_list(self, data_bytes_list):
+        with self.lock:
+            MyOrderProtocol.active_count += 1
+            MyOrderProtocol.max_active_count = max(MyOrderProtocol.max_active_count, MyOrderProtocol.active_count)
+        time.sleep(.001)
+        self.received_list.extend(data_bytes_list)
+        with self.lock:
+            MyOrderProtocol.active_count -= 1
+        if self.received_list and self.received_list[-1] == b"end":
+            self.done_event.set()
 
-    def do_test_workflow(self, requests, protocols, expected_call_args_list):
-        # (All process_bytes_list methods should be mocked)
+
+class TestThreadPoolTCPServer(TestCase):
+    address = ("localhost", 12349)
+
+    def setUp(self):
+        super().setUp()
+
+        self.config = ServerConfig(*self.address, MyOrderProtocol)
+        self.config.max_threads = 2
+        self.config.max_queue_size = 4
+        self.server = ThreadPoolTCPServer(self.config)
+        MyOrderProtocol.active_count = 0
+        MyOrderProtocol.max_active_count = 0
+
+    def tearDown(self):
+        self.server.dispose()
+        self.server = None
+        super().tearDown()
+
+    def test_process_in_order(self):
+        protocols = []
+        create = self.server.protocol_factory.create
+        self.server.protocol_factory.create = Mock(side_effect=lambda *args: protocols.append(create(*args)) or
+                                                   protocols[-1])
+        thread = self.start_server(self.server)
+
+        clients = [socket.create_connection(self.address) for _ in range(4)]
+        for i in range(50):
+            for client in clients:
+                client.sendall(str(i).encode() + b"\x00")
+        for client in clients:
+            client.sendall(b"end\x00")
+        while len(protocols) < len(clients):
+            time.sleep(.01)
         for protocol in protocols:
-            if not isinstance(protocol.process_bytes_list, Mock):
-                protocol.process_bytes_list = Mock()
+            self.assertTrue(protocol.done_event.wait(5))
 
-        # Set up connections
-        # (Accepting connection and creating protocol for each)
-        sock = MagicMock()
-        accept_list = list([(request, ("somehost", random.randint(1000, 60000))) for request in requests])
-        accept_list.append(socket.error)
-        accept_list.insert(0, socket.error)
-        sock.accept.side_effect = accept_list
-        self.server.protocol_factory.create = Mock(side_effect=protocols)
+        # Frames of each connection are processed in order
+        expected = [str(i).encode() for i in range(50)] + [b"end"]
+        for protocol in protocols:
+            self.assertEqual(protocol.received_list, expected)
+        # Pool is bounded
+        self.assertLessEqual(MyOrderProtocol.max_active_count, 2)
 
-        # Start
-        MyProtocol.disposed_count = 0
-        thread = Thread(target=self.server._workflow, args=[sock])
+        self.server.stop()
+        thread.join()
+        for client in clients:
+            client.close()
+
+    def test_submit_blocks_if_queue_is_full(self):
+        self.server._queue_semaphore = BoundedSemaphore(2)
+        self.server._executor = ThreadPoolExecutor(1)
+        release_event = Event()
+        request = Mock()
+
+        self.server._submit(request, release_event.wait)
+        self.server._submit(request, Mock())
+        # (First task is running, so one place is freed)
+        self.server._submit(request, Mock())
+
+        # Queue is full
+        submit_thread = Thread(target=self.server._submit, args=(request, Mock()))
+        submit_thread.start()
+        submit_thread.join(.3)
+        self.assertTrue(submit_thread.is_alive())
+
+        release_event.set()
+        submit_thread.join(5)
+        self.assertFalse(submit_thread.is_alive())
+
+        self.server._executor.shutdown(wait=True)
+        self.assertEqual(self.server._task_queue_by_request, {})
+
+    def test_dispose_after_pending_frames(self):
+        self.server._queue_semaphore = BoundedSemaphore(10)
+        self.server._executor = ThreadPoolExecutor(2)
+        request = Mock()
+        protocol = Mock()
+        protocol.process_bytes_list.side_effect = lambda data_bytes_list: time.sleep(.05)
+        self.server._protocol_by_request[request] = protocol
+
+        self.server._process(request, protocol, [b"1"])
+        self.server._process(request, protocol, [b"2"])
+        self.server._process_disconnect(request, "(test)")
+        # (Removed at once, so no more data is read)
+        self.assertNotIn(request, self.server._protocol_by_request)
+        self.server._executor.shutdown(wait=True)
+
+        self.assertEqual(protocol.method_calls, [call.process_bytes_list([b"1"]), call.process_bytes_list([b"2"]),
+                                                 call.dispose()])
+        request.close.assert_called_once_with()
+
+    def test_threaded_server_with_max_threads(self):
+        self.server = ThreadedTCPServer(self.config)
+        self.assertIsInstance(self.server.pool_server, ThreadPoolTCPServer)
+        self.assertIs(self.server.pool_server.protocol_factory, self.server.protocol_factory)
+
+        thread = self.start_server(self.server.pool_server, self.server.start)
+        client = socket.create_connection(self.address)
+        while not self.server.pool_server._protocol_by_request:
+            time.sleep(.01)
+        protocol = list(self.server.pool_server._protocol_by_request.values())[0]
+        client.sendall(b"1\x00end\x00")
+        self.assertTrue(protocol.done_event.wait(5))
+        self.assertEqual(protocol.received_list, [b"1", b"end"])
+
+        self.server.stop()
+        thread.join()
+        client.close()
+
+    def start_server(self, server, start=None):
+        thread = Thread(target=start or server.start)
         thread.start()
+        # (Wait until listening)
+        while not server._selector:
+            time.sleep(.01)
+        return thread
 
-        # Wait until all protocol disposed to abort workflow
-        # (Note: we take len(requests), because len(protocols) could be > len(requests))
-        while MyProtocol.disposed_count < len(requests) and not self.server._abort:
-            pass
-        self.server._abort = True
-        # thread.join()
 
-        # Assert
-        for index, expected_call_args in enumerate(expected_call_args_list):
-            actual_call_args = protocols[index].process_bytes_list.call_args_list
-            self.assertEqual(actual_call_args, expected_call_args)
+# Asyncio
+
+class TestAsyncioHandler(TestCase):
+    config = ServerConfig("somehost", 12345)
+    config.DELIMITER = b"[MYEND]"
+    config.protocol_class = Protocol
+    app = SocketGameApplication(config)
+
+    def setUp(self):
+        super().setUp()
+        self.server = Mock(config=self.config, protocol_factory=ProtocolFactory(self.config, self.app),
+                           handler_set=set())
+        self.handler = AsyncioHandler(self.server)
+        self.transport = MagicMock(**{"get_extra_info.return_value": ("myhost", 1234),
+                                      "get_write_buffer_size.return_value": 0})
+
+    def test_lifetime(self):
+        # connection_made
+        self.handler.connection_made(self.transport)
+
+        protocol = self.handler.protocol
+        self.assertIsInstance(protocol, Protocol)
+        self.assertEqual(protocol.send_bytes_method, self.handler.send_bytes)
+        self.assertEqual(protocol.close_connection_method, self.transport.close)
+        self.assertEqual(protocol.config, self.config)
+        self.assertEqual(protocol.address, ("myhost", 1234))
+        self.assertEqual(self.server.handler_set, {self.handler})
+        self.transport.set_write_buffer_limits.assert_called_once_with(
+            self.config.send_high_watermark, self.config.send_low_watermark)
+
+        # send_bytes
+        self.handler.send_bytes(b"abc")
+
+        self.transport.write.assert_called_once_with(b"abc[MYEND]")
+
+        # send_bytes: slow client
+        self.handler.pause_writing()
+        self.assertTrue(protocol.is_writing_paused)
+        self.handler.resume_writing()
+        self.assertFalse(protocol.is_writing_paused)
+        self.transport.get_write_buffer_size.return_value = self.config.send_max_size + 1
+
+        self.handler.send_bytes(b"abc")
+
+        self.transport.abort.assert_called_once_with()
+
+        # data_received
+        protocol.process_bytes_list = Mock()
+
+        self.handler.data_received(b"my||data")
+        protocol.process_bytes_list.assert_not_called()
+        self.handler.data_received(b"||line##[MYEND]my||data2[MYEND]my||")
+
+        self.assertEqual(self.handler.protocol, protocol)
+        protocol.process_bytes_list.assert_called_once_with([b"my||data||line##", b"my||data2"])
+        self.assertEqual(self.handler.receive_buffer.pending_bytes, b"my||")
+
+        # data_received: processing raises exception
+        protocol.process_bytes_list = Mock(side_effect=MySpecificException)
+
+        self.handler.data_received(b"[MYEND]")
+
+        self.transport.close.assert_called_once()
+
+        # connection_lost
+        protocol.dispose = Mock(side_effect=protocol.dispose)
+
+        self.handler.connection_lost(None)
+
+        protocol.dispose.assert_called_once()
+        self.assertIsNone(self.handler.protocol)
+        self.assertIsNone(self.handler.transport)
+        self.assertEqual(self.server.handler_set, set())
+
+
+class MyRecordingProtocol(SimpleProtocol):
+    def __init__(self, send_bytes_method=None, close_connection_method=None, address=None, config=None, app=None):
+        self.received_bytes_list = []
+        super().__init__(send_bytes_method, close_connection_method, address, config, app)
+
+    def process_bytes_list(self, bytes_list):
+        self.received_bytes_list.extend(bytes_list)
+
+
+class TestAsyncioTCPServer(TestAbstractServer):
+    address = ("localhost", 12347)
+    config = ServerConfig(*address, MyRecordingProtocol)
+    app = SocketGameApplication(config)
+
+    def setUp(self):
+        # super().setUp()
+        self.server = AsyncioTCPServer(self.config, self.app)
+
+    def tearDown(self):
+        if isinstance(self.server.loop, asyncio.AbstractEventLoop):
+            self.server.loop.close()
+        super().tearDown()
+
+    def test_init_default(self):
+        with self.assertRaises(Exception):
+            AsyncioTCPServer(None)
+
+    def test_init(self):
+        super().test_init()
+
+        self.assertIsNone(AsyncioTCPServer.loop)
+        self.assertIsInstance(self.server.loop, asyncio.AbstractEventLoop)
+
+    def test_start(self, server_mock=None):
+        self.server.loop.close()
+        self.server.loop = loop = MagicMock(spec=asyncio.AbstractEventLoop)
+        asyncio_server = loop.run_until_complete.return_value
+
+        self.server.start()
+
+        loop.create_server.assert_called_once()
+        self.assertEqual(loop.create_server.call_args[0][1:], ("localhost", 12347))
+        self.assertEqual(loop.run_forever.call_count, 2)
+        asyncio_server.close.assert_called_once()
+        asyncio_server.wait_closed.assert_called_once()
+        # Should be cleared after serving ended
+        self.assertIsNone(self.server.server)
+
+    def test_stop(self):
+        self.server.loop.close()
+        self.server.loop = Mock()
+        self.server.stop()
+        self.server.loop.call_soon_threadsafe.assert_not_called()
+
+    def test_start_stop(self):
+        # Start server
+        thread = Thread(target=self.server.start)
+        thread.start()
+        while not self.server.started:
+            time.sleep(.01)
+        # Should skip others without errors
+        self.server.start()
+        self.server.start()
+
+        # Connect client
+        client_socket = socket.create_connection(self.address)
+        client_socket.sendall(b"command1##param1\x00command2")
+        client_socket.sendall(b"##param2\x00")
+        time.sleep(.1)
+
+        self.assertEqual(len(self.server.handler_set), 1)
+        handler = list(self.server.handler_set)[0]
+        protocol = handler.protocol
+        self.assertIsInstance(protocol, MyRecordingProtocol)
+        self.assertEqual(protocol.received_bytes_list, [b"command1##param1", b"command2##param2"])
+
+        # Send to client
+        protocol.send_raw(b"command3##param3")
+
+        self.assertEqual(client_socket.recv(1024), b"command3##param3\x00")
+
+        self.server.stop()
+        # Should skip others without errors
+        self.server.stop()
+        self.server.stop()
+
+        thread.join()
+
+        # Should be cleared after serving ended
+        self.assertIsNone(self.server.server)
+        self.assertEqual(self.server.handler_set, set())
+        self.assertIsNone(handler.protocol)
+        self.assertEqual(client_socket.recv(1024), b"")
+        client_socket.close()
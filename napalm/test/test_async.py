@@ -1,3 +1,4 @@
+import asyncio
 import threading
 import time
 from unittest import TestCase
@@ -5,7 +6,7 @@ from unittest.mock import Mock
 
 from twisted.internet import reactor
 
-from napalm.async import Signal, Timeout, AbstractTimer, ThreadedTimer, TwistedTimer
+from napalm.async import Signal, Timeout, AbstractTimer, ThreadedTimer, TwistedTimer, AsyncioTimer, TimingWheel
 
 
 class TestSignal(TestCase):
@@ -390,6 +391,82 @@ class TestTimeout:  # (TestCase):
         self.timer_complete_dispatched_count += 1
 
 
+class TestTimingWheel(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.wheel = TimingWheel(1, 0)
+
+    def test_add_and_remove(self):
+        self.wheel.add("a", 10, 0)
+        self.wheel.add("b", 5000, 0)
+        self.wheel.add("c", 10, 0)
+        self.wheel.add("a", 20, 0)
+
+        self.assertEqual(len(self.wheel), 3)
+        self.assertIn("a", self.wheel)
+        self.assertEqual(list(self.wheel), ["b", "c", "a"])
+
+        self.wheel.remove("b")
+        self.wheel.remove("b")
+
+        self.assertNotIn("b", self.wheel)
+        self.assertEqual(list(self.wheel), ["c", "a"])
+
+        self.wheel.clear()
+
+        self.assertEqual(len(self.wheel), 0)
+        self.assertEqual(self.wheel.advance(100), [])
+
+    def test_advance(self):
+        self.wheel.add("a", .5, 0)
+        self.wheel.add("b", 3, 0)
+        self.wheel.add("c", 100, 0)
+        self.wheel.add("d", 5000, 0)
+        self.wheel.add("e", 3, 0)
+        # (Overdue)
+        self.wheel.add("f", -1, 0)
+
+        self.assertEqual(self.wheel.advance(0), ["f"])
+        self.assertEqual(self.wheel.advance(1), ["a"])
+        self.assertEqual(self.wheel.advance(2.9), [])
+        # (In order of adding)
+        self.assertEqual(self.wheel.advance(3), ["b", "e"])
+        self.assertEqual(self.wheel.advance(99.9), [])
+        self.assertEqual(self.wheel.advance(150), ["c"])
+        self.assertEqual(self.wheel.advance(4999.9), [])
+        self.assertEqual(self.wheel.advance(5000), ["d"])
+        self.assertEqual(len(self.wheel), 0)
+
+        # (Current tick after advanced while empty)
+        self.wheel.add("a", 6000.5, 6000)
+        self.assertEqual(self.wheel.advance(6001), ["a"])
+
+    def test_set_resolution(self):
+        self.wheel.add("a", 10, 0)
+        self.wheel.set_resolution(.1, 0)
+
+        self.assertEqual(self.wheel.resolution_sec, .1)
+        self.assertEqual(self.wheel.advance(9.95), [])
+        self.assertEqual(self.wheel.advance(10), ["a"])
+
+    def test_get_next_deadline(self):
+        self.assertIsNone(self.wheel.get_next_deadline())
+
+        self.wheel.add("a", 5000, 0)
+        self.wheel.add("b", 100.5, 0)
+        self.wheel.add("c", 100.2, 0)
+
+        self.assertEqual(self.wheel.get_next_deadline(), 100.2)
+
+        self.wheel.add("d", 3.5, 0)
+        self.assertEqual(self.wheel.get_next_deadline(), 3.5)
+        self.wheel.add("e", -1, 0)
+        self.assertEqual(self.wheel.get_next_deadline(), -1)
+
+        self.wheel.advance(200)
+        self.assertEqual(self.wheel.get_next_deadline(), 5000)
+
+
 class BaseTestTimer:
     timer_class = AbstractTimer
 
@@ -456,14 +533,15 @@ class BaseTestTimer:
         self.timer = self.timer_class(self.callback, self.DELAY_SEC)
         self.timer.timer_signal.add(self.timer_handler)
         self.timer.timer_complete_signal.add(self.timer_complete_handler)
+        self.timer._timers.set_resolution(self.RESOLUTION_SEC)
         # print("  SETUP")
-        self.assertEqual(self.timer._timers, [])
+        self.assertEqual(len(self.timer._timers), 0)
         self.assertFalse(self.timer._is_ticking)
 
     def tearDown(self):
         # print("TEARDOWN")
         self.timer.dispose()
-        self.timer._timers = []
+        self.timer._timers.clear()
         # print("  TEARDOWN", threading.active_count(), threading.enumerate())
 
     def test_simple_simulatation_for_2_repeat_counts(self):
@@ -509,6 +587,22 @@ class BaseTestTimer:
 
         self.assert_after_timer_event(2, is_completed=True)
 
+    def test_start_earlier_timer(self):
+        # (Ticking planned for long timer should be woken up for the new one)
+        long_timer = self.timer_class(delay_sec=self.DELAY_SEC * 10)
+        long_timer.start()
+        time.sleep(self.RESOLUTION_SEC * 2)
+
+        self.timer.repeat_count = 1
+        self.timer.start()
+        time.sleep(self.DELAY_SEC + self.RESOLUTION_SEC * 2)
+
+        self.callback.assert_called_once()
+        self.assertTrue(long_timer.running)
+
+        # Tear down
+        long_timer.dispose()
+
     def test_simulation_of_repeat_counts_and_reset_after_complete(self):
         self.timer.repeat_count = self.REPEAT_COUNT
 
@@ -613,27 +707,28 @@ class BaseTestTimer:
     # Unittests
 
     def test_add_and_remove_timer(self):
-        self.assertEqual(self.timer._timers, [])
+        self.assertEqual(len(self.timer._timers), 0)
         self.assertFalse(self.timer._is_ticking)
 
         # Add
         self.timer._add_timer(self.timer)
         self.timer._add_timer(self.timer)
 
-        self.assertEqual(self.timer._timers, [self.timer])
+        self.assertEqual(list(self.timer._timers), [self.timer])
         self.assertTrue(self.timer._is_ticking)
 
         # Remove
         self.timer._remove_timer(self.timer)
         self.timer._remove_timer(self.timer)
 
-        self.assertEqual(self.timer._timers, [])
+        self.assertEqual(len(self.timer._timers), 0)
         self.assertFalse(self.timer._is_ticking)
 
     def test_start_and_stop_ticking(self):
         self.timer.delay_sec = 0
         self.timer._timer = Mock()  # (Mocking of _timer() method)
-        self.timer._timers.append(self.timer)
+        self.timer._running = True
+        self.timer._timers.add(self.timer, time.time())
 
         self.assertFalse(self.timer._is_ticking)
         time.sleep(self.DELAY_SEC / 2)
@@ -658,6 +753,7 @@ class BaseTestTimer:
 
         # Tear down
         self.timer._timers.remove(self.timer)
+        self.timer._running = False
         self.timer._stop_ticking()
 
     def test_tick(self):
@@ -665,7 +761,11 @@ class BaseTestTimer:
         timer1._timer = Mock()
         timer2 = self.timer_class(delay_sec=self.DELAY_SEC)
         timer2._timer = Mock()
-        self.timer._timers.extend([timer1, timer2])
+        # (As started, but without ticking)
+        for timer in (timer1, timer2):
+            timer._running = True
+            timer._start_time = time.time()
+            self.timer._timers.add(timer, timer._get_deadline())
 
         # elapsed_time = 0
         self.timer._tick()
@@ -673,45 +773,27 @@ class BaseTestTimer:
         timer1._timer.assert_not_called()
         timer2._timer.assert_not_called()
 
-        # 0 < elapsed_time < delay
-        timer1._start_time = time.time()
+        # 0 < elapsed_time < delay (deadlines changed)
         timer1.elapsed_time = self.delay_before()
-        timer2._start_time = time.time() - self.delay_before()
-        timer2.elapsed_time = 0
+        timer2.elapsed_time = self.delay_before() / 2
 
         self.timer._tick()
 
         timer1._timer.assert_not_called()
         timer2._timer.assert_not_called()
 
-        # 0 < elapsed_time < delay in one more combination
-        timer1._start_time = time.time() - self.DELAY_SEC / 2
-        timer1.elapsed_time = self.delay_before() / 2
-        timer2._start_time = time.time() - self.delay_before() / 2
-        timer2.elapsed_time = self.DELAY_SEC / 2
-
-        self.timer._tick()
-
-        timer1._timer.assert_not_called()
-        timer2._timer.assert_not_called()
-
-        # elapsed_time > delay
-        # timer1._start_time = time.time()
+        # elapsed_time >= delay
         timer1.elapsed_time = self.delay_after()
-        # timer2._start_time = time.time() - self.delay_after()
-        # timer2.elapsed_time = 0
-        timer2.elapsed_time = time.time() - self.delay_after()
+        timer2.elapsed_time = self.DELAY_SEC
 
         self.timer._tick()
 
         timer1._timer.assert_called_once()
         timer2._timer.assert_called_once()
+        # (Scheduled again for next repeat)
+        self.assertIn(timer1, self.timer._timers)
+        self.assertIn(timer2, self.timer._timers)
 
-        # elapsed_time >= delay
-        # timer1._start_time = time.time() - self.delay_after() / 3 * 2
-        # timer1.elapsed_time = self.delay_after() / 3
-        # timer2._start_time = time.time() - self.delay_after() / 2
-        # timer2.elapsed_time = self.delay_after() / 2
         timer1.elapsed_time = self.delay_after()
         timer2.elapsed_time = self.delay_after() * 2
 
@@ -722,9 +804,7 @@ class BaseTestTimer:
 
         timer1.dispose()
         timer2.dispose()
-        self.timer._timers.remove(timer1)
-        self.timer._timers.remove(timer2)
-        self.assertEqual(self.timer._timers, [])
+        self.assertEqual(len(self.timer._timers), 0)
 
     def test_elapsed_time(self):
         self.assertEqual(self.timer.delay_sec, self.DELAY_SEC)
@@ -1250,6 +1330,67 @@ class TestTwistedTimer(TestCase, BaseTestTimer):
         super().setUp()
 
 
+class TestAsyncioTimer(TestCase, BaseTestTimer):
+    timer_class = AsyncioTimer
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        AsyncioTimer.loop = asyncio.new_event_loop()
+        cls.loop_thread = threading.Thread(target=AsyncioTimer.loop.run_forever, name="asyncio-loop", daemon=True)
+        cls.loop_thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        AsyncioTimer.loop.call_soon_threadsafe(AsyncioTimer.loop.stop)
+        cls.loop_thread.join()
+        AsyncioTimer.loop.close()
+        AsyncioTimer.loop = None
+
+        super().tearDownClass()
+
+    def setUp(self):
+        BaseTestTimer.setUp(self)
+        super().setUp()
+
+    def tearDown(self):
+        BaseTestTimer.tearDown(self)
+        super().tearDown()
+
+    def test_start_from_not_loop_thread(self):
+        # (Timer is started in main thread, but ticks in loop's thread)
+        self.timer.repeat_count = 1
+        self.timer.start()
+
+        time.sleep(self.DELAY_SEC + self.RESOLUTION_SEC * 2)
+
+        self.callback.assert_called_once()
+        self.timer_complete_handler.assert_called_once()
+        self.assertFalse(self.timer._is_ticking)
+
+    def test_stop_and_start_ticking_again(self):
+        self.timer.delay_sec = 0
+        self.timer._timer = Mock()
+        self.timer._running = True
+        self.timer._timers.add(self.timer, time.time())
+
+        # (Ticking calls of previous start should not be continued after new start)
+        self.timer._start_ticking()
+        self.timer._stop_ticking()
+        self.timer._start_ticking()
+        time.sleep(self.RESOLUTION_SEC * 5.5)
+
+        # (About 6 ticks for one ticking chain and about 12 for two)
+        self.assertGreater(self.timer._timer.call_count, 0)
+        self.assertLess(self.timer._timer.call_count, 9)
+
+        # Tear down
+        self.timer._timers.remove(self.timer)
+        self.timer._running = False
+        self.timer._stop_ticking()
+
+
 # Slow - comment
 
 class TestThreadedTimerWithBigResolution(TestThreadedTimer):
@@ -1260,3 +1401,8 @@ class TestThreadedTimerWithBigResolution(TestThreadedTimer):
 class TestTwistedTimerWithBigResolution(TestTwistedTimer):
     RESOLUTION_SEC = .1
     DELAY_SEC = 1
+
+
+class TestAsyncioTimerWithBigResolution(TestAsyncioTimer):
+    RESOLUTION_SEC = .1
+    DELAY_SEC = 1
@@ -1,11 +1,13 @@
+import signal
+import threading
 import time
 from unittest import TestCase
 from unittest.mock import Mock, patch, MagicMock, call
 
-from napalm.async import ThreadedTimer, TwistedTimer
+from napalm.async import ThreadedTimer, TwistedTimer, AsyncioTimer
 from napalm.core import SocketApplication, SocketGameApplication, ConfigurableMixIn, ExportableMixIn, BaseModel, \
-    ReloadableModel, ReloadableMultiModel
-from napalm.socket.server import TwistedTCPServer, ServerConfig, AbstractServer
+    ReloadableModel, ReloadableMultiModel, WorkerSupervisor, run_worker
+from napalm.socket.server import TwistedTCPServer, ServerConfig, AbstractServer, AsyncioTCPServer
 
 
 # Application
@@ -67,6 +69,73 @@ class TestSocketApplication(TestCase):
 
         app.server.start.assert_called_once()
 
+    def test_asyncio_timer_uses_server_loop(self):
+        config = ServerConfig("localhost", 12348)
+        app = SocketApplication(config, AsyncioTCPServer)
+        self.addCleanup(setattr, AsyncioTimer, "loop", None)
+
+        self.assertEqual(app.config.timer_class, AsyncioTimer)
+        self.assertIs(AsyncioTimer.loop, app.server.loop)
+
+        # Timer started not from loop's thread ticks in server's loop
+        thread = threading.Thread(target=app.server.start)
+        thread.start()
+        while not app.server.started:
+            time.sleep(.01)
+        callback = Mock()
+        timer = AsyncioTimer(callback, .1, 1)
+        self.addCleanup(timer.dispose)
+        timer.start()
+        time.sleep(.1 + AsyncioTimer.resolution_sec * 2)
+
+        callback.assert_called_once()
+
+        app.server.stop()
+        thread.join()
+        app.server.loop.close()
+
+
+class TestWorkerSupervisor(TestCase):
+    def test_run_worker(self):
+        config = ServerConfig()
+        create_config = Mock(return_value=config)
+        app_class = Mock()
+        prev_handler = signal.getsignal(signal.SIGTERM)
+        self.addCleanup(signal.signal, signal.SIGTERM, prev_handler)
+
+        run_worker(create_config, app_class, MyTCPServer, 2, 3)
+
+        self.assertTrue(config.is_reuse_port)
+        self.assertEqual(config.worker_index, 2)
+        self.assertEqual(config.worker_count, 3)
+        app_class.assert_called_once_with(config, MyTCPServer)
+        app_class.return_value.start.assert_called_once()
+
+        # Stop on SIGTERM
+        signal.getsignal(signal.SIGTERM)(signal.SIGTERM, None)
+        time.sleep(.1)
+
+        app_class.return_value.stop.assert_called_once()
+
+    def test_start_restart_stop(self):
+        # (Workers with MyTCPServer exit immediately and should be restarted)
+        supervisor = WorkerSupervisor(ServerConfig, 2, MyTCPServer, SocketApplication)
+        supervisor.check_interval_sec = .05
+        supervisor.restart_delay_sec = 0
+
+        thread = threading.Thread(target=supervisor.start)
+        thread.start()
+        t = time.time()
+        while supervisor.restart_count < 2 and time.time() - t < 10:
+            time.sleep(.05)
+        supervisor.stop()
+        thread.join()
+
+        self.assertGreaterEqual(supervisor.restart_count, 2)
+        self.assertEqual(len(supervisor.process_list), 2)
+        for process in supervisor.process_list:
+            self.assertFalse(process.is_alive())
+
 
 class TestSocketGameApplication(TestCase):
     def setUp(self):
@@ -220,6 +289,29 @@ class TestExportableMixIn(TestCase):
 
         self.assertEqual(self.custom_exportable._public_property_names, ["param_x", "param_y"])
 
+    def test_version(self):
+        version = self.exportable.version
+
+        self.exportable.param1 = 5
+
+        self.assertNotEqual(self.exportable.version, version)
+        version = self.exportable.version
+
+        # (Private properties don't change version)
+        self.exportable._private_param = 5
+
+        self.assertEqual(self.exportable.version, version)
+
+        self.exportable.import_public_data([6, 7])
+
+        self.assertNotEqual(self.exportable.version, version)
+        version = self.exportable.version
+
+        # (Changing in place)
+        self.exportable.mark_changed()
+
+        self.assertNotEqual(self.exportable.version, version)
+
     def test_export_data(self):
         self.assertEqual(self.exportable.export_data(), [1, 2])
 
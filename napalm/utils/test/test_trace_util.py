@@ -0,0 +1,93 @@
+import io
+from unittest import TestCase
+
+from napalm.utils import trace_util
+from napalm.utils.trace_util import RingBufferWriter, Tracer, get_tracer, setup_tracing, stop_tracing
+
+
+class TestRingBufferWriter(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.stream = io.StringIO()
+        self.writer = RingBufferWriter(self.stream, 3)
+
+    def tearDown(self):
+        self.writer.dispose()
+        super().tearDown()
+
+    def test_put(self):
+        self.writer.put("CH1", "message %s %s", (1, "a"))
+        self.writer.put("CH2", "message", ())
+        self.writer.put("CH2", "wrong %s %s", (1,))
+        self.writer.dispose()
+
+        self.assertEqual(self.stream.getvalue().splitlines(), [
+            "TRACE:CH1:message 1 a", "TRACE:CH2:message",
+            "TRACE:CH2:wrong %s %s (Formatting error: not enough arguments for format string args: (1,))"])
+
+        # (Not written after disposed)
+        self.writer.put("CH1", "message", ())
+        self.writer.flush()
+        self.assertEqual(len(self.stream.getvalue().splitlines()), 3)
+
+    def test_put_over_max_count(self):
+        # (Without writer thread)
+        self.writer._thread = "thread"
+        for i in range(5):
+            self.writer.put("CH1", "message %s", (i,))
+        self.writer.flush()
+        self.writer._thread = None
+
+        # (Oldest dropped)
+        self.assertEqual(self.stream.getvalue().splitlines(),
+                         ["TRACE:CH1:message 2", "TRACE:CH1:message 3", "TRACE:CH1:message 4"])
+        self.assertEqual(self.writer.dropped_count, 2)
+
+
+class TestTracing(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.stream = io.StringIO()
+
+    def tearDown(self):
+        stop_tracing()
+        trace_util._tracer_by_channel.pop("TEST1", None)
+        trace_util._tracer_by_channel.pop("TEST2", None)
+        super().tearDown()
+
+    def test_get_tracer(self):
+        tracer = get_tracer("TEST1")
+
+        self.assertIsInstance(tracer, Tracer)
+        self.assertIs(get_tracer("TEST1"), tracer)
+        self.assertFalse(tracer.is_enabled)
+
+    def test_setup_tracing(self):
+        tracer1 = get_tracer("TEST1")
+        tracer1.trace("disabled")
+
+        setup_tracing(["TEST1", "TEST2"], 2, self.stream)
+        tracer2 = get_tracer("TEST2")
+
+        self.assertTrue(tracer1.is_enabled)
+        self.assertTrue(tracer2.is_enabled)
+        for i in range(5):
+            if tracer1.is_sampled():
+                tracer1.trace("sampled %s", i)
+        tracer2.trace("message")
+        stop_tracing()
+
+        self.assertFalse(tracer1.is_enabled)
+        self.assertFalse(tracer2.is_enabled)
+        tracer1.trace("disabled")
+        self.assertEqual(self.stream.getvalue().splitlines(),
+                         ["TRACE:TEST1:sampled 1", "TRACE:TEST1:sampled 3", "TRACE:TEST2:message"])
+
+    def test_setup_tracing_for_channels(self):
+        tracer1 = get_tracer("TEST1")
+        tracer2 = get_tracer("TEST2")
+
+        setup_tracing(["TEST2"], stream=self.stream)
+
+        self.assertFalse(tracer1.is_enabled)
+        self.assertTrue(tracer2.is_enabled)
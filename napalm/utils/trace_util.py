@@ -0,0 +1,179 @@
+"""
+Tracing of hot paths (each received command, each broadcast, etc.) cheap enough
+to be left in code. Disabled tracing costs one attribute check, if call is guarded:
+
+    tracer = get_tracer("PROTOCOL")
+    ...
+    if tracer.is_enabled and tracer.is_sampled():
+        tracer.trace("parsed command: %s", command_params)
+
+(Args are not evaluated at all while disabled or not sampled.) Enabled tracing doesn't write
+to stream in calling thread: messages are formatted and written by writer thread
+(see RingBufferWriter). Enable it with setup_tracing().
+"""
+
+import collections
+import sys
+import threading
+
+# (Settings for tracers created after setup_tracing(), see get_tracer())
+_channels = None
+_is_enabled = False
+_sample_every = 1
+_writer = None
+_tracer_by_channel = {}
+_lock = threading.Lock()
+
+
+class RingBufferWriter:
+    """
+    Messages are buffered and written to stream in background thread, so that
+    traced code doesn't wait for stream (stdout could be much slower than server).
+    If stream can't keep up, the oldest not written messages are dropped.
+    """
+
+    def __init__(self, stream=None, max_count=10000):
+        self.stream = stream or sys.stdout
+        self.dropped_count = 0
+
+        self._buffer = collections.deque(maxlen=max_count)
+        self._condition = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._thread = None
+        self._is_disposed = False
+
+    def dispose(self):
+        with self._condition:
+            self._is_disposed = True
+            self._condition.notify()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+        # (Write the rest)
+        self.flush()
+
+    def put(self, channel, message, args):
+        """
+        Args are formatted later in writer thread, so they should not be changed after.
+        """
+        with self._condition:
+            if self._is_disposed:
+                return
+            if len(self._buffer) == self._buffer.maxlen:
+                self.dropped_count += 1
+            self._buffer.append((channel, message, args))
+            if not self._thread:
+                self._thread = threading.Thread(target=self._run, name="TraceWriter", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def flush(self):
+        """
+        Write all buffered messages in calling thread.
+        """
+        with self._write_lock:
+            with self._condition:
+                records = list(self._buffer)
+                self._buffer.clear()
+            if records:
+                self._write(records)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._buffer and not self._is_disposed:
+                    self._condition.wait()
+                if self._is_disposed:
+                    return
+            self.flush()
+
+    def _write(self, records):
+        lines = []
+        for channel, message, args in records:
+            try:
+                lines.append("TRACE:%s:%s\n" % (channel, message % args if args else message))
+            except Exception as error:
+                lines.append("TRACE:%s:%s (Formatting error: %s args: %r)\n" % (channel, message, error, args))
+        try:
+            self.stream.write("".join(lines))
+            self.stream.flush()
+        except Exception:
+            # (Tracing should never break traced code)
+            pass
+
+
+class Tracer:
+    def __init__(self, channel, is_enabled=False, sample_every=1, writer=None):
+        self.channel = channel
+        # (Check it before calling trace methods to skip evaluating of args)
+        self.is_enabled = is_enabled
+        self.sample_every = sample_every
+        self.writer = writer
+
+        self._sample_counter = 0
+
+    def trace(self, message, *args):
+        writer = self.writer
+        if self.is_enabled and writer:
+            writer.put(self.channel, message, args)
+
+    def is_sampled(self):
+        """
+        :return: True for 1 of sample_every calls (to trace messages on each command)
+        """
+        self._sample_counter += 1
+        if self._sample_counter >= self.sample_every:
+            self._sample_counter = 0
+            return True
+        return False
+
+
+def get_tracer(channel):
+    with _lock:
+        tracer = _tracer_by_channel.get(channel)
+        if not tracer:
+            tracer = _tracer_by_channel[channel] = Tracer(channel)
+            _apply_settings(tracer)
+        return tracer
+
+
+def setup_tracing(channels=None, sample_every=1, stream=None, max_count=10000):
+    """
+    Enable tracing.
+    :param channels: names of tracers to enable, all if None
+    :param sample_every: for is_sampled(), e.g. 100 - only 1 of 100 messages is written
+    :param stream: stdout by default
+    :param max_count: size of ring buffer of not written messages
+    :return:
+    """
+    global _channels, _is_enabled, _sample_every, _writer
+    with _lock:
+        if _writer:
+            _writer.dispose()
+        _channels = set(channels) if channels is not None else None
+        _is_enabled = True
+        _sample_every = sample_every
+        _writer = RingBufferWriter(stream, max_count)
+        for tracer in _tracer_by_channel.values():
+            _apply_settings(tracer)
+
+
+def stop_tracing():
+    """
+    Disable tracing writing all messages left.
+    """
+    global _is_enabled, _writer
+    with _lock:
+        _is_enabled = False
+        writer = _writer
+        _writer = None
+        for tracer in _tracer_by_channel.values():
+            _apply_settings(tracer)
+    if writer:
+        writer.dispose()
+
+
+def _apply_settings(tracer):
+    tracer.is_enabled = _is_enabled and (_channels is None or tracer.channel in _channels)
+    tracer.sample_every = _sample_every
+    tracer.writer = _writer